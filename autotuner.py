@@ -0,0 +1,143 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Callable, Deque, Optional
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class ConcurrencyLimiter:
+    """Async context manager that caps concurrent work at an adjustable limit"""
+
+    def __init__(self, limit: int) -> None:
+        """
+        Create a limiter.
+
+        Args:
+            limit: Maximum number of holders at a time
+        """
+        self.limit = limit
+        self.active = 0
+        self.peak = 0  # Most holders at once since the tuner last looked
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    async def __aenter__(self) -> 'ConcurrencyLimiter':
+        while self.active >= self.limit:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            await waiter
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.active -= 1
+        self._wake()
+
+    def set_limit(self, limit: int) -> None:
+        """Change the limit, letting waiters in if it was raised."""
+        self.limit = limit
+        self._wake()
+
+    def _wake(self) -> None:
+        """Let every waiter re-check the limit"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+
+
+class ConcurrencyTuner:
+    """
+    Hill-climbs a worker count toward the knee of its throughput curve.
+
+    Throughput is measured over fixed intervals while the workers are
+    saturated. The count doubles while that improves throughput by at least
+    the configured gain. If the first step up did not help, it halves for as
+    long as throughput holds. It then settles on the smallest count that gave
+    the best throughput. Tuning stops after a fixed duration.
+    """
+
+    def __init__(self, name: str, initial: int, maximum: int, counter: Callable[[], int]) -> None:
+        """
+        Create a tuner.
+
+        Args:
+            name: Name of the tuned workers, for logging
+            initial: Starting worker count
+            maximum: Largest worker count to try
+            counter: Returns the cumulative amount of work done, e.g. bytes read
+        """
+        self.name = name
+        self.level = initial
+        self.maximum = maximum
+        self.converged = not config.AUTOTUNE
+        self._initial = initial
+        self._counter = counter
+        self._limiter: Optional[ConcurrencyLimiter] = None
+        self._direction = 1
+        self._best_level = initial
+        self._best_rate: Optional[float] = None
+        self._started: Optional[float] = None
+        self._last_time = 0.0
+        self._last_count = 0
+
+    def limiter(self) -> ConcurrencyLimiter:
+        """Create a limiter at the current level for the running event loop, and tune it from now on."""
+        self._limiter = ConcurrencyLimiter(self.level)
+        self._last_time, self._last_count = time.monotonic(), self._counter()
+        return self._limiter
+
+    def _set_level(self, level: int) -> None:
+        """Apply a new worker count"""
+        self.level = level
+        if self._limiter is not None:
+            self._limiter.set_limit(level)
+
+    def _settle(self) -> None:
+        """Keep the best worker count found"""
+        self._set_level(self._best_level)
+        self.converged = True
+        rate = f"{self._best_rate:.1f}/s" if self._best_rate is not None else "unmeasured"
+        logger.info(f"Autotuned {self.name} workers to {self.level} ({rate})")
+
+    def step(self) -> None:
+        """Measure the last interval and move the worker count if still tuning."""
+        now, count = time.monotonic(), self._counter()
+        rate = (count - self._last_count) / max(now - self._last_time, 1e-9)
+        saturated = self._limiter is not None and self._limiter.peak >= self.level
+        self._last_time, self._last_count = now, count
+        if self._limiter is not None:
+            self._limiter.peak = self._limiter.active
+        # Intervals limited by a lack of work say nothing about the worker count
+        if self.converged or not saturated:
+            return
+
+        self._started = self._started or now
+        if now - self._started > config.AUTOTUNE_DURATION:
+            self._settle()
+            return
+
+        if self._best_rate is None or self._direction > 0:
+            improved = self._best_rate is None or rate > self._best_rate * (1 + config.AUTOTUNE_MIN_GAIN)
+        else:
+            # Going down, fewer workers win unless they cost throughput
+            improved = rate >= self._best_rate * (1 - config.AUTOTUNE_MIN_GAIN)
+
+        if improved:
+            self._best_rate, self._best_level = max(rate, self._best_rate or 0.0), self.level
+            level = self.level * 2 if self._direction > 0 else self.level // 2
+        elif self._direction > 0 and self._best_level == self._initial:
+            # More workers did not help from the start, so try fewer
+            self._direction = -1
+            level = self._best_level // 2
+        else:
+            level = 0
+
+        if 1 <= level <= self.maximum:
+            self._set_level(level)
+        else:
+            self._settle()
@@ -0,0 +1,187 @@
+import os
+import json
+import shutil
+import pickle
+import struct
+from array import array
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+import config
+from results_store import MATCH_CONTENT, MATCH_KINDS
+
+# Confirmed group record: file size, digest byte length, member count and match kind
+# index, followed by the digest and the member file ids
+GROUP_HEADER = struct.Struct('<QHIB')
+
+
+class ScanCheckpoint:
+    """
+    Persists the state of a running scan so it can be resumed after a restart.
+
+    Walk state (path store, frontier and size groups) and hashing progress are
+    pickled separately, so the large walk state is written only while the tree
+    is being walked. Confirmed groups are appended to a log whose committed
+    length is recorded with every checkpoint.
+    """
+
+    SETTINGS_FILE = 'settings.pickle'
+    WALK_FILE = 'walk.pickle'
+    HASH_FILE = 'hash.pickle'
+    GROUPS_FILE = 'groups.bin'
+    INFO_FILE = 'info.json'
+    RUNS_DIR = 'runs'
+
+    def __init__(self, directory: str = config.CHECKPOINT_DIR) -> None:
+        """
+        Open the checkpoint stored in a directory.
+
+        Args:
+            directory: Directory holding the checkpoint files
+        """
+        self.directory = directory
+        self._groups_log: Optional[BinaryIO] = None
+
+    @property
+    def runs_dir(self) -> str:
+        """Directory for spilled size group runs that belong to the checkpoint"""
+        return os.path.join(self.directory, self.RUNS_DIR)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def exists(self) -> bool:
+        """Whether a resumable checkpoint is present."""
+        return os.path.exists(self._path(self.WALK_FILE))
+
+    def info(self) -> Optional[Dict[str, Any]]:
+        """Return a short description of the checkpoint for display."""
+        try:
+            with open(self._path(self.INFO_FILE), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def start(self, settings: Any) -> None:
+        """
+        Replace any existing checkpoint with an empty one for a new scan.
+
+        Args:
+            settings: Settings the scan was started with
+        """
+        self.remove()
+        os.makedirs(self.runs_dir, exist_ok=True)
+        self._write_pickle(self.SETTINGS_FILE, settings)
+
+    def load_settings(self) -> Any:
+        """
+        Load the settings of the checkpointed scan.
+
+        Raises:
+            OSError: If the checkpoint cannot be read
+        """
+        with open(self._path(self.SETTINGS_FILE), 'rb') as f:
+            return pickle.load(f)
+
+    def _write_pickle(self, name: str, state: Any) -> None:
+        """Atomically replace a pickled state file"""
+        temp_path = self._path(name + '.tmp')
+        with open(temp_path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self._path(name))
+
+    def _write_info(self, info: Dict[str, Any]) -> None:
+        """Write the display summary of the checkpoint"""
+        info = dict(info, saved_at=datetime.now().isoformat(timespec='seconds'))
+        with open(self._path(self.INFO_FILE), 'w', encoding='utf-8') as f:
+            json.dump(info, f)
+
+    def save_walk(self, state: Dict[str, Any], info: Dict[str, Any]) -> None:
+        """
+        Save walk state.
+
+        Args:
+            state: Walk state to pickle
+            info: Short JSON-serialisable description of the scan
+        """
+        self._write_pickle(self.WALK_FILE, state)
+        self._write_info(info)
+
+    def save_hashing(self, state: Dict[str, Any], info: Dict[str, Any]) -> None:
+        """
+        Save hashing progress, committing all groups appended so far.
+
+        Args:
+            state: Hashing progress to pickle
+            info: Short JSON-serialisable description of the scan
+        """
+        groups_log_size = 0
+        if self._groups_log is not None:
+            self._groups_log.flush()
+            os.fsync(self._groups_log.fileno())
+            groups_log_size = self._groups_log.tell()
+        elif os.path.exists(self._path(self.GROUPS_FILE)):
+            # A resumed scan keeps the groups committed before it, even if it hasn't appended any yet
+            groups_log_size = os.path.getsize(self._path(self.GROUPS_FILE))
+        self._write_pickle(self.HASH_FILE, dict(state, groups_log_size=groups_log_size))
+        self._write_info(info)
+
+    def load(self) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+        """
+        Load the saved state.
+
+        Returns:
+            Tuple of the walk state and the hashing progress, or None if
+            hashing had not started
+
+        Raises:
+            OSError: If the checkpoint files cannot be read
+        """
+        with open(self._path(self.WALK_FILE), 'rb') as f:
+            walk_state = pickle.load(f)
+
+        hash_state = None
+        if os.path.exists(self._path(self.HASH_FILE)):
+            with open(self._path(self.HASH_FILE), 'rb') as f:
+                hash_state = pickle.load(f)
+
+        # Drop groups appended after the last committed checkpoint
+        with open(self._path(self.GROUPS_FILE), 'ab') as log:
+            log.truncate(hash_state['groups_log_size'] if hash_state else 0)
+        return walk_state, hash_state
+
+    def append_group(self, size: int, digest: str, file_ids: List[int], match: str = MATCH_CONTENT) -> None:
+        """Append a confirmed group to the groups log."""
+        if self._groups_log is None:
+            self._groups_log = open(self._path(self.GROUPS_FILE), 'ab')
+        encoded = digest.encode('ascii')
+        self._groups_log.write(GROUP_HEADER.pack(size, len(encoded), len(file_ids), MATCH_KINDS.index(match)))
+        self._groups_log.write(encoded)
+        self._groups_log.write(array('Q', file_ids).tobytes())
+
+    def iter_groups(self) -> Iterator[Tuple[int, str, List[int], str]]:
+        """Yield (size, digest, file ids, match kind) for every committed group."""
+        try:
+            log = open(self._path(self.GROUPS_FILE), 'rb')
+        except OSError:
+            return
+        with log:
+            while header := log.read(GROUP_HEADER.size):
+                size, digest_length, count, match = GROUP_HEADER.unpack(header)
+                digest = log.read(digest_length).decode('ascii')
+                file_ids = array('Q')
+                file_ids.frombytes(log.read(count * file_ids.itemsize))
+                yield size, digest, file_ids.tolist(), MATCH_KINDS[match]
+
+    def close(self) -> None:
+        """Close the groups log."""
+        if self._groups_log is not None:
+            self._groups_log.close()
+            self._groups_log = None
+
+    def remove(self) -> None:
+        """Delete the checkpoint once the scan no longer needs it."""
+        self.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
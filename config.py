@@ -20,10 +20,108 @@ LOG_DIR_NAME = "Logs"
 # File Paths and Directories
 LOG_DIR = os.path.join(APPDATA_DIR, LOG_DIR_NAME)
 LOG_FILE = os.path.join(LOG_DIR, 'duplicate_cleaner.log')
+SCAN_METRICS_FILE = os.path.join(LOG_DIR, 'scan_metrics.jsonl')  # One JSON record per finished scan
+SCAN_METRICS_MAX_RECORDS = 100
 
 # Logging Settings
 LOG_MAX_BYTES = 10 * 1024 * 1024  # 10MB
 LOG_BACKUP_COUNT = 3
+LOG_QUEUE_SIZE = 10000  # Records buffered for the log writer thread before new ones are dropped
+LOG_SKIP_SUMMARY_MAX_DIRS = 1000  # Directories with skipped files collected before their summaries are logged
+DELETION_MESSAGES_MAX = 1000  # Most recent deletion log messages kept in memory
+
+# Results Storage Settings
+RESULTS_DIR_NAME = "Results"
+RESULTS_DIR = os.path.join(APPDATA_DIR, RESULTS_DIR_NAME)
+RESULTS_ROW_GROUP_SIZE = 10000  # Rows buffered before a Parquet row group is written
+RESULTS_PAGE_SIZE = 50  # Duplicate groups shown per page in the RESULTS tab
+DIRECTORY_GROUPS_SHOWN = 50  # Most reclaimable duplicate folder groups shown in the RESULTS tab
+RESULTS_MAX_FILES = 20  # Saved result files kept before the oldest are removed
+LIVE_RESULTS_LIMIT = 1000  # Most reclaimable groups listed in the RESULTS tab while a scan runs
+SCAN_POLL_INTERVAL = 1.0  # Seconds between UI refreshes while a scan runs
+PROGRESS_UPDATE_INTERVAL = 0.5  # Minimum seconds between scan progress updates
+PROGRESS_RATE_WINDOW = 10.0  # Seconds of history the throughput and ETA are measured over
+
+# Fast Mode Settings (files above MAX_FILE_SIZE are hashed from samples)
+SAMPLE_COUNT = 16  # Evenly spaced blocks hashed per large file
+SAMPLE_BLOCK_SIZE = 64 * 1024  # 64KB per sample block
+
+# Residency Settings (placeholder files are grouped by metadata and never read)
+PLACEHOLDER_FILE_ATTRIBUTES = (
+    0x00001000 |  # FILE_ATTRIBUTE_OFFLINE
+    0x00040000 |  # FILE_ATTRIBUTE_RECALL_ON_OPEN
+    0x00400000    # FILE_ATTRIBUTE_RECALL_ON_DATA_ACCESS
+)
+PLACEHOLDER_FILE_FLAGS = 0x40000000  # SF_DATALESS (macOS)
+PLACEHOLDER_MIN_SIZE = 64 * 1024  # Smaller files may legitimately keep their data inline
+PLACEHOLDER_MAX_ALLOCATED_RATIO = 0.01  # Allocated bytes below 1% of the data size
+
+# Scan Pipeline Settings
+SCAN_QUEUE_SIZE = 64  # Items buffered between scan pipeline stages
+SCAN_WALK_WORKERS = 8  # Directories listed concurrently; listing is latency-bound on network shares
+SCAN_STAT_WORKERS = 4  # Directory batches stat'ed concurrently
+SCAN_HASH_WORKERS = 4  # Files hashed concurrently
+PARTIAL_HASH_SIZE = 4096  # Leading bytes hashed to rule out most same-size files
+SMALL_FILE_SIZE = 64 * 1024  # Files up to this size are read whole in a single call instead of hashed in two passes
+SMALL_FILE_BATCH_SIZE = 64  # Small files read per worker round-trip
+EARLY_HASH_MAX_FILES = 100000  # Files hashed during the walk, before their size group is final
+
+# Autotuning Settings (SCAN_WALK_WORKERS, SCAN_STAT_WORKERS and SCAN_HASH_WORKERS are the starting points)
+AUTOTUNE = True  # Adjust worker counts to the measured throughput of each scan
+AUTOTUNE_INTERVAL = 1.0  # Seconds of throughput measured per step
+AUTOTUNE_DURATION = 30.0  # Seconds of saturated work after which worker counts are fixed
+AUTOTUNE_MIN_GAIN = 0.1  # Throughput gain (10%) needed to keep adding workers
+SCAN_MAX_WALK_WORKERS = 64
+SCAN_MAX_STAT_WORKERS = 32
+SCAN_MAX_HASH_WORKERS = 32
+
+# Size Grouping Settings
+SIZE_GROUPING_MEMORY_BUDGET = 512 * 1024 * 1024  # 512MB of (size, path) records before spilling to disk, None to disable
+SPILL_DIR = None  # Directory for temporary run files, None for the system temp directory
+SPILL_MAX_MERGE_RUNS = 64  # Run files merged at once during spill-to-disk grouping
+
+# Checkpoint Settings
+CHECKPOINT_DIR_NAME = "Checkpoints"
+CHECKPOINT_DIR = os.path.join(APPDATA_DIR, CHECKPOINT_DIR_NAME)
+CHECKPOINT_INTERVAL = 60  # Seconds between scan checkpoints, 0 to disable
+
+# Scan Estimate Settings (random walks over a sample of the tree)
+ESTIMATE_MAX_DIRECTORIES = 2000  # Most directories listed for an estimate
+ESTIMATE_MAX_WALKS = 20000  # Most root-to-leaf walks averaged; walks through listed directories are cheap
+ESTIMATE_MAX_SECONDS = 10.0  # Seconds after which no new walk is started
+ESTIMATE_STATS_PER_DIRECTORY = 20  # Most files stat'ed in each listed directory
+ESTIMATE_MIN_BYTES_READ = 16 * 1024 * 1024  # Bytes a past scan must have read for its read rate to be used
+
+# Content Catalog Settings
+CATALOG_FILE = os.path.join(APPDATA_DIR, 'content_catalog.sqlite3')  # Files by size and digest, for lookups of new files
+
+# Scan Service Settings (one local service runs scans for every browser session)
+SCAN_SERVICE_HOST = "127.0.0.1"
+SCAN_SERVICE_FILE = os.path.join(APPDATA_DIR, 'scan_service.json')  # Port and access token of the running service
+SCAN_SERVICE_LOG_FILE = os.path.join(LOG_DIR, 'scan_service.log')
+SCAN_SERVICE_LOCK_FILE = os.path.join(APPDATA_DIR, 'scan_service.lock')  # Held by the client starting the service
+SCAN_SERVICE_RESULTS_TTL = 15 * 60  # Seconds finished results are reused for the same root and settings
+SCAN_SERVICE_IDLE_TIMEOUT = 60 * 60  # Seconds without requests or scans before the service exits
+SCAN_SERVICE_START_TIMEOUT = 10.0  # Seconds to wait for a newly started service
+SCAN_SERVICE_REQUEST_TIMEOUT = 10.0  # Seconds before a request to the service fails
+
+# I/O Throttling Settings
+IO_MAX_BYTES_PER_SECOND = 0  # Read rate cap for scans, 0 for unlimited
+IO_MAX_FILES_PER_SECOND = 0  # Files opened or deleted per second, 0 for unlimited
+IO_LOW_PRIORITY = False  # Run scans at idle/background I/O priority
+IO_NICE_INCREMENT = 10  # Niceness added to the scan thread when running at low priority
+IO_ADAPTIVE_BACKOFF = False  # Slow down reads when their latency rises above the baseline
+IO_LATENCY_BACKOFF_FACTOR = 3.0  # Latency multiple over the baseline that triggers a backoff
+IO_LATENCY_SAMPLE_BYTES = 4 * 1024 * 1024  # Bytes read by a thread per latency sample
+IO_LATENCY_WINDOW = 64  # Latency samples whose median is the baseline
+IO_LATENCY_RECENT = 4  # Latest latency samples whose median is compared with the baseline
+IO_MAX_SLOWDOWN = 16.0  # Largest factor reads are slowed down by during a backoff
+
+# Page Cache Settings (Linux and other platforms with posix_fadvise)
+IO_CACHE_HINTS = True  # Hint sequential reads and read-ahead, and drop scanned files from the page cache
+IO_READAHEAD_BYTES = 8 * 1024 * 1024  # Leading bytes of the next file read ahead while the current one is hashed
+IO_DIRECT_MIN_SIZE = 0  # Files at least this large are read with O_DIRECT, bypassing the page cache, 0 to disable
+IO_DIRECT_CHUNK_SIZE = 1024 * 1024  # Bytes per O_DIRECT read
 
 # Cloud Storage Settings
 CLOUD_PATHS: Dict[str, List[str]] = {
@@ -77,7 +175,11 @@ BUTTON_KEYS: Dict[str, str] = {
     'DELETE_SELECTED': 'delete_selected_btn',
     'DELETE_SELECTED_DISABLED': 'delete_selected_disabled_btn',
     'SELECT_ALL': 'select_all_btn',
-    'SELECT_NONE': 'select_none_btn'
+    'SELECT_NONE': 'select_none_btn',
+    'OPEN_RESULTS': 'open_results_btn',
+    'EXPORT_RESULTS': 'export_results_btn',
+    'CANCEL_SCAN': 'cancel_scan_btn',
+    'RESUME_SCAN': 'resume_scan_btn'
 }
 
 # Sensitive Directories
@@ -264,5 +366,10 @@ def ensure_directories():
     if not logs_dir_exists:
         Path(LOG_DIR).mkdir(parents=True, exist_ok=True)
 
+    # Handle results directory
+    results_dir_exists = any(d.lower() == RESULTS_DIR_NAME.lower() for d in existing_dirs)
+    if not results_dir_exists:
+        Path(RESULTS_DIR).mkdir(parents=True, exist_ok=True)
+
 # Create necessary directories
 ensure_directories() 
\ No newline at end of file
@@ -0,0 +1,293 @@
+import os
+import sys
+import sqlite3
+import logging
+import argparse
+from typing import Callable, Iterable, List, Optional, Tuple
+
+import config
+from file_operations import FileHash, FileOperationError, FileOperations, FilePath
+from io_governor import IOGovernor
+from results_store import MATCH_CONTENT, ResultsReader
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER,  -- Modification time the hashes were computed at
+    partial TEXT,  -- Hash of the first PARTIAL_HASH_SIZE bytes
+    digest TEXT  -- Hash of the full content
+);
+CREATE INDEX IF NOT EXISTS files_by_size ON files (size);
+"""
+
+
+class ContentCatalog:
+    """
+    Persistent index of stored files by size and content digest.
+
+    Files are catalogued by size, with their partial and full digests filled
+    in as they become known. A lookup finds same-size candidates through the
+    size index without touching the disk, and only reads the new file, and
+    candidates whose digests aren't known yet, as far as it takes to rule
+    them out: a file whose size is new is never opened, and one whose first
+    bytes differ from every candidate is never read in full. Cached digests
+    are discarded when a file's size or modification time has changed.
+    """
+
+    def __init__(self, path: str = config.CATALOG_FILE) -> None:
+        """
+        Open the catalog, creating it if needed.
+
+        Args:
+            path: SQLite database file
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.executescript(SCHEMA)
+
+    def close(self) -> None:
+        """Close the database."""
+        self._db.close()
+
+    def __enter__(self) -> 'ContentCatalog':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    @property
+    def num_files(self) -> int:
+        """Number of catalogued files"""
+        return self._db.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    @staticmethod
+    def _key(path: FilePath) -> str:
+        """Path as stored in the catalog"""
+        return os.path.abspath(path)
+
+    def replace_tree(self, root: FilePath,
+                     files: Iterable[Tuple[str, int, Optional[int], Optional[FileHash], Optional[FileHash]]]) -> int:
+        """
+        Replace everything catalogued under a directory with the files of a completed scan.
+
+        Args:
+            root: Scanned directory
+            files: (path, size, modification time, partial digest, full digest) of every
+                file under it; the digests are None where unknown, and the modification
+                time is the one the file had when it was hashed
+
+        Returns:
+            int: Number of files catalogued
+        """
+        root = self._key(root)
+        prefix = root.rstrip(os.sep) + os.sep
+        # Paths under the root sort between the separator and the next character
+        prefix_end = prefix[:-1] + chr(ord(os.sep) + 1)
+        count = 0
+        with self._db:
+            self._db.execute("DELETE FROM files WHERE path = ? OR (path >= ? AND path < ?)",
+                             (root, prefix, prefix_end))
+            for path, size, mtime_ns, partial, digest in files:
+                self._db.execute("INSERT OR REPLACE INTO files (path, size, mtime_ns, partial, digest) "
+                                 "VALUES (?, ?, ?, ?, ?)", (self._key(path), size, mtime_ns, partial, digest))
+                count += 1
+        logger.info(f"Catalogued {count} files under {root}")
+        return count
+
+    def import_results(self, results: ResultsReader) -> int:
+        """
+        Catalog the files of confirmed duplicate groups from a results file.
+
+        Args:
+            results: Results of an earlier scan
+
+        Returns:
+            int: Number of files catalogued
+        """
+        count = 0
+        with self._db:
+            for group in results.iter_groups():
+                if group.match != MATCH_CONTENT:
+                    continue
+                for path in group.paths:
+                    try:
+                        stats = os.stat(path)
+                    except OSError:
+                        continue
+                    if stats.st_size != group.size:
+                        continue
+                    self._db.execute("INSERT OR REPLACE INTO files (path, size, mtime_ns, digest) VALUES (?, ?, ?, ?)",
+                                     (self._key(path), group.size, stats.st_mtime_ns, group.digest))
+                    count += 1
+        return count
+
+    def add(self, path: FilePath) -> None:
+        """
+        Catalog a single file, e.g. one an ingest pipeline has just accepted.
+
+        Args:
+            path: Path of the file
+
+        Raises:
+            FileOperationError: If the file can't be stat'ed
+        """
+        try:
+            size = os.stat(path).st_size
+        except OSError as e:
+            raise FileOperationError(f"Error cataloguing file: {str(e)}")
+        with self._db:
+            self._db.execute("INSERT OR REPLACE INTO files (path, size) VALUES (?, ?)", (self._key(path), size))
+
+    def _current_mtime(self, path: str, size: int) -> Optional[int]:
+        """Return a candidate's modification time, or None if it is gone or no longer the size looked up"""
+        try:
+            stats = os.stat(path)
+        except OSError:
+            self._forget(path)
+            return None
+        if stats.st_size != size:
+            with self._db:
+                self._db.execute("UPDATE files SET size = ?, mtime_ns = NULL, partial = NULL, digest = NULL "
+                                 "WHERE path = ?", (stats.st_size, path))
+            return None
+        return stats.st_mtime_ns
+
+    def _hash_candidate(self, path: str, column: str, compute: Callable[[str], FileHash],
+                        mtime_ns: int, stored_mtime_ns: Optional[int]) -> Optional[FileHash]:
+        """
+        Compute and store a candidate's digest for the modification time it had before
+        it was read, or return None if it can't be read
+        """
+        try:
+            value = compute(path)
+        except FileOperationError as e:
+            logger.warning(f"Could not hash catalogued file: {str(e)}")
+            return None
+        with self._db:
+            if stored_mtime_ns != mtime_ns:
+                # Digests of an older version are no longer valid
+                self._db.execute("UPDATE files SET partial = NULL, digest = NULL WHERE path = ?", (path,))
+            self._db.execute(f"UPDATE files SET {column} = ?, mtime_ns = ? WHERE path = ?", (value, mtime_ns, path))
+        return value
+
+    def _forget(self, path: str) -> None:
+        """Drop a file that no longer exists"""
+        with self._db:
+            self._db.execute("DELETE FROM files WHERE path = ?", (path,))
+
+    def find(self, path: FilePath, governor: Optional[IOGovernor] = None) -> List[str]:
+        """
+        Find catalogued files with the same content as a file.
+
+        Args:
+            path: File to look up; it may or may not be catalogued itself
+            governor: Optional I/O governor that paces the reads
+
+        Returns:
+            List[str]: Paths of catalogued files with identical content, empty if it is new
+
+        Raises:
+            FileOperationError: If the file can't be read
+        """
+        key = self._key(path)
+        try:
+            size = os.stat(path).st_size
+        except OSError as e:
+            raise FileOperationError(f"Error looking up file: {str(e)}")
+        if size == 0:
+            return []
+
+        candidates = [
+            row for row in self._db.execute(
+                "SELECT path, mtime_ns, partial, digest FROM files WHERE size = ? AND path != ?", (size, key)
+            )
+        ]
+        if not candidates:
+            return []
+
+        def partial_hash(file_path: str) -> FileHash:
+            return FileOperations.compute_partial_hash(file_path, governor=governor)
+
+        def full_hash(file_path: str) -> FileHash:
+            return FileOperations.compute_file_hash(file_path, config.CHUNK_SIZE, governor=governor)
+
+        partial = partial_hash(path)
+        # The partial hash covers small files whole, so it is also their full digest
+        whole = size <= config.PARTIAL_HASH_SIZE
+        digest = partial if whole else None
+        matching = []
+        for candidate, mtime_ns, candidate_partial, candidate_digest in candidates:
+            current_mtime = self._current_mtime(candidate, size)
+            if current_mtime is None:
+                continue
+            if current_mtime != mtime_ns:
+                candidate_partial = candidate_digest = None
+            if whole:
+                candidate_digest = candidate_digest or candidate_partial
+            # Stored digests rule candidates in or out without reading them
+            if candidate_partial is not None and candidate_partial != partial:
+                continue
+            if candidate_digest is None:
+                if candidate_partial is None:
+                    candidate_partial = self._hash_candidate(candidate, 'partial', partial_hash,
+                                                             current_mtime, mtime_ns)
+                    mtime_ns = current_mtime
+                    if candidate_partial != partial:
+                        continue
+                candidate_digest = candidate_partial if whole else self._hash_candidate(
+                    candidate, 'digest', full_hash, current_mtime, mtime_ns)
+                if candidate_digest is None:
+                    continue
+            if digest is None:
+                digest = full_hash(path)
+            if candidate_digest == digest:
+                matching.append(candidate)
+        return matching
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Command line entry point.
+
+    Returns:
+        int: Exit status; for `lookup`, 1 if any file is already stored
+    """
+    parser = argparse.ArgumentParser(description="Check files against the content catalog of scanned folders.")
+    parser.add_argument('--catalog', default=config.CATALOG_FILE, help="Catalog database file")
+    commands = parser.add_subparsers(dest='command', required=True)
+    lookup = commands.add_parser('lookup', help="Report files whose content is already catalogued")
+    lookup.add_argument('files', nargs='+')
+    add = commands.add_parser('add', help="Catalog files, e.g. after accepting them")
+    add.add_argument('files', nargs='+')
+    imported = commands.add_parser('import', help="Catalog the duplicate groups of a results file")
+    imported.add_argument('results')
+    args = parser.parse_args(argv)
+
+    with ContentCatalog(args.catalog) as catalog:
+        if args.command == 'import':
+            print(f"Catalogued {catalog.import_results(ResultsReader(args.results))} files")
+            return 0
+        status = 0
+        for file_path in args.files:
+            try:
+                if args.command == 'add':
+                    catalog.add(file_path)
+                    continue
+                matches = catalog.find(file_path)
+            except FileOperationError as e:
+                print(f"error\t{file_path}\t{str(e)}", file=sys.stderr)
+                status = 2
+                continue
+            if matches:
+                status = max(status, 1)
+                print(f"stored\t{file_path}\t{matches[0]}")
+            else:
+                print(f"new\t{file_path}")
+        return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
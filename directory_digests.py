@@ -0,0 +1,97 @@
+import hashlib
+from array import array
+from collections import defaultdict
+from typing import DefaultDict, Dict, List, Set, Tuple
+
+from file_operations import FileHash, FileId
+from path_store import PathStore
+
+
+def _entry(kind: bytes, name: str, size: int, digest: str) -> bytes:
+    """Encode one directory entry; names never contain NUL, so entries are unambiguous"""
+    return b'\0'.join((kind, name.encode('utf-8', 'surrogatepass'), str(size).encode('ascii'), digest.encode('ascii'))) + b'\0'
+
+
+def find_duplicate_directories(path_store: PathStore, file_digests: Dict[FileId, Tuple[int, FileHash]],
+                               incomplete_dirs: Set[int]) -> List[Tuple[str, int, int, List[int]]]:
+    """
+    Find directory trees with identical content by rolling file digests up the tree.
+
+    A directory's digest hashes the sorted names, sizes and digests of its
+    files and subdirectories, so equal digests mean equal trees. Only files
+    in confirmed duplicate groups have a digest; any other file makes its
+    directory, and every directory above it, unique. Directories whose listing
+    was incomplete are never reported. Directories registered after their
+    parent have higher ids, so a single descending pass visits children first.
+
+    Args:
+        path_store: Paths of the scanned tree
+        file_digests: Size and full content digest of each duplicate file
+        incomplete_dirs: Directories with entries that were skipped by the scan
+
+    Returns:
+        List of (digest, size of one copy, files in one copy, directory ids)
+        tuples for each group of identical trees. Groups made up only of
+        subdirectories of reported trees are left out.
+    """
+    num_dirs = path_store.num_directories
+    complete = bytearray(b'\1') * num_dirs
+    for dir_id in incomplete_dirs:
+        complete[dir_id] = 0
+    entries: DefaultDict[int, List[bytes]] = defaultdict(list)
+    sizes = array('Q', [0]) * num_dirs
+    counts = array('Q', [0]) * num_dirs
+
+    for file_id in range(len(path_store)):
+        dir_id = path_store.file_directory(file_id)
+        if not complete[dir_id]:
+            continue
+        known = file_digests.get(file_id)
+        if known is None:
+            # A file with no duplicate anywhere
+            complete[dir_id] = 0
+            entries.pop(dir_id, None)
+            continue
+        size, digest = known
+        entries[dir_id].append(_entry(b'f', path_store.file_name(file_id), size, digest))
+        sizes[dir_id] += size
+        counts[dir_id] += 1
+
+    digests: Dict[int, str] = {}
+    for dir_id in range(num_dirs - 1, -1, -1):
+        parent = path_store.directory_parent(dir_id)
+        if complete[dir_id]:
+            hasher = hashlib.sha256()
+            for entry in sorted(entries.pop(dir_id, ())):
+                hasher.update(entry)
+            digests[dir_id] = hasher.hexdigest()
+        else:
+            entries.pop(dir_id, None)
+
+        if parent == PathStore.ROOT_PARENT or not complete[parent]:
+            continue
+        if complete[dir_id]:
+            entries[parent].append(_entry(b'd', path_store.directory_name(dir_id), sizes[dir_id], digests[dir_id]))
+            sizes[parent] += sizes[dir_id]
+            counts[parent] += counts[dir_id]
+        else:
+            complete[parent] = 0
+            entries.pop(parent, None)
+
+    dirs_by_digest: DefaultDict[str, List[int]] = defaultdict(list)
+    for dir_id, digest in digests.items():
+        # Trees without files are identical to every other empty tree
+        if counts[dir_id]:
+            dirs_by_digest[digest].append(dir_id)
+    duplicated = {dir_id for dir_ids in dirs_by_digest.values() if len(dir_ids) > 1 for dir_id in dir_ids}
+
+    groups = []
+    for digest, dir_ids in dirs_by_digest.items():
+        if len(dir_ids) < 2:
+            continue
+        # Copies inside copied trees are removed along with them
+        if all(path_store.directory_parent(dir_id) in duplicated for dir_id in dir_ids):
+            continue
+        groups.append((digest, sizes[dir_ids[0]], counts[dir_ids[0]], sorted(dir_ids)))
+    groups.sort(key=lambda group: group[1] * (len(group[3]) - 1), reverse=True)
+    return groups
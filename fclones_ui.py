@@ -1,23 +1,23 @@
 import streamlit as st
+import pandas as pd
 import os
 import hashlib
-from pathlib import Path
 import logging
-from logging.handlers import RotatingFileHandler
 from dotenv import load_dotenv
 import config
-from typing import Dict, List, Optional, Tuple, Any, Callable, Set, Union, Literal, DefaultDict
-from datetime import datetime
-from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
 import time
-from dataclasses import dataclass
 from enum import Enum, auto
 import subprocess
-
-# Custom type hints
-FilePath = str | Path
-FileSize = int
-FileHash = str
+from results_store import MATCH_METADATA, DirectoryGroup, DuplicateGroup, ResultsReader, list_results
+from scanner import ScanSettings, SelectionStrategy, sort_group_by_strategy
+from file_hasher import verify_group
+from scan_service import OUTCOME_REUSED, RemoteScanJob, ScanServiceClient, ScanServiceError
+from file_operations import FilePath, FileOperationError, FileOperations, CloudStorage
+from io_governor import IOGovernor, IOLimits
+from log_setup import SkipSummary, configure_logging
+from progress_reporter import format_duration
+from scan_estimator import ScanEstimate, estimate_scan
 
 # Define OperationType enum
 class OperationType(Enum):
@@ -25,14 +25,6 @@ class OperationType(Enum):
     DELETE = auto()
     NONE = auto()
 
-# Define SelectionStrategy enum
-class SelectionStrategy(Enum):
-    """Strategy for selecting which duplicate to keep."""
-    NEWEST = "Keep newest file"
-    OLDEST = "Keep oldest file"
-    SHORTEST_PATH = "Keep file with shortest path"
-    LONGEST_PATH = "Keep file with longest path"
-
 # Strategy tooltips
 STRATEGY_TOOLTIPS = {
     SelectionStrategy.NEWEST: "Keeps the most recently modified file in each group and selects older duplicates for deletion",
@@ -49,31 +41,7 @@ class UIState(Enum):
     RESULTS = auto()
     DELETING = auto()
 
-@dataclass
-class FileInfo:
-    """Information about a file"""
-    size_bytes: int
-    is_hidden: bool
-    modified: float  # Add modified timestamp field
-    hash: Optional[str] = None
-
 # Custom exceptions
-class FileOperationError(Exception):
-    """Base class for file operation errors"""
-    pass
-
-class FileNotFoundError(FileOperationError):
-    """Raised when a file is not found"""
-    pass
-
-class PermissionError(FileOperationError):
-    """Raised when permission is denied"""
-    pass
-
-class CloudStorageError(FileOperationError):
-    """Raised when there are cloud storage related issues"""
-    pass
-
 class ConfigurationError(Exception):
     """Raised when there are configuration issues"""
     pass
@@ -100,7 +68,8 @@ def init_session_state() -> None:
     """Initialize the session state with default values."""
     if 'initialized' not in st.session_state:
         st.session_state.initialized = False
-        st.session_state.duplicate_files = []
+        st.session_state.results = None
+        st.session_state.results_page = 0
         st.session_state.selected_files = set()
         st.session_state.processing = False
         st.session_state.current_directory = None
@@ -119,6 +88,17 @@ def init_session_state() -> None:
         st.session_state.error_message = None
         st.session_state.scan_dir = ""
         st.session_state.selection_strategy = SelectionStrategy.NEWEST
+        st.session_state.scan_job = None
+        st.session_state.scan_message = None
+        st.session_state.checkpoint_interval = config.CHECKPOINT_INTERVAL
+        st.session_state.io_limits = IOLimits()
+        st.session_state.sample_large_files = False
+        st.session_state.reuse_recent_results = True
+        st.session_state.update_catalog = False
+        st.session_state.top_k = 0
+        st.session_state.scan_estimate = None
+        st.session_state.directory_message = None
+        st.session_state.export_path = None
         st.session_state.initialized = True
 
 # Initialize session state
@@ -147,7 +127,13 @@ BUTTON_KEYS: Dict[str, str] = {
     'DELETE_SELECTED': 'delete_selected_btn',
     'DELETE_SELECTED_DISABLED': 'delete_selected_disabled_btn',
     'SELECT_ALL': 'select_all_btn',
-    'SELECT_NONE': 'select_none_btn'
+    'SELECT_NONE': 'select_none_btn',
+    'OPEN_RESULTS': 'open_results_btn',
+    'EXPORT_RESULTS': 'export_results_btn',
+    'DOWNLOAD_RESULTS': 'download_results_btn',
+    'ESTIMATE_SCAN': 'estimate_scan_btn',
+    'CANCEL_SCAN': 'cancel_scan_btn',
+    'RESUME_SCAN': 'resume_scan_btn'
 }
 
 CLOUD_PATHS: Dict[str, List[str]] = {
@@ -187,212 +173,9 @@ st.markdown(config.CSS_STYLES, unsafe_allow_html=True)
 if not os.path.exists(config.LOG_DIR):
     os.makedirs(config.LOG_DIR)
 
-# Custom logging filter to only log when needed
-class DeletionFilter(logging.Filter):
-    """Filter for deletion related log messages"""
-    
-    def __init__(self) -> None:
-        """Initialize the deletion filter"""
-        super().__init__()
-        self.deletion_messages: List[str] = []
-
-    def filter(self, record: logging.LogRecord) -> bool:
-        """Filter and store deletion related messages"""
-        if "deleted" in record.msg.lower():
-            self.deletion_messages.append(record.msg)
-        return True
-
-# Set up logging with size limit
-deletion_filter = DeletionFilter()
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        RotatingFileHandler(
-            config.LOG_FILE,
-            maxBytes=config.LOG_MAX_BYTES,
-            backupCount=config.LOG_BACKUP_COUNT
-        ),
-        logging.StreamHandler()
-    ]
-)
+# Set up logging with size limit, written by a background thread
+configure_logging(config.LOG_FILE)
 logger = logging.getLogger()
-logger.addFilter(deletion_filter)
-
-class FileOperations:
-    """Class for handling file operations"""
-    
-    @staticmethod
-    def is_safe_file(file_path: FilePath) -> bool:
-        """
-        Check if a file is safe to delete.
-        
-        Args:
-            file_path: Path to the file to check
-            
-        Returns:
-            bool: True if the file is safe to delete, False otherwise
-            
-        Raises:
-            FileOperationError: If there are issues checking the file
-        """
-        try:
-            path = Path(file_path)
-            if not path.exists():
-                raise FileNotFoundError(f"File not found: {file_path}")
-                
-            # Check if file is in a system directory
-            system_paths = {
-                os.environ.get('WINDIR', ''),
-                os.environ.get('PROGRAMFILES', ''),
-                os.environ.get('PROGRAMFILES(X86)', ''),
-                os.environ.get('PROGRAMDATA', ''),
-                os.environ.get('SYSTEMROOT', '')
-            }
-            
-            return not any(str(path).lower().startswith(str(sys_path).lower()) 
-                         for sys_path in system_paths if sys_path)
-                         
-        except Exception as e:
-            raise FileOperationError(f"Error checking file safety: {str(e)}")
-
-    @staticmethod
-    def safe_delete_file(file_path: FilePath) -> bool:
-        """
-        Safely delete a file after performing safety checks.
-        
-        Args:
-            file_path: Path to the file to delete
-            
-        Returns:
-            bool: True if file was deleted successfully
-            
-        Raises:
-            FileOperationError: If there are issues deleting the file
-        """
-        try:
-            if not FileOperations.is_safe_file(file_path):
-                raise FileOperationError(f"File {file_path} failed safety checks")
-                
-            if FileOperations.is_cloud_storage_file(file_path):
-                raise CloudStorageError(f"File {file_path} appears to be a cloud storage file")
-                
-            os.remove(file_path)
-            return True
-            
-        except Exception as e:
-            raise FileOperationError(f"Error deleting file: {str(e)}")
-
-    @staticmethod
-    def is_cloud_storage_file(file_path: FilePath) -> bool:
-        """
-        Check if a file is from a cloud storage provider.
-        
-        Args:
-            file_path: Path to check
-            
-        Returns:
-            bool: True if file appears to be from cloud storage
-        """
-        cloud_indicators = {
-            'OneDrive',
-            'Dropbox',
-            'Google Drive',
-            'iCloud',
-            'Box'
-        }
-        
-        path_str = str(file_path).lower()
-        return any(indicator.lower() in path_str for indicator in cloud_indicators)
-
-    @staticmethod
-    def get_file_info(file_path: FilePath) -> FileInfo:
-        """
-        Get information about a file.
-        
-        Args:
-            file_path: Path to the file
-            
-        Returns:
-            FileInfo: Information about the file
-            
-        Raises:
-            FileOperationError: If there are issues getting file information
-        """
-        try:
-            path = Path(file_path)
-            stats = path.stat()
-            
-            return FileInfo(
-                size_bytes=stats.st_size,
-                is_hidden=bool(path.name.startswith('.') or 
-                             bool(stats.st_file_attributes & 0x2) if os.name == 'nt' else False),
-                modified=stats.st_ctime,
-                hash=None  # Hash is computed separately when needed
-            )
-            
-        except Exception as e:
-            raise FileOperationError(f"Error getting file info: {str(e)}")
-
-    @staticmethod
-    def compute_file_hash(file_path: FilePath, chunk_size: int = 8192) -> FileHash:
-        """
-        Compute the SHA-256 hash of a file.
-        
-        Args:
-            file_path: Path to the file
-            chunk_size: Size of chunks to read, defaults to 8KB
-            
-        Returns:
-            str: Hex digest of the file hash
-            
-        Raises:
-            FileOperationError: If there are issues computing the hash
-        """
-        try:
-            hasher = hashlib.sha256()
-            
-            with open(file_path, 'rb') as f:
-                while chunk := f.read(chunk_size):
-                    hasher.update(chunk)
-                    
-            return hasher.hexdigest()
-            
-        except Exception as e:
-            raise FileOperationError(f"Error computing file hash: {str(e)}")
-
-class CloudStorage:
-    """Handles cloud storage detection and warnings"""
-    
-    @staticmethod
-    def detect(path: FilePath) -> Optional[str]:
-        """Detect if a path is within a cloud storage directory"""
-        try:
-            path_normalized = os.path.normpath(path.lower())
-            for provider, indicators in config.CLOUD_PATHS.items():
-                if any(indicator.lower() in path_normalized for indicator in indicators):
-                    return provider
-            return None
-        except Exception as e:
-            logger.error(f"Error detecting cloud storage for {path}: {str(e)}")
-            return None
-
-    @staticmethod
-    def get_warning(path: FilePath) -> Optional[str]:
-        """Get cloud storage warning if applicable"""
-        cloud_service = CloudStorage.detect(path)
-        if cloud_service:
-            return config.CLOUD_WARNINGS.get(cloud_service.lower(), f"Warning: This path is in {cloud_service}")
-        return None
-
-    @staticmethod
-    def is_sensitive_directory(path: FilePath) -> bool:
-        """Check if the path is in a sensitive system directory."""
-        try:
-            path = str(Path(path).resolve()).lower()
-            return any(path.startswith(sensitive_dir) for sensitive_dir in config.SENSITIVE_DIRS)
-        except Exception:
-            return True  # If we can't resolve the path, treat it as sensitive
 
 def init_ui_state() -> None:
     """Initialize UI state with default values."""
@@ -409,176 +192,271 @@ def get_ui_state() -> UIState:
     """Get current UI state."""
     return st.session_state.ui_state
 
-def find_duplicates(directory: FilePath) -> None:
+@st.cache_resource
+def get_scan_service() -> ScanServiceClient:
+    """Return the client for the local scan service shared by all sessions."""
+    return ScanServiceClient()
+
+def start_scan(directory: Optional[FilePath], resume: bool = False) -> None:
     """
-    Find duplicate files in the given directory.
+    Start a scan of the given directory on the scan service, or attach to a
+    matching one that another session started.
     
     Args:
-        directory: Directory to scan for duplicates
+        directory: Directory to scan for duplicates, ignored when resuming
+        resume: Continue the last checkpointed scan instead
     """
+    if resume:
+        job = get_scan_service().resume_last()
+    else:
+        settings = ScanSettings(
+            str(directory),
+            st.session_state.selection_strategy,
+            checkpoint_interval=st.session_state.checkpoint_interval,
+            io_limits=st.session_state.io_limits,
+            sample_large_files=st.session_state.sample_large_files,
+            update_catalog=st.session_state.update_catalog,
+            top_k=st.session_state.top_k,
+            exclude_dirs=tuple(name.strip() for name in st.session_state.exclude_dirs.split(',') if name.strip())
+        )
+        job = get_scan_service().submit(settings, force=not st.session_state.reuse_recent_results)
+    
     st.session_state.processing = True
     st.session_state.operation_type = OperationType.SCAN
     st.session_state.operation_progress = 0
-    st.session_state.duplicate_files = []
+    st.session_state.results = None
+    st.session_state.scan_message = None
+    st.session_state.scan_job = job
+    set_ui_state(UIState.SCANNING)
+
+def finish_scan() -> None:
+    """Load the results of a finished background scan into the session."""
+    job = st.session_state.scan_job
+    st.session_state.scan_job = None
+    st.session_state.processing = False
+    st.session_state.operation_type = OperationType.NONE
+    reused = f"Reused the results of a scan finished at {job.finished_at}. " if job.outcome == OUTCOME_REUSED else ""
     
-    # Create progress indicators
-    progress_bar = st.progress(0)
-    status_text = st.empty()
+    if job.error:
+        st.session_state.scan_message = ('error', f"An error occurred while scanning: {job.error}")
     
-    try:
-        # Initialize file tracking
-        files_by_size: DefaultDict[FileSize, List[FilePath]] = defaultdict(list)
-        files_by_hash: DefaultDict[FileHash, List[FilePath]] = defaultdict(list)
-        total_files = 0
-        processed_files = 0
-        
-        # First pass: Group files by size
-        for root, _, files in os.walk(directory):
-            if st.session_state.processing is False:  # Only break if processing is explicitly set to False
-                break
-                
-            status_text.text(f"Scanning directory: {root}")
-            for filename in files:
-                filepath = os.path.join(root, filename)
-                try:
-                    # Skip files that don't meet criteria
-                    if not FileOperations.is_safe_file(filepath):
-                        continue
-                        
-                    file_info = FileOperations.get_file_info(filepath)
-                    if file_info and file_info.size_bytes > 0:  # Skip empty files
-                        files_by_size[file_info.size_bytes].append(filepath)
-                        total_files += 1
-                except FileOperationError as e:
-                    logger.warning(f"Skipping file due to error: {str(e)}")
-                    continue
-        
-        # Second pass: Calculate hashes for files of the same size
-        for size, size_group in files_by_size.items():
-            if len(size_group) < 2:  # Skip unique files
-                continue
-                
-            if st.session_state.processing is False:  # Only break if processing is explicitly set to False
-                break
-                
-            for filepath in size_group:
-                try:
-                    file_hash = FileOperations.compute_file_hash(filepath)
-                    files_by_hash[file_hash].append(filepath)
-                    processed_files += 1
-                    progress = min(processed_files / total_files, 1.0) if total_files > 0 else 0
-                    st.session_state.operation_progress = progress
-                    progress_bar.progress(progress)
-                    status_text.text(f"Processing file: {filepath}")
-                except FileOperationError as e:
-                    logger.warning(f"Skipping file due to error: {str(e)}")
-                    continue
-        
-        # Collect duplicate groups and sort based on selection strategy
-        duplicate_groups = []
-        for group in files_by_hash.values():
-            if len(group) > 1:
-                # Sort files based on selection strategy
-                if st.session_state.selection_strategy == SelectionStrategy.NEWEST:
-                    sorted_group = sorted(
-                        group,
-                        key=lambda f: FileOperations.get_file_info(f).modified,
-                        reverse=True
-                    )
-                elif st.session_state.selection_strategy == SelectionStrategy.OLDEST:
-                    sorted_group = sorted(
-                        group,
-                        key=lambda f: FileOperations.get_file_info(f).modified
-                    )
-                elif st.session_state.selection_strategy == SelectionStrategy.SHORTEST_PATH:
-                    sorted_group = sorted(
-                        group,
-                        key=lambda f: len(str(f))
-                    )
-                else:  # LONGEST_PATH
-                    sorted_group = sorted(
-                        group,
-                        key=lambda f: len(str(f)),
-                        reverse=True
-                    )
-                duplicate_groups.append(sorted_group)
+    if job.results_path:
+        st.session_state.results = ResultsReader(job.results_path)
+        st.session_state.results_page = 0
+        # Automatically select all files except the first one in each group
+        update_selections_based_on_strategy()
+        if not job.error:
+            st.session_state.scan_message = ('success', f"{reused}Found {st.session_state.results.num_groups} groups of duplicate files! Automatically selected all duplicates except the {st.session_state.selection_strategy.value.lower()} in each group.")
+        set_ui_state(UIState.RESULTS)
+    else:
+        if not job.error:
+            st.session_state.scan_message = ('info', f"{reused}No duplicate files found.")
+        set_ui_state(UIState.DIRECTORY_SELECT)
+
+def refresh_scan_job(job: RemoteScanJob) -> bool:
+    """
+    Fetch the latest state of the session's scan from the scan service.
+    
+    Args:
+        job: Scan the session is following
         
-        st.session_state.duplicate_files = duplicate_groups
-            
-    except Exception as e:
-        logger.error(f"An error occurred while scanning: {str(e)}")
-        st.error(f"An error occurred while scanning: {str(e)}")
-    finally:
+    Returns:
+        bool: False if the scan was lost, e.g. because the service restarted
+    """
+    try:
+        job.refresh()
+        return True
+    except ScanServiceError as e:
+        logger.error(f"Lost track of the running scan: {str(e)}")
+        st.session_state.scan_job = None
         st.session_state.processing = False
         st.session_state.operation_type = OperationType.NONE
-        progress_bar.empty()
-        status_text.empty()
+        st.session_state.scan_message = ('error', f"Lost track of the running scan: {str(e)}")
+        set_ui_state(UIState.DIRECTORY_SELECT)
+        return False
+
+@st.fragment(run_every=config.SCAN_POLL_INTERVAL)
+def show_scan_progress() -> None:
+    """Show progress of the running scan, refreshing until it finishes."""
+    job = st.session_state.scan_job
+    if job is None:
+        return
+    if not refresh_scan_job(job):
+        st.rerun()
+    if job.done:
+        finish_scan()
+        st.rerun()
         
-        if st.session_state.duplicate_files:
-            # Automatically select all files except the first one in each group
-            st.session_state.selected_files = set()
-            total_size = 0
-            for group in st.session_state.duplicate_files:
-                # Skip the first file (based on strategy) and select the rest
-                for file in group[1:]:
-                    if os.path.exists(file):
-                        st.session_state.selected_files.add(file)
-                        try:
-                            total_size += os.path.getsize(file)
-                        except (OSError, IOError):
-                            continue
-            
-            st.session_state.space_savings = total_size
-            st.success(f"Found {len(st.session_state.duplicate_files)} groups of duplicate files! Automatically selected all duplicates except the {st.session_state.selection_strategy.value.lower()} in each group.")
-            set_ui_state(UIState.RESULTS)
-        else:
-            st.info("No duplicate files found.")
-            set_ui_state(UIState.DIRECTORY_SELECT)
-
-def delete_selected_files():
+    st.session_state.operation_progress = job.progress
+    st.progress(job.progress)
+    st.text(job.status)
+    if st.button("Cancel Scan", key=BUTTON_KEYS['CANCEL_SCAN'], disabled=job.cancelled):
+        try:
+            job.cancel()
+        except ScanServiceError as e:
+            st.error(f"Error cancelling scan: {str(e)}")
+
+@st.fragment(run_every=config.SCAN_POLL_INTERVAL)
+def show_live_results() -> None:
+    """Show duplicate groups as the running scan confirms them."""
+    job = st.session_state.scan_job
+    if job is None:
+        return
+    if not refresh_scan_job(job):
+        st.rerun()
+    if job.done:
+        finish_scan()
+        st.rerun()
+        
+    st.info(f"Scan in progress - {job.num_groups} groups found so far, {job.reclaimable_bytes / (1024*1024):.2f} MB reclaimable")
+    try:
+        live_groups = job.live_groups()
+    except ScanServiceError as e:
+        logger.warning(f"Could not fetch live results: {str(e)}")
+        live_groups = []
+    if live_groups:
+        st.dataframe(
+            pd.DataFrame({
+                "Reclaimable (MB)": [group.reclaimable_bytes / (1024*1024) for group in live_groups],
+                "Files": [group.count for group in live_groups],
+                "Size (KB)": [group.size / 1024 for group in live_groups],
+                "File to keep": [group.first_path for group in live_groups],
+                "Match": [group.match for group in live_groups]
+            }),
+            hide_index=True,
+            use_container_width=True
+        )
+
+def verify_result_group(group: DuplicateGroup, governor: Optional[IOGovernor] = None) -> None:
+    """
+    Fully hash a probable duplicate group and drop files that turn out to differ.
+    
+    Args:
+        group: Unverified group from the current results
+        governor: Optional I/O governor that paces the reads
+    """
+    excluded = {group.file_ids[index] for index in verify_group(group.paths, governor)}
+    st.session_state.results.record_verification(group.group_id, sorted(excluded))
+    st.session_state.selected_files.difference_update(excluded)
+    
+    # Never leave every remaining copy selected after the group shrinks
+    remaining = {
+        path: file_id for path, file_id in zip(group.paths, group.file_ids)
+        if file_id not in excluded and os.path.exists(path)
+    }
+    if remaining and all(file_id in st.session_state.selected_files for file_id in remaining.values()):
+        keep = sort_group_by_strategy(list(remaining), st.session_state.selection_strategy)[0]
+        st.session_state.selected_files.discard(remaining[keep])
+
+def is_selectable(results: ResultsReader, group: DuplicateGroup) -> bool:
+    """
+    Whether a group's files may be selected for deletion.
+    
+    Placeholders matched on metadata only are verified by downloading them, so
+    that is left to the user to do explicitly, group by group.
+    """
+    return group.match != MATCH_METADATA or results.is_verified(group)
+
+def delete_selected_files(io_limits: IOLimits):
     """Delete the selected files and return the number of files successfully deleted"""
     deleted_count = 0
     errors = []
+    governor = IOGovernor(io_limits)
+    results = st.session_state.results
     
     st.session_state.operation_type = OperationType.DELETE
     
+    # Probable duplicates are only deleted once their full content has been compared
+    if results.num_unverified:
+        for group in results.iter_groups():
+            if results.is_verified(group) or not st.session_state.selected_files.intersection(group.file_ids):
+                continue
+            if is_selectable(results, group):
+                verify_result_group(group, governor)
+            else:
+                # Never download placeholders the user hasn't asked to verify
+                st.session_state.selected_files.difference_update(group.file_ids)
+    
+    # Materialise paths only for the files being deleted
+    selected = results.files(st.session_state.selected_files)
+    
     # Calculate and store total size before deletion
     total_size = 0
-    for file_path in st.session_state.selected_files:
-        try:
-            if os.path.exists(file_path):
-                total_size += os.path.getsize(file_path)
-        except (OSError, IOError):
-            continue
+    for file_path, file_size in selected.values():
+        if os.path.exists(file_path):
+            total_size += file_size
     
     # Store the space savings
     st.session_state.space_savings = total_size
     
     # Proceed with deletion
-    for file_path in st.session_state.selected_files.copy():
+    skipped = SkipSummary(logger, "deleting")
+    for file_id, (file_path, _) in selected.items():
         try:
+            governor.before_file()
             os.remove(file_path)
-            st.session_state.selected_files.remove(file_path)
+            st.session_state.selected_files.remove(file_id)
             deleted_count += 1
         except Exception as e:
+            skipped.record(file_path, e)
             errors.append(f"Error deleting {file_path}: {str(e)}")
+    skipped.flush()
+    logger.info(f"Deleted {deleted_count} files, {len(errors)} could not be deleted")
     
     st.session_state.operation_type = OperationType.NONE
     return deleted_count, errors
 
-def get_safe_file_size(file_path: FilePath) -> Optional[int]:
-    """Get file size safely with proper error handling.
-    
+def dedupe_directory_group(group: DirectoryGroup, keep: str, link: bool, io_limits: IOLimits) -> Tuple[int, List[str]]:
+    """
+    Delete every copy of a duplicate folder but one, or replace their files with hard links to it.
+
     Args:
-        file_path: Path to the file
-        
+        group: Group of identical folders
+        keep: Folder whose files are kept
+        link: Replace files with hard links instead of deleting them
+        io_limits: Pacing of the file operations
+
     Returns:
-        File size in bytes or None if file cannot be accessed
+        Tuple[int, List[str]]: Number of files deleted or linked, and errors
     """
-    try:
-        return os.path.getsize(file_path)
-    except (OSError, IOError):
-        return None
+    governor = IOGovernor(io_limits)
+    count, errors = 0, []
+    for directory in group.paths:
+        if directory == keep or not os.path.isdir(directory):
+            continue
+        try:
+            done, failed = FileOperations.dedupe_directory(directory, keep, link=link, governor=governor)
+        except FileOperationError as e:
+            errors.append(str(e))
+            continue
+        count += done
+        errors.extend(failed)
+    if link:
+        logger.info(f"Replaced {count} files with hard links to {keep}, {len(errors)} errors")
+    else:
+        logger.info(f"Deleted {count} files in copies of {keep}, {len(errors)} errors")
+    return count, errors
+
+def show_scan_estimate(estimate: ScanEstimate) -> None:
+    """Show the projected size and duration of a scan."""
+    gb = 1024 ** 3
+    lines = [
+        f"About {estimate.files:,.0f} files in {estimate.directories:,.0f} folders ({estimate.total_bytes / gb:.1f} GB).",
+        f"About {estimate.candidate_files:,.0f} files ({estimate.candidate_bytes / gb:.1f} GB) share their size "
+        f"with another file, so hashing reads at most that much.",
+    ]
+    if estimate.seconds is not None:
+        lines.append(f"Expected duration: about {format_duration(estimate.seconds)} "
+                     f"(listing {format_duration(estimate.walk_seconds)}, hashing {format_duration(estimate.hash_seconds)}).")
+    elif estimate.walk_seconds is not None:
+        lines.append(f"Listing should take about {format_duration(estimate.walk_seconds)}. "
+                     "Hashing time is shown once a scan has read enough data to measure the disk.")
+    st.info("\n\n".join(lines))
+    st.caption(
+        f"Estimated from {estimate.directories_sampled:,} sampled folders"
+        + ("" if estimate.from_history else ", timed by the sample itself as no scan has finished recently")
+        + ". Trees with a few very large files can be off by a factor of two or more."
+    )
 
 def select_directory() -> Optional[str]:
     """Open Windows folder picker dialog and return selected path."""
@@ -610,47 +488,34 @@ def select_directory() -> Optional[str]:
         logger.error(f"Error in directory selection: {e}")
         st.error("Failed to open folder selection dialog")
 
+def clear_export() -> None:
+    """Drop the prepared download once it has been taken, so reruns don't read the results file again."""
+    st.session_state.export_path = None
+
 def update_selections_based_on_strategy() -> None:
     """Update file selections based on the current strategy."""
-    if not st.session_state.duplicate_files:
+    if not st.session_state.results:
         return
         
     st.session_state.selected_files = set()
     total_size = 0
+    excluded = st.session_state.results.excluded_files
     
-    for group in st.session_state.duplicate_files:
-        # Sort files based on current strategy
-        if st.session_state.selection_strategy == SelectionStrategy.NEWEST:
-            sorted_group = sorted(
-                group,
-                key=lambda f: FileOperations.get_file_info(f).modified,
-                reverse=True
-            )
-        elif st.session_state.selection_strategy == SelectionStrategy.OLDEST:
-            sorted_group = sorted(
-                group,
-                key=lambda f: FileOperations.get_file_info(f).modified
-            )
-        elif st.session_state.selection_strategy == SelectionStrategy.SHORTEST_PATH:
-            sorted_group = sorted(
-                group,
-                key=lambda f: len(str(f))
-            )
-        else:  # LONGEST_PATH
-            sorted_group = sorted(
-                group,
-                key=lambda f: len(str(f)),
-                reverse=True
-            )
+    # Stream groups from the results file rather than holding them all in memory
+    for group in st.session_state.results.iter_groups():
+        if not is_selectable(st.session_state.results, group):
+            continue
+        # Files deleted since the scan can neither be kept nor selected
+        file_ids = {
+            path: file_id for path, file_id in zip(group.paths, group.file_ids)
+            if file_id not in excluded and os.path.exists(path)
+        }
+        sorted_group = sort_group_by_strategy(list(file_ids), st.session_state.selection_strategy)
             
         # Skip the first file (based on strategy) and select the rest
         for file in sorted_group[1:]:
-            if os.path.exists(file):
-                st.session_state.selected_files.add(file)
-                try:
-                    total_size += os.path.getsize(file)
-                except (OSError, IOError):
-                    continue
+            st.session_state.selected_files.add(file_ids[file])
+            total_size += group.size
     
     st.session_state.space_savings = total_size
 
@@ -674,6 +539,73 @@ with st.sidebar:
     st.subheader("Scan Options")
     scan_hidden = st.checkbox("Scan hidden files", value=False)
     follow_symlinks = st.checkbox("Follow symbolic links", value=False)
+    sample_large_files = st.checkbox(
+        "Fast mode for large files",
+        value=False,
+        help=f"Compare files over {config.MAX_FILE_SIZE // (1024*1024)} MB on sampled blocks only. "
+             "Matches are reported as probable duplicates and fully verified before deletion."
+    )
+    reuse_recent_results = st.checkbox(
+        "Reuse recent results",
+        value=True,
+        help=f"Show the results of a scan of the same folder and settings from the last "
+             f"{config.SCAN_SERVICE_RESULTS_TTL // 60} minutes instead of scanning again. "
+             "A matching scan already running in another session is always joined."
+    )
+    update_catalog = st.checkbox(
+        "Update content catalog",
+        value=False,
+        help="Record every scanned file in the content catalog, so new files can be checked against this "
+             "folder with `python content_catalog.py lookup` without scanning it again."
+    )
+    top_k = st.number_input(
+        "Only keep the top groups",
+        min_value=0,
+        value=0,
+        step=10,
+        help="Keep only this many duplicate groups, those that free the most space, and stop hashing once no "
+             "remaining files could make the list. Set to 0 to keep every group."
+    )
+    checkpoint_interval = st.number_input(
+        "Checkpoint interval (seconds)",
+        min_value=0,
+        value=config.CHECKPOINT_INTERVAL,
+        step=10,
+        help="How often a running scan saves its progress so it can be resumed. Set to 0 to disable checkpoints."
+    )
+    
+    # Add I/O limits
+    st.subheader("I/O Limits")
+    max_read_rate = st.number_input(
+        "Max read rate (MB/s)",
+        min_value=0.0,
+        value=config.IO_MAX_BYTES_PER_SECOND / (1024*1024),
+        step=10.0,
+        help="Caps how fast scans read file contents. Set to 0 for unlimited."
+    )
+    max_files_rate = st.number_input(
+        "Max files per second",
+        min_value=0,
+        value=config.IO_MAX_FILES_PER_SECOND,
+        step=100,
+        help="Caps how many files scans open and deletions remove per second. Set to 0 for unlimited."
+    )
+    low_io_priority = st.checkbox(
+        "Low I/O priority",
+        value=config.IO_LOW_PRIORITY,
+        help="Run scans at idle/background I/O priority so other workloads are served first"
+    )
+    adaptive_backoff = st.checkbox(
+        "Back off when disks are busy",
+        value=config.IO_ADAPTIVE_BACKOFF,
+        help="Slow scans down automatically while read latency is above its normal level"
+    )
+    io_limits = IOLimits(
+        bytes_per_second=max_read_rate * 1024 * 1024,
+        files_per_second=max_files_rate,
+        low_priority=low_io_priority,
+        adaptive_backoff=adaptive_backoff
+    )
     
     # Add selection strategy
     st.subheader("Selection Strategy")
@@ -691,6 +623,25 @@ with tab1:
     # Main heading for the scan tab
     st.markdown("### Scan for Duplicates")
     
+    # Offer to resume a scan that was interrupted or cancelled
+    checkpoint_info = None
+    if st.session_state.scan_job is None:
+        try:
+            checkpoint_info = get_scan_service().last_checkpoint_info()
+        except ScanServiceError as e:
+            st.error(f"Scan service unavailable: {str(e)}")
+    if checkpoint_info:
+        st.info(
+            f"The last scan of {checkpoint_info['directory']} stopped while {checkpoint_info['phase']} "
+            f"({checkpoint_info['files']} files, {checkpoint_info['groups']} groups, saved {checkpoint_info['saved_at']})."
+        )
+        if st.button("Resume last scan", key=BUTTON_KEYS['RESUME_SCAN']):
+            try:
+                start_scan(None, resume=True)
+                st.rerun()
+            except Exception as e:
+                st.error(f"Error resuming scan: {str(e)}")
+    
     # Show selected directory and scan button if directory is selected
     if st.session_state.scan_dir:
         st.text_input(
@@ -701,7 +652,7 @@ with tab1:
         )
         
         st.markdown('<div class="scan-buttons-container">', unsafe_allow_html=True)
-        col1, col2, col3 = st.columns([1, 1, 4])
+        col1, col2, col3, col4 = st.columns([1, 1, 1, 3])
         with col1:
             if st.button("Change folder", type="primary", key=BUTTON_KEYS['SELECT_PATH']):
                 select_directory()
@@ -710,7 +661,15 @@ with tab1:
                 st.session_state.scan_dir = ""
                 st.rerun()
         with col3:
-            if st.button("Start Scan", type="primary", key=BUTTON_KEYS['START_SCAN']):
+            if st.button("Estimate", key=BUTTON_KEYS['ESTIMATE_SCAN'], help="Sample the folder to predict how long a scan would take"):
+                with st.spinner("Sampling the folder..."):
+                    try:
+                        st.session_state.scan_estimate = estimate_scan(st.session_state.scan_dir, exclude_dirs=exclude_dirs.split(','))
+                    except OSError as e:
+                        st.session_state.scan_estimate = None
+                        st.error(f"Could not estimate the scan: {str(e)}")
+        with col4:
+            if st.button("Start Scan", type="primary", key=BUTTON_KEYS['START_SCAN'], disabled=st.session_state.scan_job is not None):
                 # Check for cloud storage using CloudStorage class
                 cloud_service = CloudStorage.detect(st.session_state.scan_dir)
                 if cloud_service:
@@ -731,13 +690,23 @@ with tab1:
                 st.session_state.exclude_dirs = exclude_dirs
                 st.session_state.scan_hidden = scan_hidden
                 st.session_state.follow_symlinks = follow_symlinks
+                st.session_state.checkpoint_interval = checkpoint_interval
+                st.session_state.io_limits = io_limits
+                st.session_state.sample_large_files = sample_large_files
+                st.session_state.reuse_recent_results = reuse_recent_results
+                st.session_state.update_catalog = update_catalog
+                st.session_state.top_k = int(top_k)
                 
-                with st.spinner("Scanning for duplicates..."):
-                    try:
-                        find_duplicates(st.session_state.scan_dir)
-                    except Exception as e:
-                        st.error(f"Error during scan: {str(e)}")
+                try:
+                    start_scan(st.session_state.scan_dir)
+                    st.rerun()
+                except Exception as e:
+                    st.error(f"Error during scan: {str(e)}")
         st.markdown('</div>', unsafe_allow_html=True)
+        
+        estimate = st.session_state.scan_estimate
+        if estimate is not None and estimate.directory == st.session_state.scan_dir:
+            show_scan_estimate(estimate)
     else:
         st.markdown('<div class="scan-buttons-container">', unsafe_allow_html=True)
         col1, col2, col3 = st.columns([1, 1, 4])
@@ -749,12 +718,44 @@ with tab1:
         with col3:
             st.empty()
         st.markdown('</div>', unsafe_allow_html=True)
+    
+    # Progress of a running scan, and the outcome of the last one
+    show_scan_progress()
+    if st.session_state.scan_message:
+        message_type, message = st.session_state.scan_message
+        getattr(st, message_type)(message)
 
 # Display results
 with tab2:
     st.header("Scan Results")
     
-    if st.session_state.duplicate_files:
+    # Reopen results saved by earlier scans
+    saved_results = list_results()
+    if saved_results:
+        col1, col2 = st.columns([4, 1])
+        with col1:
+            saved_choice = st.selectbox(
+                "Saved results",
+                options=saved_results,
+                format_func=os.path.basename,
+                key="saved_results_select"
+            )
+        with col2:
+            if st.button("Open", key=BUTTON_KEYS['OPEN_RESULTS']):
+                try:
+                    st.session_state.results = ResultsReader(saved_choice)
+                except (OSError, ValueError) as e:
+                    logger.error(f"Could not open results {saved_choice}: {str(e)}")
+                    st.error(f"Could not open {os.path.basename(saved_choice)}: {str(e)}")
+                else:
+                    st.session_state.results_page = 0
+                    update_selections_based_on_strategy()
+                    st.rerun()
+    
+    # Groups stream in while a scan is still running
+    show_live_results()
+    
+    if st.session_state.results:
         # Initialize selected files if not already done
         if not st.session_state.initialized:
             init_ui_state()
@@ -777,15 +778,21 @@ with tab2:
             update_selections_based_on_strategy()
             st.rerun()
             
+        results = st.session_state.results
+        
         # Filter out non-existent files from selected files and recalculate space savings
-        st.session_state.selected_files = {f for f in st.session_state.selected_files if os.path.exists(f)}
-        current_selected_size = sum(get_safe_file_size(file) for file in st.session_state.selected_files)
+        selected = {
+            file_id: file_size
+            for file_id, (file_path, file_size) in results.files(st.session_state.selected_files).items()
+            if os.path.exists(file_path)
+        }
+        st.session_state.selected_files = set(selected)
         
         # Update space savings with current selection
-        st.session_state.space_savings = current_selected_size
+        st.session_state.space_savings = sum(selected.values())
             
-        total_groups = len(st.session_state.duplicate_files)
-        total_duplicates = sum(len(group) - 1 for group in st.session_state.duplicate_files)
+        total_groups = results.num_groups
+        total_duplicates = results.num_files - results.num_groups
         
         st.markdown("""
         ### Summary
@@ -794,6 +801,11 @@ with tab2:
         - Selected for deletion: {} files
         - Potential space savings: {:.2f} MB
         """.format(total_groups, total_duplicates, len(st.session_state.selected_files), st.session_state.space_savings / (1024*1024)))
+        if results.top_k:
+            st.caption(f"Only the {results.top_k} groups that free the most space were kept; smaller groups of duplicates may exist.")
+        unverified_groups = results.num_unverified - len(results.verifications)
+        if unverified_groups > 0:
+            st.caption(f"{unverified_groups} groups are probable duplicates matched on sampled content or, for cloud placeholders, on size and name. Sampled groups are fully verified before any of their files are deleted; placeholder groups can only be selected once you verify them, which downloads their content.")
         
         # Add buttons for selection and deletion
         col1, col2, col3, col4 = st.columns([1, 1, 1, 3])
@@ -802,14 +814,14 @@ with tab2:
                 init_ui_state()
                 # Select all files and calculate total size
                 total_size = 0
-                for group in st.session_state.duplicate_files:
-                    for file in group:  # Include all files
-                        if os.path.exists(file):
-                            st.session_state.selected_files.add(file)
-                            try:
-                                total_size += os.path.getsize(file)
-                            except (OSError, IOError):
-                                continue
+                excluded = results.excluded_files
+                for group in results.iter_groups():
+                    if not is_selectable(results, group):
+                        continue
+                    for file_id, file in zip(group.file_ids, group.paths):  # Include all files
+                        if file_id not in excluded and os.path.exists(file):
+                            st.session_state.selected_files.add(file_id)
+                            total_size += group.size
                 st.session_state.space_savings = total_size
                 st.rerun()
         with col2:
@@ -820,7 +832,7 @@ with tab2:
             if len(st.session_state.selected_files) > 0:
                 if st.button("Delete Selected", type="primary"):
                     if st.session_state.get('confirm_delete', False):
-                        deleted_count, errors = delete_selected_files()
+                        deleted_count, errors = delete_selected_files(io_limits)
                         if deleted_count > 0:
                             st.success(f"Successfully deleted {deleted_count} files.")
                         if errors:
@@ -832,28 +844,108 @@ with tab2:
                         st.warning(f"Are you sure you want to delete {len(st.session_state.selected_files)} files? Click 'Delete Selected' again to confirm.")
             else:
                 st.button("Delete Selected", key=BUTTON_KEYS['DELETE_SELECTED_DISABLED'], disabled=True, help="Select files to delete first")
+        with col4:
+            # The download is only built when asked for, as Streamlit reads the whole file into memory
+            if st.session_state.get('export_path') == results.file_path:
+                with open(results.file_path, 'rb') as results_file:
+                    st.download_button(
+                        "Download Results",
+                        data=results_file,
+                        file_name=os.path.basename(results.file_path),
+                        mime="application/vnd.apache.parquet",
+                        key=BUTTON_KEYS['DOWNLOAD_RESULTS'],
+                        on_click=clear_export
+                    )
+            elif st.button("Export Results", key=BUTTON_KEYS['EXPORT_RESULTS']):
+                st.session_state.export_path = results.file_path
+                st.rerun()
+        
+        # Whole folders whose content is duplicated elsewhere
+        directory_groups = [
+            (group, [path for path in group.paths if os.path.isdir(path)])
+            for group in results.directory_groups[:config.DIRECTORY_GROUPS_SHOWN]
+        ]
+        directory_groups = [(group, paths) for group, paths in directory_groups if len(paths) > 1]
+        if st.session_state.directory_message:
+            # Shown once, after the rerun that follows a folder operation
+            level, message = st.session_state.directory_message
+            getattr(st, level)(message)
+            st.session_state.directory_message = None
+        if directory_groups:
+            st.subheader("Duplicate Folders")
+            st.caption("These folders hold identical files under identical names. Only files that still match their counterpart in the kept folder are changed; anything else is left in place.")
+            for group, paths in directory_groups:
+                keep = paths[0]
+                with st.expander(f"{os.path.basename(keep)} - {len(paths)} copies - {group.file_count} files, {group.size / (1024*1024):.2f} MB each"):
+                    st.markdown(f"**Keep:** {keep}")
+                    st.markdown("**Copies:**\n" + "\n".join(f"- {path}" for path in paths[1:]))
+                    key = f"{os.path.basename(results.file_path)}_{group.group_id}"
+                    confirmed = st.checkbox("I understand the copies will be changed", key=f"confirm_dir_{key}")
+                    col1, col2 = st.columns(2)
+                    for column, link, label in ((col1, False, "Delete copies"), (col2, True, "Replace copies with hard links")):
+                        with column:
+                            if st.button(label, key=f"{'link' if link else 'delete'}_dir_{key}", disabled=not confirmed):
+                                count, errors = dedupe_directory_group(group, keep, link, io_limits)
+                                if errors:
+                                    st.session_state.directory_message = ('error', f"{'Linked' if link else 'Deleted'} {count} files, with errors:\n" + "\n".join(errors))
+                                else:
+                                    st.session_state.directory_message = ('success', f"{'Linked' if link else 'Deleted'} {count} files in copies of {keep}.")
+                                st.rerun()
+        
+        # Only the current page of groups is read from the results file
+        st.session_state.results_page = min(st.session_state.results_page, results.num_pages - 1)
+        page = st.number_input(
+            f"Page (of {results.num_pages})",
+            min_value=1,
+            max_value=results.num_pages,
+            value=st.session_state.results_page + 1,
+            step=1,
+            key="results_page_input"
+        ) - 1
+        st.session_state.results_page = page
         
         # Display duplicate groups with checkboxes
         valid_groups = []
-        for group in st.session_state.duplicate_files:
-            # Only include groups where at least two files still exist
-            existing_files = [f for f in group if os.path.exists(f)]
+        for duplicate_group in results.read_page(page):
+            # Only include groups where at least two files still exist and match
+            excluded = results.verifications.get(duplicate_group.group_id, [])
+            existing_files = []
+            for file_id, f in zip(duplicate_group.file_ids, duplicate_group.paths):
+                if file_id in excluded:
+                    continue
+                # One stat per file, so a file deleted while the page renders is simply left out
+                try:
+                    file_info = FileOperations.get_file_info(f)
+                except FileOperationError:
+                    continue
+                existing_files.append((file_id, f, file_info.modified, file_info.size_bytes))
             if len(existing_files) > 1:
-                valid_groups.append(existing_files)
+                valid_groups.append((duplicate_group, existing_files))
         
-        for i, group in enumerate(valid_groups, 1):
-            # Get file times for the group
-            file_times = [(f, FileOperations.get_file_info(f).modified) for f in group]
+        results_key = os.path.basename(results.file_path)
+        for i, (duplicate_group, group) in enumerate(valid_groups, page * config.RESULTS_PAGE_SIZE + 1):
+            verified = results.is_verified(duplicate_group)
+            selectable = is_selectable(results, duplicate_group)
             # Sort by timestamp (oldest first)
-            file_times.sort(key=lambda x: x[1])
+            file_times = sorted(group, key=lambda x: x[2])
             
-            with st.expander(f"Group {i} - {len(group)} files - {get_safe_file_size(group[0]) / 1024:.1f} KB each"):
+            with st.expander(f"Group {i} - {len(group)} files - {duplicate_group.size / 1024:.1f} KB each" + ("" if verified else " - probable")):
+                if not verified and duplicate_group.match == MATCH_METADATA:
+                    st.warning("Probable duplicates: these cloud placeholders matched on size and name only. Verify the group, which downloads their content, before selecting any of them for deletion.")
+                elif not verified:
+                    st.warning("Probable duplicates: these files matched on size and sampled content only.")
+                if not verified:
+                    if st.button("Verify group", key=f"verify_{results_key}_{duplicate_group.group_id}"):
+                        with st.spinner("Comparing full file contents..."):
+                            verify_result_group(duplicate_group, IOGovernor(io_limits))
+                        st.rerun()
+                
                 st.markdown("**Files in this group:**")
                 
                 # Display each file with its timestamp and size
-                for file_path, timestamp in file_times:
-                    file_size = get_safe_file_size(file_path) / 1024  # Convert to KB
-                    is_selected = file_path in st.session_state.selected_files
+                for file_id, file_path, timestamp, file_size in file_times:
+                    file_size = file_size / 1024  # Convert to KB
+                    is_selected = file_id in st.session_state.selected_files
                     
                     # Format the timestamp
                     time_str = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))
@@ -862,15 +954,16 @@ with tab2:
                     if st.checkbox(
                         f"{file_path}\nModified: {time_str} | Size: {file_size:.1f} KB",
                         value=is_selected,
-                        key=f"check_{hash(file_path)}",
-                        help="Select for deletion"
+                        key=f"check_{results_key}_{file_id}",
+                        disabled=not selectable,
+                        help="Select for deletion" if selectable else "Verify the group before selecting its files"
                     ):
-                        st.session_state.selected_files.add(file_path)
+                        st.session_state.selected_files.add(file_id)
                     else:
-                        st.session_state.selected_files.discard(file_path)
+                        st.session_state.selected_files.discard(file_id)
                 
                 st.markdown("---")
-    else:
+    elif st.session_state.scan_job is None:
         st.info("Run a scan to see results here")
 
 # Footer with warning
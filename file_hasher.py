@@ -0,0 +1,188 @@
+import os
+import asyncio
+import logging
+import functools
+import threading
+from collections import defaultdict
+from concurrent.futures import Executor
+from typing import Any, Callable, DefaultDict, Dict, List, Optional, Tuple
+
+import config
+from file_operations import FilePath, FileHash, FileId, FileOperations, FileOperationError
+from path_store import PathStore
+from io_governor import IOGovernor
+from autotuner import ConcurrencyLimiter
+from log_setup import SkipSummary
+
+logger = logging.getLogger(__name__)
+
+
+def verify_group(paths: List[FilePath], governor: Optional[IOGovernor] = None) -> List[int]:
+    """
+    Fully hash the files of a probable duplicate group.
+
+    Args:
+        paths: Paths of the files in the group
+        governor: Optional I/O governor that paces the reads
+
+    Returns:
+        List[int]: Indexes of the files outside the largest set of identical
+        files; every index when no two files share their full content
+    """
+    indexes_by_hash: DefaultDict[FileHash, List[int]] = defaultdict(list)
+    for index, path in enumerate(paths):
+        prefetch = paths[index + 1] if index + 1 < len(paths) else None
+        try:
+            indexes_by_hash[FileOperations.compute_file_hash(path, governor=governor, prefetch=prefetch)].append(index)
+        except FileOperationError as e:
+            logger.warning(f"Could not verify file: {str(e)}")
+
+    matching = max(indexes_by_hash.values(), key=len, default=[])
+    if len(matching) < 2:
+        matching = []
+    return [index for index in range(len(paths)) if index not in matching]
+
+
+def reads_whole(size: int) -> bool:
+    """Whether files of a size are hashed whole in one pass, so their partial hash is their full hash"""
+    return size <= max(config.PARTIAL_HASH_SIZE, config.SMALL_FILE_SIZE)
+
+
+def _mtime_before_read(path: str, size: int) -> Optional[int]:
+    """Modification time of a file about to be hashed, or None if it no longer has the size it was grouped by"""
+    try:
+        stats = os.stat(path)
+    except OSError:
+        return None
+    return stats.st_mtime_ns if stats.st_size == size else None
+
+
+def _hash_small_files(paths: List[str], size: int, governor: IOGovernor, skipped: SkipSummary,
+                      with_mtimes: bool = False) -> List[Tuple[Optional[FileHash], Optional[int]]]:
+    """
+    Hash a batch of small files of one size, each read in a single call, noting those skipped.
+    With `with_mtimes`, each hash comes with the modification time it is valid for.
+    """
+    hashes = []
+    for path in paths:
+        mtime_ns = _mtime_before_read(path, size) if with_mtimes else None
+        try:
+            hashes.append((FileOperations.compute_small_file_hash(path, size, governor=governor), mtime_ns))
+        except FileOperationError as e:
+            skipped.record(path, e)
+            hashes.append((None, None))
+    return hashes
+
+
+class FileHasher:
+    """
+    Hashes scanned files on worker threads, admitted by a tuned concurrency limit.
+
+    Files that cannot be read are noted as skipped and hash to None. When the
+    content catalog is updated, the partial and full digests of each file are
+    kept along with the modification time the file had before it was read.
+    """
+
+    def __init__(self, path_store: PathStore, executor: Executor, governor: IOGovernor, skipped: SkipSummary,
+                 cancel_event: threading.Event, sample_large_files: bool = False,
+                 keep_catalog_hashes: bool = False) -> None:
+        """
+        Create a hasher.
+
+        Args:
+            path_store: Paths of the scanned files
+            executor: Runs the blocking reads
+            governor: I/O governor that paces the reads
+            skipped: Notes the files that could not be read
+            cancel_event: Set when the scan is cancelled
+            sample_large_files: Hash files above MAX_FILE_SIZE from samples only
+            keep_catalog_hashes: Keep content digests for the content catalog
+        """
+        self.path_store = path_store
+        self.executor = executor
+        self._governor = governor
+        self._skipped = skipped
+        self._cancel_event = cancel_event
+        self._sample_large_files = sample_large_files
+        self._keep_catalog_hashes = keep_catalog_hashes
+        # Admits hashing workers; each pipeline sets a fresh limiter from the hash tuner
+        self.limit: Optional[ConcurrencyLimiter] = None
+        # [modification time, partial digest, full digest] of each hashed file
+        self.catalog_hashes: Dict[FileId, List[Any]] = {}
+
+    def sampled(self, size: int) -> bool:
+        """Whether files of a size are matched on sampled content"""
+        # Very large files can be matched on sampled content and verified later on demand
+        return self._sample_large_files and size > config.MAX_FILE_SIZE
+
+    def _hash_and_mtime(self, hash_function: Callable[[], FileHash], filepath: str,
+                        size: int) -> Tuple[FileHash, Optional[int]]:
+        """Hash a file, along with its modification time before the read when catalog digests are kept"""
+        mtime_ns = _mtime_before_read(filepath, size) if self._keep_catalog_hashes else None
+        return hash_function(), mtime_ns
+
+    async def _file_hash(self, hash_function: Callable[..., FileHash], size: int, file_id: FileId,
+                         *args: Any, full: Optional[bool] = None, **kwargs: Any) -> Optional[FileHash]:
+        """
+        Hash a file on the executor, skipping files that cannot be read. Content hashes
+        are kept for the catalog as full digests, or partial ones when `full` is False.
+        """
+        filepath = self.path_store.path(file_id)
+        hash_function = functools.partial(hash_function, filepath, *args, governor=self._governor, **kwargs)
+        try:
+            async with self.limit:
+                file_hash, mtime_ns = await asyncio.get_running_loop().run_in_executor(
+                    self.executor, self._hash_and_mtime, hash_function, filepath, size
+                )
+        except FileOperationError as e:
+            self._skipped.record(filepath, e)
+            return None
+        if full is not None:
+            self._keep_catalog_hash(file_id, size, mtime_ns, file_hash, full)
+        return file_hash
+
+    def _keep_catalog_hash(self, file_id: FileId, size: int, mtime_ns: Optional[int], file_hash: FileHash,
+                           full: bool) -> None:
+        """Keep a digest for the content catalog, along with the modification time it is valid for"""
+        if mtime_ns is None:
+            return
+        known = self.catalog_hashes.get(file_id)
+        if known is None or known[0] != mtime_ns:
+            known = self.catalog_hashes[file_id] = [mtime_ns, None, None]
+        # Files no larger than the partial hash are hashed whole by both
+        if not full or size <= config.PARTIAL_HASH_SIZE:
+            known[1] = file_hash
+        if full:
+            known[2] = file_hash
+
+    async def partial_hash(self, size: int, file_id: FileId) -> Optional[FileHash]:
+        """Hash the leading bytes of a file, which is its full content for small files"""
+        if reads_whole(size):
+            return await self._file_hash(FileOperations.compute_small_file_hash, size, file_id, size, full=True)
+        return await self._file_hash(FileOperations.compute_partial_hash, size, file_id, full=False)
+
+    async def small_file_hashes(self, size: int, file_ids: List[FileId]) -> List[Optional[FileHash]]:
+        """Hash small files in batches, each batch read in one worker round-trip"""
+        loop = asyncio.get_running_loop()
+        hashes: List[Optional[FileHash]] = []
+        for start in range(0, len(file_ids), config.SMALL_FILE_BATCH_SIZE):
+            if self._cancel_event.is_set():
+                break
+            batch = file_ids[start:start + config.SMALL_FILE_BATCH_SIZE]
+            async with self.limit:
+                results = await loop.run_in_executor(
+                    self.executor, _hash_small_files, self.path_store.paths(batch), size, self._governor,
+                    self._skipped, self._keep_catalog_hashes
+                )
+            for file_id, (file_hash, mtime_ns) in zip(batch, results):
+                if file_hash is not None:
+                    self._keep_catalog_hash(file_id, size, mtime_ns, file_hash, full=True)
+                hashes.append(file_hash)
+        return hashes
+
+    async def full_hash(self, size: int, file_id: FileId, next_file_id: Optional[FileId] = None) -> Optional[FileHash]:
+        """Hash the full content of a file, or its samples in fast mode, reading ahead the file hashed next"""
+        if self.sampled(size):
+            return await self._file_hash(FileOperations.compute_sampled_hash, size, file_id, size)
+        prefetch = self.path_store.path(next_file_id) if next_file_id is not None else None
+        return await self._file_hash(FileOperations.compute_file_hash, size, file_id, prefetch=prefetch, full=True)
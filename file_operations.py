@@ -0,0 +1,411 @@
+import os
+import stat
+import errno
+import hashlib
+import logging
+from pathlib import Path
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import config
+import page_cache
+from io_governor import IOGovernor
+from path_classifier import classifier
+
+# Custom type hints
+FilePath = str | Path
+FileSize = int
+FileHash = str
+FileId = int
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class FileInfo:
+    """Information about a file"""
+    size_bytes: int
+    is_hidden: bool
+    modified: float  # Add modified timestamp field
+    hash: Optional[str] = None
+    resident: bool = True  # False for cloud placeholders whose content is not stored locally
+
+# Custom exceptions
+class FileOperationError(Exception):
+    """Base class for file operation errors"""
+    pass
+
+class FileNotFoundError(FileOperationError):
+    """Raised when a file is not found"""
+    pass
+
+class PermissionError(FileOperationError):
+    """Raised when permission is denied"""
+    pass
+
+class CloudStorageError(FileOperationError):
+    """Raised when there are cloud storage related issues"""
+    pass
+
+class FileOperations:
+    """Class for handling file operations"""
+    
+    @staticmethod
+    def dedupe_directory(directory: FilePath, original: FilePath, link: bool = False,
+                         governor: Optional[IOGovernor] = None) -> Tuple[int, List[str]]:
+        """
+        Remove a duplicate directory tree, or replace its files with hard links to the original.
+
+        Only regular files whose counterpart in the original tree is a distinct
+        regular file with the same content are touched, so anything added to or
+        changed in the copy since the scan, and links into the original, are left
+        in place along with the directories that hold them.
+
+        Args:
+            directory: Root of the duplicate tree
+            original: Root of the identical tree that is kept
+            link: Replace files with hard links instead of deleting the tree
+            governor: Optional I/O governor that paces the file operations
+
+        Returns:
+            Tuple[int, List[str]]: Number of files removed or linked, and errors for those that failed
+
+        Raises:
+            FileOperationError: If the trees can't safely be deduplicated
+        """
+        directory, original = os.path.abspath(directory), os.path.abspath(original)
+        for path in (directory, original):
+            if not os.path.isdir(path):
+                raise FileNotFoundError(f"Directory not found: {path}")
+        if CloudStorage.is_sensitive_directory(directory):
+            raise FileOperationError(f"Directory {directory} failed safety checks")
+        # Resolved paths catch trees that overlap through symlinked directories
+        real_directory, real_original = (os.path.normcase(os.path.realpath(path)) for path in (directory, original))
+        common = os.path.commonpath([real_directory, real_original])
+        if common in (real_directory, real_original):
+            raise FileOperationError(f"Directories {directory} and {original} overlap")
+        if link and os.stat(directory).st_dev != os.stat(original).st_dev:
+            raise FileOperationError(f"Can't hard link across volumes: {directory} and {original}")
+
+        count, errors = 0, []
+        for root, _, files in os.walk(directory, topdown=False):
+            relative = os.path.relpath(root, directory)
+            for name in files:
+                path = os.path.join(root, name)
+                counterpart = os.path.normpath(os.path.join(original, relative, name))
+                try:
+                    stats = os.lstat(path)
+                    try:
+                        original_stats = os.lstat(counterpart)
+                    except OSError as e:
+                        # Files without a counterpart, such as empty files the scan never compared, are kept
+                        if e.errno in (errno.ENOENT, errno.ENOTDIR):
+                            continue
+                        raise
+                    if not stat.S_ISREG(stats.st_mode) or not stat.S_ISREG(original_stats.st_mode):
+                        continue
+                    # Removing or relinking the original's own file would lose its only copy
+                    if stats.st_size != original_stats.st_size or os.path.samestat(stats, original_stats):
+                        continue
+                    # Either file may have been edited since the scan without changing size
+                    if not FileOperations.same_content(path, counterpart, governor=governor):
+                        continue
+                    if link:
+                        # Link under a temporary name first so the file is never missing
+                        temp_path = path + '.dedupe-tmp'
+                        os.link(counterpart, temp_path)
+                        os.replace(temp_path, path)
+                    else:
+                        os.remove(path)
+                    count += 1
+                except OSError as e:
+                    errors.append(f"Error {'linking' if link else 'deleting'} {path}: {str(e)}")
+            if not link:
+                try:
+                    # Fails, leaving the directory, if anything was kept inside it
+                    os.rmdir(root)
+                except OSError:
+                    pass
+        return count, errors
+
+    @staticmethod
+    def same_content(file_path: FilePath, other_path: FilePath, chunk_size: int = config.CHUNK_SIZE,
+                     governor: Optional[IOGovernor] = None) -> bool:
+        """
+        Compare the content of two files of the same size byte by byte.
+        
+        Args:
+            file_path: Path to the first file
+            other_path: Path to the second file
+            chunk_size: Size of chunks to compare
+            governor: Optional I/O governor that paces the reads
+            
+        Returns:
+            bool: True if both files hold the same bytes
+            
+        Raises:
+            OSError: If either file can't be read
+        """
+        if governor is not None:
+            governor.before_file()
+        with page_cache.open_for_scan(str(file_path)) as f, page_cache.open_for_scan(str(other_path)) as other:
+            read = f.read if governor is None else lambda size: governor.read(f, size)
+            read_other = other.read if governor is None else lambda size: governor.read(other, size)
+            # Files of one size are opened the same way, so equal content comes back in equal chunks
+            while True:
+                chunk = read(chunk_size)
+                if chunk != read_other(chunk_size):
+                    return False
+                if not chunk:
+                    return True
+
+    @staticmethod
+    def get_file_info(file_path: FilePath) -> FileInfo:
+        """
+        Get information about a file.
+        
+        Args:
+            file_path: Path to the file
+            
+        Returns:
+            FileInfo: Information about the file
+            
+        Raises:
+            FileOperationError: If there are issues getting file information
+        """
+        try:
+            path = Path(file_path)
+            stats = path.stat()
+            
+            return FileInfo(
+                size_bytes=stats.st_size,
+                is_hidden=bool(path.name.startswith('.') or 
+                             bool(stats.st_file_attributes & 0x2) if os.name == 'nt' else False),
+                modified=stats.st_ctime,
+                hash=None,  # Hash is computed separately when needed
+                resident=FileOperations.is_resident(file_path, stats)
+            )
+            
+        except Exception as e:
+            raise FileOperationError(f"Error getting file info: {str(e)}")
+
+    @staticmethod
+    def is_resident(file_path: FilePath, stats: os.stat_result) -> bool:
+        """
+        Check whether a file's content is stored locally without reading it.
+        
+        Cloud placeholders report their full size but reading them downloads
+        the content. They are recognised by placeholder attributes where the
+        platform exposes them, or by having almost no allocated blocks while
+        SEEK_DATA still reports data (a local sparse file reports holes).
+        
+        Args:
+            file_path: Path to the file
+            stats: Result of stat on the file
+            
+        Returns:
+            bool: False if the file is a placeholder for remote content
+        """
+        if getattr(stats, 'st_file_attributes', 0) & config.PLACEHOLDER_FILE_ATTRIBUTES:
+            return False
+        if getattr(stats, 'st_flags', 0) & config.PLACEHOLDER_FILE_FLAGS:
+            return False
+        
+        blocks = getattr(stats, 'st_blocks', None)
+        if blocks is None or stats.st_size < config.PLACEHOLDER_MIN_SIZE:
+            return True
+        allocated = blocks * 512
+        if allocated >= stats.st_size * config.PLACEHOLDER_MAX_ALLOCATED_RATIO:
+            return True
+        
+        data_bytes = FileOperations._data_bytes(file_path, stats.st_size)
+        return data_bytes is not None and allocated >= data_bytes * config.PLACEHOLDER_MAX_ALLOCATED_RATIO
+
+    @staticmethod
+    def _data_bytes(file_path: FilePath, file_size: int) -> Optional[int]:
+        """Sum the data regions of a file with SEEK_DATA/SEEK_HOLE, or None if unsupported"""
+        if not hasattr(os, 'SEEK_DATA'):
+            return None
+        try:
+            fd = os.open(file_path, os.O_RDONLY)
+        except OSError:
+            return None
+        try:
+            data_bytes = offset = 0
+            while offset < file_size:
+                try:
+                    start = os.lseek(fd, offset, os.SEEK_DATA)
+                except OSError as e:
+                    if e.errno == errno.ENXIO:  # No data past offset
+                        break
+                    return None
+                offset = os.lseek(fd, start, os.SEEK_HOLE)
+                data_bytes += offset - start
+            return data_bytes
+        except OSError:
+            return None
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def compute_file_hash(file_path: FilePath, chunk_size: int = 8192,
+                          governor: Optional[IOGovernor] = None,
+                          prefetch: Optional[FilePath] = None) -> FileHash:
+        """
+        Compute the SHA-256 hash of a file.
+        
+        Args:
+            file_path: Path to the file
+            chunk_size: Size of chunks to read, defaults to 8KB
+            governor: Optional I/O governor that paces the reads
+            prefetch: File that will be hashed next, read ahead while this one is hashed
+            
+        Returns:
+            str: Hex digest of the file hash
+            
+        Raises:
+            FileOperationError: If there are issues computing the hash
+        """
+        try:
+            hasher = hashlib.sha256()
+            
+            if governor is not None:
+                governor.before_file()
+            if prefetch is not None:
+                page_cache.prefetch(str(prefetch))
+                
+            with page_cache.open_for_scan(str(file_path)) as f:
+                read = f.read if governor is None else lambda size: governor.read(f, size)
+                while chunk := read(chunk_size):
+                    hasher.update(chunk)
+                    
+            return hasher.hexdigest()
+            
+        except Exception as e:
+            raise FileOperationError(f"Error computing file hash: {str(e)}")
+
+    @staticmethod
+    def compute_small_file_hash(file_path: FilePath, size: int,
+                                governor: Optional[IOGovernor] = None) -> FileHash:
+        """
+        Compute the SHA-256 hash of a small file read in a single call.
+        
+        Args:
+            file_path: Path to the file
+            size: Expected size of the file
+            governor: Optional I/O governor that paces the read
+            
+        Returns:
+            str: Hex digest of the file hash
+            
+        Raises:
+            FileOperationError: If there are issues reading the file, or its size has changed
+        """
+        try:
+            if governor is not None:
+                governor.before_file()
+                
+            with page_cache.open_for_scan(str(file_path)) as f:
+                # One byte more than expected shows whether the file has grown
+                data = f.read(size + 1) if governor is None else governor.read(f, size + 1)
+        except Exception as e:
+            raise FileOperationError(f"Error computing file hash: {str(e)}")
+        if len(data) != size:
+            raise FileOperationError(f"File changed size while scanning: {file_path}")
+        return hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def compute_partial_hash(file_path: FilePath, length: int = config.PARTIAL_HASH_SIZE,
+                             governor: Optional[IOGovernor] = None) -> FileHash:
+        """
+        Compute a SHA-256 hash of the first bytes of a file.
+        
+        Args:
+            file_path: Path to the file
+            length: Number of leading bytes to hash
+            governor: Optional I/O governor that paces the read
+            
+        Returns:
+            str: Hex digest of the leading bytes
+            
+        Raises:
+            FileOperationError: If there are issues computing the hash
+        """
+        try:
+            if governor is not None:
+                governor.before_file()
+                
+            with page_cache.open_for_scan(str(file_path), whole=False) as f:
+                data = f.read(length) if governor is None else governor.read(f, length)
+            return hashlib.sha256(data).hexdigest()
+            
+        except Exception as e:
+            raise FileOperationError(f"Error computing partial file hash: {str(e)}")
+
+    @staticmethod
+    def compute_sampled_hash(file_path: FilePath, file_size: int, sample_count: int = config.SAMPLE_COUNT,
+                             block_size: int = config.SAMPLE_BLOCK_SIZE,
+                             governor: Optional[IOGovernor] = None) -> FileHash:
+        """
+        Compute a SHA-256 hash of a file's size and evenly spaced sample blocks.
+        
+        Matching sampled hashes only make files probable duplicates; a full
+        hash is needed to confirm them.
+        
+        Args:
+            file_path: Path to the file
+            file_size: Size of the file in bytes
+            sample_count: Number of blocks to sample
+            block_size: Size of each sample block
+            governor: Optional I/O governor that paces the reads
+            
+        Returns:
+            str: Hex digest of the sampled hash
+            
+        Raises:
+            FileOperationError: If there are issues computing the hash
+        """
+        try:
+            hasher = hashlib.sha256(str(file_size).encode())
+            last_offset = max(file_size - block_size, 0)
+            
+            if governor is not None:
+                governor.before_file()
+                
+            with page_cache.open_for_scan(str(file_path), whole=False) as f:
+                read = f.read if governor is None else lambda size: governor.read(f, size)
+                for index in range(sample_count):
+                    f.seek(last_offset * index // max(sample_count - 1, 1))
+                    hasher.update(read(block_size))
+                    
+            return hasher.hexdigest()
+            
+        except Exception as e:
+            raise FileOperationError(f"Error computing sampled file hash: {str(e)}")
+
+class CloudStorage:
+    """Handles cloud storage detection and warnings"""
+    
+    @staticmethod
+    def detect(path: FilePath) -> Optional[str]:
+        """Detect if a path is within a cloud storage directory"""
+        try:
+            return classifier.classify_directory(str(path)).cloud_provider
+        except Exception as e:
+            logger.error(f"Error detecting cloud storage for {path}: {str(e)}")
+            return None
+
+    @staticmethod
+    def get_warning(path: FilePath) -> Optional[str]:
+        """Get cloud storage warning if applicable"""
+        cloud_service = CloudStorage.detect(path)
+        if cloud_service:
+            return config.CLOUD_WARNINGS.get(cloud_service.lower(), f"Warning: This path is in {cloud_service}")
+        return None
+
+    @staticmethod
+    def is_sensitive_directory(path: FilePath) -> bool:
+        """Check if the path is in a sensitive system directory."""
+        try:
+            return classifier.classify_directory(str(Path(path).resolve())).sensitive
+        except Exception:
+            return True  # If we can't resolve the path, treat it as sensitive
@@ -0,0 +1,246 @@
+import os
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Coroutine, DefaultDict, Dict, List, Optional, Set, Tuple
+
+import config
+from file_operations import FileHash, FileId
+from file_hasher import FileHasher, reads_whole
+from group_output import GroupOutput
+from size_grouping import SizeGrouper
+from results_store import MATCH_CONTENT, MATCH_METADATA, MATCH_SAMPLED
+from progress_reporter import ProgressReporter
+from scan_pipeline import queue_pairs, run_stages
+
+logger = logging.getLogger(__name__)
+
+# Receives each confirmed group: file size, digest, file ids and match kind
+EmitGroup = Callable[[int, FileHash, List[FileId], str], None]
+
+
+class GroupHasher:
+    """
+    Resolves size groups into groups of identical files by partial and then full hashes.
+
+    Files can be hashed early, while the walk is still finding files, once
+    another file shares their size; those hashes are used when the size groups
+    are final. Completed sizes and the full hashes of groups in progress are
+    checkpointed, so a resumed scan skips the work already done.
+    """
+
+    def __init__(self, hasher: FileHasher, output: GroupOutput, progress: ProgressReporter,
+                 cancel_event: threading.Event, checkpoint_if_due: Callable[[], None]) -> None:
+        """
+        Create a group hasher.
+
+        Args:
+            hasher: Hashes the scanned files
+            output: Confirmed groups so far, which decide whether a group can still enter the top K
+            progress: Tracks the candidate bytes resolved
+            cancel_event: Set when the scan is cancelled
+            checkpoint_if_due: Saves a checkpoint of hashing progress if one is due
+        """
+        self._hasher = hasher
+        self._output = output
+        self._progress = progress
+        self._cancel_event = cancel_event
+        self._checkpoint_if_due = checkpoint_if_due
+        self.completed_sizes: Set[int] = set()
+        self.completed_metadata_sizes: Set[int] = set()
+        self.bucket_hashes: Dict[FileId, FileHash] = {}
+        # Hashes computed while walking, before their size groups are final
+        self._early_hashes: Optional[asyncio.Queue] = None
+        self._first_of_size: Dict[int, Optional[FileId]] = {}
+        self._first_of_partial: Dict[Tuple[int, FileHash], Optional[FileId]] = {}
+        self._early_partial_hashes: Dict[FileId, FileHash] = {}
+        self._early_full_hashes: Dict[FileId, FileHash] = {}
+
+    def restore(self, state: Dict[str, Any]) -> None:
+        """Continue from checkpointed hashing progress"""
+        self.completed_sizes = state['completed_sizes']
+        self.completed_metadata_sizes = state.get('completed_metadata_sizes', set())
+        self.bucket_hashes = state['bucket_hashes']
+
+    def state(self) -> Dict[str, Any]:
+        """Return the hashing progress to checkpoint"""
+        return {
+            'completed_sizes': self.completed_sizes,
+            'completed_metadata_sizes': self.completed_metadata_sizes,
+            'bucket_hashes': self.bucket_hashes,
+        }
+
+    @property
+    def cancelled(self) -> bool:
+        """Whether the scan was cancelled"""
+        return self._cancel_event.is_set()
+
+    def early_hash_stages(self) -> List[Coroutine]:
+        """Return the stages that hash the files passed to queue_early_hash() while the walk runs"""
+        self._early_hashes = asyncio.Queue(config.SCAN_QUEUE_SIZE)
+        return [self._early_hash_stage(self._early_hashes) for _ in range(config.SCAN_MAX_HASH_WORKERS)]
+
+    def queue_early_hash(self, size: int, file_id: FileId) -> None:
+        """Hash a file found by the walk once another file of its size turns up"""
+        if len(self._early_partial_hashes) < config.EARLY_HASH_MAX_FILES:
+            queue_pairs(self._first_of_size, size, file_id, self._early_hashes, size, full=False)
+
+    def end_early_hashing(self) -> None:
+        """Stop hashing files early once the walk ends"""
+        # Early hashes of groups that never reached a second member are not needed
+        self._first_of_size = {}
+        self._first_of_partial = {}
+        self._early_hashes = None
+
+    async def _early_hash_stage(self, early_hashes: asyncio.Queue) -> None:
+        """
+        Hash files while the walk continues.
+
+        Files are partially hashed once another file of their size appears,
+        and fully hashed once another file also shares their partial hash.
+        Both are needed however many more files of that size are found.
+        """
+        while True:
+            size, file_id, full = await early_hashes.get()
+            if full:
+                file_hash = await self._hasher.full_hash(size, file_id)
+                if file_hash is not None:
+                    self._early_full_hashes[file_id] = file_hash
+                continue
+
+            partial_hash = await self._hasher.partial_hash(size, file_id)
+            if partial_hash is None:
+                continue
+            self._early_partial_hashes[file_id] = partial_hash
+            # Files that are read whole need no second pass
+            if not reads_whole(size):
+                queue_pairs(self._first_of_partial, (size, partial_hash), file_id, early_hashes, size, full=True)
+
+    async def run(self, files_by_size: SizeGrouper, emit: EmitGroup, stages: List[Coroutine]) -> None:
+        """Resolve size groups concurrently, most potentially reclaimable bytes first, alongside further stages"""
+        buckets: asyncio.Queue = asyncio.Queue(config.SCAN_QUEUE_SIZE)
+        bucket_stages = [self._bucket_hash_stage(buckets, emit) for _ in range(config.SCAN_MAX_HASH_WORKERS)]
+        await run_stages(self._candidate_stage(files_by_size, buckets), bucket_stages + stages)
+
+    async def _candidate_stage(self, files_by_size: SizeGrouper, buckets: asyncio.Queue) -> None:
+        """Read candidate size groups, which may be merged from disk, and queue them for hashing"""
+        loop = asyncio.get_running_loop()
+        # Unique sizes are never yielded, so the most valuable groups are confirmed early
+        candidates = files_by_size.iter_candidates(most_reclaimable_first=True)
+        try:
+            while not self.cancelled:
+                candidate = await loop.run_in_executor(self._hasher.executor, next, candidates, None)
+                if candidate is None:
+                    break
+                if self._progress.total_bytes is None:
+                    self._progress.set_total(files_by_size.candidate_bytes)
+                size, size_group = candidate
+                if self._output.outranked(size, len(size_group)):
+                    # Groups come most reclaimable first, so no later group can enter the top K either
+                    logger.info(f"Top {self._output.top_k} groups found; skipping the remaining size groups")
+                    break
+                if size in self.completed_sizes:
+                    self._progress.advance(size * len(size_group))
+                else:
+                    await buckets.put(candidate)
+            await buckets.join()
+        finally:
+            candidates.close()
+
+    async def _bucket_hash_stage(self, buckets: asyncio.Queue, emit: EmitGroup) -> None:
+        """Resolve queued size groups one at a time"""
+        while True:
+            size, size_group = await buckets.get()
+            try:
+                await self._hash_bucket(emit, size, size_group)
+            finally:
+                buckets.task_done()
+
+    async def _hash_bucket(self, emit: EmitGroup, size: int, size_group: List[FileId]) -> None:
+        """Resolve one size group by partial and then full hashes, and emit its duplicate groups"""
+        # Groups found since this one was queued may have raised the bar
+        if self._output.outranked(size, len(size_group)):
+            self._progress.advance(size * len(size_group))
+            return
+        # Identical files always share a size, so each size group is resolved on its own
+        files_by_partial_hash: DefaultDict[FileHash, List[FileId]] = defaultdict(list)
+        pending = []
+        for file_id in size_group:
+            partial_hash = self._early_partial_hashes.pop(file_id, None)
+            if partial_hash is None:
+                pending.append(file_id)
+            else:
+                files_by_partial_hash[partial_hash].append(file_id)
+
+        if reads_whole(size):
+            # Small files are read whole, a batch at a time, so their first hash is final
+            partial_hashes = await self._hasher.small_file_hashes(size, pending)
+            if self.cancelled:
+                return
+        else:
+            partial_hashes = []
+            for file_id in pending:
+                if self.cancelled:
+                    return
+                partial_hashes.append(await self._hasher.partial_hash(size, file_id))
+        for file_id, partial_hash in zip(pending, partial_hashes):
+            if partial_hash is None:
+                self._progress.advance(size, file_id)
+            else:
+                files_by_partial_hash[partial_hash].append(file_id)
+
+        files_by_hash: DefaultDict[FileHash, List[FileId]] = defaultdict(list)
+        for partial_hash, partial_group in files_by_partial_hash.items():
+            # A unique partial hash rules a file out without reading the rest of it
+            if len(partial_group) < 2:
+                self._progress.advance(size, partial_group[0])
+                continue
+            if self._output.outranked(size, len(partial_group)):
+                self._progress.advance(size * len(partial_group))
+                continue
+            for index, file_id in enumerate(partial_group):
+                if self.cancelled:
+                    return
+                self._checkpoint_if_due()
+
+                file_hash = self.bucket_hashes.get(file_id) or self._early_full_hashes.pop(file_id, None)
+                if file_hash is None:
+                    if reads_whole(size):
+                        file_hash = partial_hash
+                    else:
+                        next_file_id = partial_group[index + 1] if index + 1 < len(partial_group) else None
+                        file_hash = await self._hasher.full_hash(size, file_id, next_file_id)
+                self._progress.advance(size, file_id)
+                if file_hash is None:
+                    continue
+                self.bucket_hashes[file_id] = file_hash
+                files_by_hash[file_hash].append(file_id)
+
+        match = MATCH_SAMPLED if self._hasher.sampled(size) else MATCH_CONTENT
+        for file_hash, group in files_by_hash.items():
+            if len(group) > 1:
+                emit(size, file_hash, group, match)
+        self.completed_sizes.add(size)
+        for file_id in size_group:
+            self.bucket_hashes.pop(file_id, None)
+            self._early_full_hashes.pop(file_id, None)
+
+    def group_placeholders(self, placeholders: SizeGrouper, emit: EmitGroup) -> None:
+        """Group placeholder files by size and name, without reading their content"""
+        for size, size_group in placeholders.iter_candidates(most_reclaimable_first=True):
+            if self.cancelled or self._output.outranked(size, len(size_group)):
+                break
+            if size in self.completed_metadata_sizes:
+                continue
+
+            files_by_name: DefaultDict[str, List[FileId]] = defaultdict(list)
+            for file_id in size_group:
+                files_by_name[os.path.normcase(self._hasher.path_store.file_name(file_id))].append(file_id)
+
+            for name, group in files_by_name.items():
+                if len(group) > 1:
+                    digest = hashlib.sha256(f"{size}:{name}".encode('utf-8', 'surrogatepass')).hexdigest()
+                    emit(size, digest, group, MATCH_METADATA)
+            self.completed_metadata_sizes.add(size)
@@ -0,0 +1,133 @@
+import heapq
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+import config
+from file_operations import FileHash, FileId
+from path_store import PathStore
+from results_store import MATCH_CONTENT, ResultsWriter
+
+
+@dataclass
+class LiveGroup:
+    """Summary of a confirmed duplicate group, published while the scan runs"""
+    group_id: int
+    size: int
+    count: int
+    first_path: str
+    match: str = MATCH_CONTENT
+
+    @property
+    def verified(self) -> bool:
+        """Whether the group was matched on its full content"""
+        return self.match == MATCH_CONTENT
+
+    @property
+    def reclaimable_bytes(self) -> int:
+        """Bytes freed by keeping a single copy of the group"""
+        return self.size * (self.count - 1)
+
+
+class GroupOutput:
+    """
+    Collects the confirmed duplicate groups of a scan.
+
+    Groups are written to the results file and the most valuable ones are
+    published to readers on other threads as they are found. In top-K mode
+    only the K groups reclaiming the most space are kept, and they are
+    written once hashing ends.
+    """
+
+    def __init__(self, top_k: int = 0) -> None:
+        """
+        Create an empty collection.
+
+        Args:
+            top_k: Keep only this many groups, those reclaiming the most space; 0 keeps every group
+        """
+        self.top_k = top_k
+        self.num_groups = 0
+        self.reclaimable_bytes = 0
+        self._lock = threading.Lock()
+        # Min-heap of the most valuable groups, keyed by reclaimable bytes
+        self._live_groups: List[Tuple[int, int, LiveGroup]] = []
+        self._groups_found = 0
+        # In top-K mode, min-heap of (reclaimable bytes, -order found, size, hash, file ids, match) of the
+        # groups kept so far
+        self._top_groups: List[Tuple[int, int, int, FileHash, List[FileId], str]] = []
+        # Size and full digest of every file in a content group, rolled up into directory digests
+        self.content_digests: Dict[FileId, Tuple[int, FileHash]] = {}
+
+    def live_groups(self) -> List[LiveGroup]:
+        """Return the groups confirmed so far, most reclaimable first."""
+        with self._lock:
+            groups = [group for _, _, group in self._live_groups]
+        groups.sort(key=lambda group: group.reclaimable_bytes, reverse=True)
+        # Groups evicted from the top K may still be among the live ones
+        return groups[:self.top_k] if self.top_k else groups
+
+    def _publish(self, group: LiveGroup) -> None:
+        """Make a confirmed group visible to readers, keeping only the most valuable ones"""
+        entry = (group.reclaimable_bytes, group.group_id, group)
+        with self._lock:
+            self.num_groups += 1
+            self.reclaimable_bytes += group.reclaimable_bytes
+            if len(self._live_groups) < config.LIVE_RESULTS_LIMIT:
+                heapq.heappush(self._live_groups, entry)
+            else:
+                heapq.heappushpop(self._live_groups, entry)
+
+    def add(self, results_writer: ResultsWriter, size: int, file_hash: FileHash, group: List[FileId],
+            paths: List[str], match: str) -> None:
+        """Add a confirmed group, its files in selection order, writing it now unless in top-K mode"""
+        if self.top_k:
+            self._keep_top_group(size, file_hash, group, paths[0], match)
+        else:
+            self._write_group(results_writer, size, file_hash, group, paths, match)
+
+    def _write_group(self, results_writer: ResultsWriter, size: int, file_hash: FileHash,
+                     group: List[FileId], paths: List[str], match: str) -> None:
+        """Write a group to the results file and publish it"""
+        results_writer.add_group(size, file_hash, paths, match)
+        if not self.top_k:
+            self._publish(LiveGroup(self._groups_found, size, len(paths), paths[0], match))
+            self._groups_found += 1
+        if match == MATCH_CONTENT:
+            for file_id in group:
+                self.content_digests[file_id] = (size, file_hash)
+
+    def outranked(self, size: int, count: int) -> bool:
+        """Whether a group of `count` files of a size could not enter the top K groups kept so far"""
+        if not self.top_k or len(self._top_groups) < self.top_k:
+            return False
+        # Ties go to the group found first
+        return size * (count - 1) <= self._top_groups[0][0]
+
+    def _keep_top_group(self, size: int, file_hash: FileHash, group: List[FileId], first_path: str,
+                        match: str) -> None:
+        """Keep a group if it is among the top K found so far, evicting the least reclaimable one"""
+        live_group = LiveGroup(self._groups_found, size, len(group), first_path, match)
+        self._groups_found += 1
+        entry = (live_group.reclaimable_bytes, -live_group.group_id, size, file_hash, group, match)
+        evicted = None
+        if len(self._top_groups) < self.top_k:
+            heapq.heappush(self._top_groups, entry)
+        else:
+            evicted = heapq.heappushpop(self._top_groups, entry)
+            if evicted is entry:
+                return
+        self._publish(live_group)
+        if evicted is not None:
+            with self._lock:
+                self.num_groups -= 1
+                self.reclaimable_bytes -= evicted[0]
+
+    def write_top_groups(self, results_writer: ResultsWriter, path_store: PathStore) -> None:
+        """Write the groups kept in top-K mode, most reclaimable first"""
+        for _, _, size, file_hash, group, match in sorted(self._top_groups, reverse=True):
+            self._write_group(results_writer, size, file_hash, group, path_store.paths(group), match)
+        self._top_groups = []
+        with self._lock:
+            self.num_groups = results_writer.num_groups
+            self.reclaimable_bytes = results_writer.reclaimable_bytes
@@ -0,0 +1,251 @@
+import os
+import sys
+import time
+import ctypes
+import logging
+import platform
+import threading
+import statistics
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, List, Optional
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# ioprio_set syscall numbers by machine architecture (Linux)
+IOPRIO_SET_SYSCALLS = {
+    'x86_64': 251,
+    'amd64': 251,
+    'i386': 289,
+    'i686': 289,
+    'aarch64': 30,
+    'arm64': 30,
+    'armv7l': 314,
+}
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_IDLE = 3
+IOPRIO_CLASS_SHIFT = 13
+
+# Windows background processing mode for the calling thread
+THREAD_MODE_BACKGROUND_BEGIN = 0x00010000
+
+# macOS throttled disk I/O policy for the calling thread
+IOPOL_TYPE_DISK = 0
+IOPOL_SCOPE_THREAD = 1
+IOPOL_THROTTLE = 3
+
+
+@dataclass
+class IOLimits:
+    """I/O limits applied to scan and delete operations"""
+    bytes_per_second: float = config.IO_MAX_BYTES_PER_SECOND  # 0 for unlimited
+    files_per_second: float = config.IO_MAX_FILES_PER_SECOND  # 0 for unlimited
+    low_priority: bool = config.IO_LOW_PRIORITY
+    adaptive_backoff: bool = config.IO_ADAPTIVE_BACKOFF
+
+
+class TokenBucket:
+    """Token bucket rate limiter that lets callers borrow against future tokens"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None) -> None:
+        """
+        Create a full bucket.
+
+        Args:
+            rate: Tokens added per second
+            capacity: Maximum burst size, defaults to one second worth of tokens
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def delay_for(self, amount: float) -> float:
+        """
+        Take tokens from the bucket.
+
+        Args:
+            amount: Number of tokens to take
+
+        Returns:
+            float: Seconds the caller must wait before using them
+        """
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= amount
+        return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+
+class _ThreadCounters:
+    """I/O counted by one thread, so reads without limits need no lock"""
+    __slots__ = ('bytes_read', 'files_opened', 'sample_seconds', 'sample_bytes')
+
+    def __init__(self) -> None:
+        self.bytes_read = 0
+        self.files_opened = 0
+        # Reads of the latency sample in progress
+        self.sample_seconds = 0.0
+        self.sample_bytes = 0
+
+
+class IOGovernor:
+    """
+    Paces file operations to stay within configured I/O limits.
+
+    Bytes and files per second are capped with token buckets. With adaptive
+    backoff enabled, the read time per byte is sampled over every
+    IO_LATENCY_SAMPLE_BYTES read by a thread, so read-ahead hits and the odd
+    disk read average out, and reads are slowed down while recent samples are
+    well above the median of a window of past samples. A governor may be
+    shared by threads; waits happen outside its lock, and reads without any
+    limit never take it.
+    """
+
+    def __init__(self, limits: IOLimits, cancel_event: Optional[threading.Event] = None) -> None:
+        """
+        Create a governor.
+
+        Args:
+            limits: Limits to enforce
+            cancel_event: Event that interrupts any wait when set
+        """
+        self.limits = limits
+        self._cancel_event = cancel_event or threading.Event()
+        self._bytes = TokenBucket(limits.bytes_per_second) if limits.bytes_per_second > 0 else None
+        self._files = TokenBucket(limits.files_per_second) if limits.files_per_second > 0 else None
+        self._unlimited = self._bytes is None and not limits.adaptive_backoff
+        self._samples: Deque[float] = deque(maxlen=config.IO_LATENCY_WINDOW)
+        self.slowdown = 1.0
+        self._local = threading.local()
+        self._counters: List[_ThreadCounters] = []
+        self._lock = threading.Lock()
+
+    @property
+    def bytes_read(self) -> int:
+        """Bytes read through the governor by every thread"""
+        return sum(counters.bytes_read for counters in list(self._counters))
+
+    @property
+    def files_opened(self) -> int:
+        """Files opened or deleted through the governor by every thread"""
+        return sum(counters.files_opened for counters in list(self._counters))
+
+    def _thread_counters(self) -> _ThreadCounters:
+        """Counters of the calling thread, registered on its first use"""
+        counters = getattr(self._local, 'counters', None)
+        if counters is None:
+            counters = self._local.counters = _ThreadCounters()
+            with self._lock:
+                self._counters.append(counters)
+        return counters
+
+    def _wait(self, seconds: float) -> None:
+        """Sleep unless cancelled"""
+        if seconds > 0:
+            self._cancel_event.wait(seconds)
+
+    def before_file(self) -> None:
+        """Wait until another file may be opened or deleted."""
+        self._thread_counters().files_opened += 1
+        if self._files is not None:
+            with self._lock:
+                delay = self._files.delay_for(1)
+            self._wait(delay)
+
+    def before_read(self, num_bytes: int) -> None:
+        """Wait until `num_bytes` more bytes may be read."""
+        if self._bytes is not None:
+            with self._lock:
+                delay = self._bytes.delay_for(num_bytes)
+            self._wait(delay)
+
+    def after_read(self, seconds: float, num_bytes: int) -> None:
+        """
+        Record a latency sample and back off if latency is rising.
+
+        Args:
+            seconds: Time spent in the sampled reads
+            num_bytes: Bytes the sampled reads returned
+        """
+        recent = config.IO_LATENCY_RECENT
+        with self._lock:
+            self._samples.append(seconds / num_bytes)
+            if len(self._samples) < 2 * recent:
+                return
+            # Medians ignore outliers; the baseline only absorbs pressure that lasts half the window
+            baseline = statistics.median(self._samples)
+            latency = statistics.median(list(self._samples)[-recent:])
+            if latency > baseline * config.IO_LATENCY_BACKOFF_FACTOR:
+                self.slowdown = min(self.slowdown * 2, config.IO_MAX_SLOWDOWN)
+            elif self.slowdown > 1.0:
+                self.slowdown = max(self.slowdown * 0.9, 1.0)
+            slowdown = self.slowdown
+
+        # Idle for long enough that reads only use 1/slowdown of the device time
+        if slowdown > 1.0:
+            self._wait(seconds * (slowdown - 1))
+
+    def read(self, f, size: int) -> bytes:
+        """
+        Read from a file within the configured limits.
+
+        Args:
+            f: Binary file object to read from
+            size: Maximum number of bytes to read
+
+        Returns:
+            bytes: Data read, empty at end of file
+        """
+        counters = self._thread_counters()
+        if self._unlimited:
+            data = f.read(size)
+            counters.bytes_read += len(data)
+            return data
+
+        self.before_read(size)
+        started = time.perf_counter()
+        data = f.read(size)
+        elapsed = time.perf_counter() - started
+        counters.bytes_read += len(data)
+        if self.limits.adaptive_backoff and data:
+            counters.sample_seconds += elapsed
+            counters.sample_bytes += len(data)
+            if counters.sample_bytes >= config.IO_LATENCY_SAMPLE_BYTES:
+                seconds, num_bytes = counters.sample_seconds, counters.sample_bytes
+                counters.sample_seconds, counters.sample_bytes = 0.0, 0
+                self.after_read(seconds, num_bytes)
+        return data
+
+
+def lower_io_priority() -> bool:
+    """
+    Lower the I/O priority of the calling thread where the platform supports it.
+
+    Returns:
+        bool: True if the priority was lowered
+    """
+    try:
+        if sys.platform == 'win32':
+            kernel32 = ctypes.windll.kernel32
+            return bool(kernel32.SetThreadPriority(kernel32.GetCurrentThread(), THREAD_MODE_BACKGROUND_BEGIN))
+
+        if sys.platform == 'darwin':
+            libc = ctypes.CDLL(None, use_errno=True)
+            return libc.setiopolicy_np(IOPOL_TYPE_DISK, IOPOL_SCOPE_THREAD, IOPOL_THROTTLE) == 0
+
+        syscall_number = IOPRIO_SET_SYSCALLS.get(platform.machine().lower())
+        if sys.platform.startswith('linux') and syscall_number is not None:
+            libc = ctypes.CDLL(None, use_errno=True)
+            # who=0 targets the calling thread
+            if libc.syscall(syscall_number, IOPRIO_WHO_PROCESS, 0, IOPRIO_CLASS_IDLE << IOPRIO_CLASS_SHIFT) != 0:
+                logger.warning(f"ioprio_set failed with errno {ctypes.get_errno()}")
+        # Niceness also lowers the I/O priority under schedulers without an explicit class
+        # (per thread on Linux, per process elsewhere)
+        os.nice(config.IO_NICE_INCREMENT)
+        return True
+    except Exception as e:
+        logger.warning(f"Could not lower I/O priority: {str(e)}")
+        return False
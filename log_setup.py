@@ -0,0 +1,162 @@
+import os
+import queue
+import atexit
+import logging
+import threading
+from collections import deque
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Deque, Dict, List, Optional
+
+import config
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+_listener: Optional[QueueListener] = None
+_listener_lock = threading.Lock()
+
+
+class DeletionFilter(logging.Filter):
+    """Filter for deletion related log messages"""
+
+    def __init__(self, max_messages: int = config.DELETION_MESSAGES_MAX) -> None:
+        """
+        Initialize the deletion filter.
+
+        Args:
+            max_messages: Most recent deletion messages to keep
+        """
+        super().__init__()
+        self.deletion_messages: Deque[str] = deque(maxlen=max_messages)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        """Filter and store deletion related messages"""
+        if "deleted" in str(record.msg).lower():
+            self.deletion_messages.append(record.getMessage())
+        return True
+
+
+# Installed on the root logger by configure_logging
+deletion_filter = DeletionFilter()
+
+
+class BoundedQueueHandler(QueueHandler):
+    """Queue handler that drops records rather than block the caller when the queue is full"""
+
+    def __init__(self, maxsize: int) -> None:
+        """
+        Create a handler with its own queue.
+
+        Args:
+            maxsize: Records buffered before new ones are dropped
+        """
+        super().__init__(queue.Queue(maxsize))
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        # Called with the handler lock held
+        try:
+            if self.dropped:
+                self.queue.put_nowait(logging.LogRecord(
+                    record.name, logging.WARNING, __file__, 0,
+                    f"Dropped {self.dropped} log records while the log queue was full", None, None
+                ))
+                self.dropped = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging(log_file: str) -> None:
+    """
+    Send all logging through a bounded queue to the log file and the console.
+
+    Records are formatted and written by a listener thread, so logging costs
+    the calling thread little more than a queue put. Deletion messages are
+    kept by `deletion_filter`. Only the first call in a process has an effect.
+
+    Args:
+        log_file: Rotating log file to write to
+    """
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            return
+
+        file_handler = RotatingFileHandler(
+            log_file,
+            maxBytes=config.LOG_MAX_BYTES,
+            backupCount=config.LOG_BACKUP_COUNT
+        )
+        handlers = [file_handler, logging.StreamHandler()]
+        for handler in handlers:
+            handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+        queue_handler = BoundedQueueHandler(config.LOG_QUEUE_SIZE)
+        root = logging.getLogger()
+        root.setLevel(logging.INFO)
+        root.addHandler(queue_handler)
+        root.addFilter(deletion_filter)
+
+        _listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+
+class SkipSummary:
+    """
+    Collects files skipped due to errors and logs one warning per directory.
+
+    Trees with many unreadable files would otherwise log a warning for each
+    of them. Each file is logged at debug level only; the per-directory
+    counts are logged on flush, or when too many directories have piled up.
+    Safe to use from several threads.
+    """
+
+    def __init__(self, logger: logging.Logger, action: str,
+                 max_directories: int = config.LOG_SKIP_SUMMARY_MAX_DIRS) -> None:
+        """
+        Create an empty summary.
+
+        Args:
+            logger: Logger to write the summaries to
+            action: What was being done to the files, e.g. "scanning"
+            max_directories: Directories collected before the summary is flushed
+        """
+        self._logger = logger
+        self._action = action
+        self._max_directories = max_directories
+        self._lock = threading.Lock()
+        # Directory -> [files skipped, first error]
+        self._skipped: Dict[str, List] = {}
+        self.total = 0
+
+    def record(self, path: str, error: Exception) -> None:
+        """
+        Note a skipped file.
+
+        Args:
+            path: Path of the file
+            error: Why it was skipped
+        """
+        self._logger.debug("Skipped %s while %s: %s", path, self._action, error)
+        directory = os.path.dirname(path)
+        with self._lock:
+            self.total += 1
+            entry = self._skipped.get(directory)
+            if entry is not None:
+                entry[0] += 1
+                return
+            self._skipped[directory] = [1, str(error)]
+            full = len(self._skipped) >= self._max_directories
+        if full:
+            self.flush()
+
+    def flush(self) -> None:
+        """Log the skips collected so far."""
+        with self._lock:
+            skipped, self._skipped = self._skipped, {}
+        for directory, (count, first_error) in skipped.items():
+            if count == 1:
+                self._logger.warning(f"Skipped a file in {directory} while {self._action}: {first_error}")
+            else:
+                self._logger.warning(f"Skipped {count} files in {directory} while {self._action}, first error: {first_error}")
@@ -0,0 +1,150 @@
+import os
+import mmap
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator, Optional
+
+import config
+
+# posix_fadvise is only available on POSIX platforms other than macOS
+HAS_FADVISE = hasattr(os, 'posix_fadvise')
+HAS_DIRECT_IO = hasattr(os, 'O_DIRECT')
+# O_DIRECT transfers must be aligned to the logical block size; a page covers common devices
+DIRECT_IO_ALIGNMENT = mmap.PAGESIZE
+
+
+def advise(fd: int, advice: int, offset: int = 0, length: int = 0) -> None:
+    """
+    Pass an access pattern hint to the kernel, ignoring platforms and files that don't support it.
+
+    Args:
+        fd: Open file descriptor
+        advice: One of the os.POSIX_FADV_* constants
+        offset: Start of the range the hint applies to
+        length: Length of the range, 0 for the rest of the file
+    """
+    if not HAS_FADVISE or not config.IO_CACHE_HINTS:
+        return
+    try:
+        os.posix_fadvise(fd, offset, length, advice)
+    except OSError:
+        pass
+
+
+def prefetch(file_path: str, length: int = config.IO_READAHEAD_BYTES) -> None:
+    """
+    Ask the kernel to start reading the beginning of a file that will be hashed next.
+
+    Args:
+        file_path: File to read ahead
+        length: Leading bytes to read ahead
+    """
+    if not HAS_FADVISE or not config.IO_CACHE_HINTS or length <= 0:
+        return
+    try:
+        fd = os.open(file_path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        advise(fd, os.POSIX_FADV_WILLNEED, 0, length)
+    finally:
+        os.close(fd)
+
+
+class DirectReader:
+    """
+    Reads a file with O_DIRECT, bypassing the page cache.
+
+    Transfers go through a page-aligned buffer, as O_DIRECT requires, one
+    whole buffer at a time; smaller reads are served from the last transfer.
+    """
+
+    def __init__(self, fd: int, buffer_size: int = config.IO_DIRECT_CHUNK_SIZE) -> None:
+        """
+        Wrap a file descriptor opened with O_DIRECT.
+
+        Args:
+            fd: File descriptor, owned and closed by the reader
+            buffer_size: Bytes per transfer, rounded up to the alignment
+        """
+        self._fd = fd
+        buffer_size = -(-buffer_size // DIRECT_IO_ALIGNMENT) * DIRECT_IO_ALIGNMENT
+        # Anonymous mappings are page-aligned
+        self._buffer = mmap.mmap(-1, buffer_size)
+        self._data = b''
+        self._offset = 0
+
+    def _transfer(self) -> bytes:
+        """Read the next buffer's worth of the file"""
+        view = memoryview(self._buffer)
+        try:
+            # Only a read at the end of the file returns less than a full buffer
+            return bytes(view[:os.readv(self._fd, [view])])
+        finally:
+            view.release()
+
+    def fileno(self) -> int:
+        return self._fd
+
+    def read(self, size: int = -1) -> bytes:
+        """Read up to `size` bytes, or the rest of the current transfer if `size` is negative."""
+        if self._offset >= len(self._data):
+            self._data, self._offset = self._transfer(), 0
+        end = len(self._data) if size < 0 else self._offset + size
+        data = self._data[self._offset:end]
+        self._offset += len(data)
+        return data
+
+    def close(self) -> None:
+        self._buffer.close()
+        os.close(self._fd)
+
+
+def _open_direct(file_path: str) -> Optional[DirectReader]:
+    """Open a file with O_DIRECT, or return None where the platform or file system doesn't allow it"""
+    try:
+        fd = os.open(file_path, os.O_RDONLY | os.O_DIRECT)
+    except OSError:
+        return None
+    reader = DirectReader(fd)
+    try:
+        # Some file systems accept the flag but fail aligned reads; check before committing to it
+        reader.read(0)
+    except OSError:
+        reader.close()
+        return None
+    return reader
+
+
+@contextmanager
+def open_for_scan(file_path: str, whole: bool = True) -> Iterator[BinaryIO]:
+    """
+    Open a file to be read once by the scan, without leaving its pages in the cache.
+
+    Whole files of at least IO_DIRECT_MIN_SIZE bytes are read with O_DIRECT
+    where supported. Other files get a sequential access hint, and their
+    cached pages are dropped once they are closed, so scanning doesn't push
+    the data of other workloads out of the page cache. Hints are no-ops where
+    posix_fadvise is unavailable, e.g. on Windows.
+
+    Args:
+        file_path: File to open
+        whole: Whether the file will be read from start to end
+
+    Yields:
+        A binary file object
+    """
+    f = None
+    if whole and HAS_DIRECT_IO and config.IO_CACHE_HINTS and config.IO_DIRECT_MIN_SIZE > 0:
+        if os.stat(file_path).st_size >= config.IO_DIRECT_MIN_SIZE:
+            f = _open_direct(file_path)
+    if f is None:
+        f = open(file_path, 'rb')
+        if whole:
+            advise(f.fileno(), os.POSIX_FADV_SEQUENTIAL if HAS_FADVISE else 0)
+    try:
+        yield f
+    finally:
+        try:
+            advise(f.fileno(), os.POSIX_FADV_DONTNEED if HAS_FADVISE else 0)
+        finally:
+            f.close()
@@ -0,0 +1,94 @@
+import os
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+import config
+
+
+@dataclass(frozen=True)
+class PathClass:
+    """Safety and cloud classification shared by a directory and everything under it"""
+    sensitive: bool = False
+    cloud_provider: Optional[str] = None
+    contains_sensitive: bool = False  # A sensitive directory lies somewhere below it
+
+
+class PathClassifier:
+    """
+    Classifies directories against the sensitive and cloud storage rules.
+
+    Both rule sets are compiled into a single regular expression each. A
+    directory is classified once and its entries inherit the result, and a
+    subdirectory classified from its parent only has its own name checked
+    against the cloud rules, and its path against the sensitive rules only
+    if a sensitive directory lies below the parent.
+    """
+
+    def __init__(self, sensitive_dirs: Iterable[str] = config.SENSITIVE_DIRS,
+                 cloud_paths: Dict[str, List[str]] = config.CLOUD_PATHS) -> None:
+        """
+        Compile the classification rules.
+
+        Args:
+            sensitive_dirs: Directories whose whole subtree must never be touched
+            cloud_paths: Path name indicators for each cloud storage provider
+        """
+        # Unset environment variables leave relative placeholders such as '.' behind
+        roots = sorted((os.path.normpath(path) for path in sensitive_dirs if os.path.isabs(path)),
+                       key=len, reverse=True)
+        separators = re.escape(os.sep + (os.altsep or ''))
+        self._sensitive = re.compile(
+            f"(?:{'|'.join(map(re.escape, roots))})(?:[{separators}]|$)", re.IGNORECASE
+        ) if roots else None
+        self._sensitive_roots = [root.lower() for root in roots]
+
+        self._providers = list(cloud_paths)
+        self._cloud = re.compile('|'.join(
+            f"(?P<p{index}>{'|'.join(re.escape(indicator) for indicator in cloud_paths[provider])})"
+            for index, provider in enumerate(self._providers) if cloud_paths[provider]
+        ), re.IGNORECASE) if any(cloud_paths.values()) else None
+
+    def _cloud_provider(self, text: str) -> Optional[str]:
+        """Return the provider whose indicator appears first in a path or name"""
+        match = self._cloud.search(text) if self._cloud else None
+        return self._providers[int(match.lastgroup[1:])] if match else None
+
+    def _contains_sensitive(self, directory: str) -> bool:
+        """Whether a sensitive directory lies below a directory"""
+        prefix = os.path.join(os.path.abspath(directory), '').lower()
+        return any(root.startswith(prefix) for root in self._sensitive_roots)
+
+    def _classify_path(self, directory: str) -> PathClass:
+        """Classify a directory from its full path"""
+        return PathClass(self.is_sensitive(directory), self._cloud_provider(os.path.normpath(directory)),
+                         self._contains_sensitive(directory))
+
+    def is_sensitive(self, path: str) -> bool:
+        """Whether a path is a sensitive directory or lies under one."""
+        return bool(self._sensitive and self._sensitive.match(os.path.abspath(path)))
+
+    def classify_directory(self, path: str, parent: Optional[PathClass] = None) -> PathClass:
+        """
+        Classify a directory.
+
+        Args:
+            path: Absolute path of the directory
+            parent: Classification of the parent directory, if known; only the
+                new path component is then checked against the rules
+
+        Returns:
+            PathClass: Classification inherited by everything under the directory
+        """
+        if parent is None:
+            return self._classify_path(path)
+        if parent.sensitive:
+            return parent
+        cloud_provider = parent.cloud_provider or self._cloud_provider(os.path.basename(os.path.normpath(path)))
+        if not parent.contains_sensitive:
+            return PathClass(False, cloud_provider)
+        return PathClass(self.is_sensitive(path), cloud_provider, self._contains_sensitive(path))
+
+
+# Shared classifier for the configured rules
+classifier = PathClassifier()
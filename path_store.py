@@ -0,0 +1,101 @@
+import os
+from array import array
+from typing import List
+
+
+def _encode_name(name: str) -> bytes:
+    """Encode a path component, preserving undecodable characters"""
+    return name.encode('utf-8', 'surrogatepass')
+
+
+class PathStore:
+    """
+    Compact table of scanned paths.
+
+    Directories form a trie of (parent id, name) entries and each file is a
+    directory id plus a basename packed into a shared byte buffer, so long
+    common prefixes are stored once. Scan structures reference integer file
+    ids and full paths are only materialised for display and I/O.
+    """
+
+    ROOT_PARENT = -1
+
+    def __init__(self) -> None:
+        """Create an empty store"""
+        self._dir_parents = array('q')
+        self._dir_names: List[str] = []
+        self._file_dirs = array('L')
+        self._name_offsets = array('Q', [0])
+        self._names = bytearray()
+
+    def add_directory(self, name: str, parent: int = ROOT_PARENT) -> int:
+        """
+        Register a directory.
+
+        Args:
+            name: Directory name, or the full path for a scan root
+            parent: Id of the parent directory, ROOT_PARENT for a scan root
+
+        Returns:
+            int: Id of the new directory
+        """
+        self._dir_parents.append(parent)
+        self._dir_names.append(name)
+        return len(self._dir_names) - 1
+
+    def add_file(self, dir_id: int, name: str) -> int:
+        """
+        Register a file inside a known directory.
+
+        Args:
+            dir_id: Id of the containing directory
+            name: Basename of the file
+
+        Returns:
+            int: Id of the new file
+        """
+        self._file_dirs.append(dir_id)
+        self._names += _encode_name(name)
+        self._name_offsets.append(len(self._names))
+        return len(self._file_dirs) - 1
+
+    @property
+    def num_directories(self) -> int:
+        """Number of registered directories"""
+        return len(self._dir_names)
+
+    def directory_parent(self, dir_id: int) -> int:
+        """Return the id of a directory's parent, ROOT_PARENT for a scan root."""
+        return self._dir_parents[dir_id]
+
+    def directory_name(self, dir_id: int) -> str:
+        """Return the name of a directory, or the full path of a scan root."""
+        return self._dir_names[dir_id]
+
+    def directory_path(self, dir_id: int) -> str:
+        """Materialise the full path of a directory."""
+        parts = []
+        while dir_id != self.ROOT_PARENT:
+            parts.append(self._dir_names[dir_id])
+            dir_id = self._dir_parents[dir_id]
+        return os.path.join(*reversed(parts))
+
+    def file_directory(self, file_id: int) -> int:
+        """Return the directory id of a file."""
+        return self._file_dirs[file_id]
+
+    def file_name(self, file_id: int) -> str:
+        """Return the basename of a file."""
+        start, end = self._name_offsets[file_id], self._name_offsets[file_id + 1]
+        return self._names[start:end].decode('utf-8', 'surrogatepass')
+
+    def path(self, file_id: int) -> str:
+        """Materialise the full path of a file."""
+        return os.path.join(self.directory_path(self._file_dirs[file_id]), self.file_name(file_id))
+
+    def paths(self, file_ids: List[int]) -> List[str]:
+        """Materialise the full paths of several files."""
+        return [self.path(file_id) for file_id in file_ids]
+
+    def __len__(self) -> int:
+        return len(self._file_dirs)
@@ -0,0 +1,93 @@
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Optional, Tuple
+
+import config
+
+MB = 1024 * 1024
+
+
+def format_duration(seconds: float) -> str:
+    """Format a duration for display, e.g. '1h 05m', '3m 20s' or '42s'."""
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+class ProgressReporter:
+    """
+    Tracks hashing progress in bytes of candidate data and publishes it at a limited rate.
+
+    A candidate file counts for its full size once it is resolved, whether its
+    partial hash ruled it out or it was hashed in full, so progress reaches 100%
+    with the last candidate group. Read throughput and the ETA are measured over
+    a sliding window. Status text is only built when an update is published.
+    Not thread-safe; call it from the scan's event loop.
+    """
+
+    def __init__(self, publish: Callable[[float, str], None], describe: Callable[[Any], str],
+                 bytes_read: Callable[[], int], interval: float = config.PROGRESS_UPDATE_INTERVAL,
+                 window: float = config.PROGRESS_RATE_WINDOW) -> None:
+        """
+        Create a reporter.
+
+        Args:
+            publish: Receives the progress fraction and status text of each update
+            describe: Returns the display name of the item being worked on
+            bytes_read: Returns the cumulative number of bytes read from disk
+            interval: Minimum seconds between published updates
+            window: Seconds of history the throughput and ETA are measured over
+        """
+        self.total_bytes: Optional[int] = None
+        self.done_bytes = 0
+        self._publish = publish
+        self._describe = describe
+        self._bytes_read = bytes_read
+        self._interval = interval
+        self._window = window
+        self._last_publish: Optional[float] = None
+        # (time, done bytes, bytes read) at each published update
+        self._samples: Deque[Tuple[float, int, int]] = deque()
+
+    def set_total(self, total_bytes: int) -> None:
+        """Set the number of candidate bytes to resolve."""
+        self.total_bytes = total_bytes
+
+    def advance(self, num_bytes: int, item: Any = None) -> None:
+        """
+        Count resolved candidate bytes, publishing an update if one is due.
+
+        Args:
+            num_bytes: Candidate bytes just resolved
+            item: What is being worked on, passed to `describe` if an update is published
+        """
+        self.done_bytes += num_bytes
+        now = time.monotonic()
+        if self._last_publish is None or now - self._last_publish >= self._interval:
+            self._last_publish = now
+            self._report(now, item)
+
+    def _report(self, now: float, item: Any) -> None:
+        """Publish the current progress, throughput and ETA"""
+        done, read = self.done_bytes, self._bytes_read()
+        self._samples.append((now, done, read))
+        while len(self._samples) > 2 and now - self._samples[0][0] > self._window:
+            self._samples.popleft()
+        first_time, first_done, first_read = self._samples[0]
+        elapsed = now - first_time
+
+        fraction = min(done / self.total_bytes, 1.0) if self.total_bytes else 0.0
+        parts = [f"{done / MB:.1f} of {self.total_bytes / MB:.1f} MB" if self.total_bytes else f"{done / MB:.1f} MB"]
+        if elapsed > 0:
+            parts.append(f"{(read - first_read) / elapsed / MB:.1f} MB/s read")
+            rate = (done - first_done) / elapsed
+            if self.total_bytes and rate > 0:
+                parts.append(f"about {format_duration(max(self.total_bytes - done, 0) / rate)} left")
+
+        status = "Hashing: " + ", ".join(parts)
+        if item is not None:
+            status += f" - {self._describe(item)}"
+        self._publish(fraction, status)
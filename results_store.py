@@ -0,0 +1,382 @@
+import os
+import json
+import bisect
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import config
+
+# One row per duplicate file; rows of a group are always written contiguously and
+# the row number is the file id. Directories are dictionary encoded on disk.
+# Groups not matched on their full content are unverified probable duplicates.
+RESULTS_SCHEMA = pa.schema([
+    ('group_id', pa.int64()),
+    ('size', pa.int64()),
+    ('digest', pa.string()),
+    ('match', pa.string()),
+    ('directory', pa.string()),
+    ('name', pa.string()),
+])
+
+SUMMARY_KEY = b'duplicate_cleaner.summary'
+
+# How the files of a group were matched
+MATCH_CONTENT = 'content'  # Full content hash
+MATCH_SAMPLED = 'sampled'  # Size and sampled blocks of very large files
+MATCH_METADATA = 'metadata'  # Size and name of placeholder files that were never read
+MATCH_KINDS = (MATCH_CONTENT, MATCH_SAMPLED, MATCH_METADATA)
+# Full-content checks of probable groups are recorded next to the immutable results file
+VERIFICATIONS_SUFFIX = '.verified.json'
+# Groups of identical directory trees are stored next to the file groups they summarise
+DIRECTORIES_SUFFIX = '.directories.json'
+# Results are written under a temporary name, so unfinished files are never listed
+PARTIAL_SUFFIX = '.part'
+
+
+@dataclass
+class DuplicateGroup:
+    """A group of files with identical content"""
+    group_id: int
+    size: int
+    digest: str
+    file_ids: List[int]
+    paths: List[str]
+    match: str = MATCH_CONTENT
+
+    @property
+    def verified(self) -> bool:
+        """Whether the group was matched on its full content"""
+        return self.match == MATCH_CONTENT
+
+    @property
+    def reclaimable_bytes(self) -> int:
+        """Bytes freed by keeping a single copy of the group"""
+        return self.size * (len(self.paths) - 1)
+
+
+@dataclass
+class DirectoryGroup:
+    """A group of directory trees with identical content"""
+    group_id: int
+    size: int  # Bytes in one copy of the tree
+    file_count: int  # Files in one copy of the tree
+    digest: str
+    paths: List[str]  # In preferred keep order
+
+    @property
+    def reclaimable_bytes(self) -> int:
+        """Bytes freed by keeping a single copy of the tree"""
+        return self.size * (len(self.paths) - 1)
+
+
+def new_results_path() -> str:
+    """Return a fresh results file path and prune old result files."""
+    prune_results(config.RESULTS_MAX_FILES - 1)
+    file_name = f"scan_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.parquet"
+    return os.path.join(config.RESULTS_DIR, file_name)
+
+
+def list_results() -> List[str]:
+    """List saved result files, newest first."""
+    try:
+        files = [
+            os.path.join(config.RESULTS_DIR, name)
+            for name in os.listdir(config.RESULTS_DIR)
+            if name.endswith('.parquet')
+        ]
+    except OSError:
+        return []
+    return sorted(files, key=os.path.getmtime, reverse=True)
+
+
+def remove_results(file_path: str) -> None:
+    """Delete a results file and the files stored next to it, if they exist."""
+    for path in (file_path, file_path + PARTIAL_SUFFIX, file_path + VERIFICATIONS_SUFFIX,
+                 file_path + DIRECTORIES_SUFFIX):
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+
+
+def prune_results(keep: int) -> None:
+    """Delete all but the `keep` newest result files."""
+    for file_path in list_results()[max(keep, 0):]:
+        remove_results(file_path)
+
+
+class ResultsWriter:
+    """Streams duplicate groups into a Parquet file as they are confirmed"""
+
+    def __init__(self, file_path: str, row_group_size: int = config.RESULTS_ROW_GROUP_SIZE, top_k: int = 0) -> None:
+        """
+        Open a results file for writing. Rows go to a temporary file that is
+        renamed to `file_path` once the results are complete.
+
+        Args:
+            file_path: Destination Parquet file
+            row_group_size: Number of rows buffered before a row group is written
+            top_k: Most groups the scan kept, recorded in the summary; 0 if it kept every group
+        """
+        self.file_path = file_path
+        self.row_group_size = row_group_size
+        self.top_k = top_k
+        self.num_groups = 0
+        self.num_files = 0
+        self.reclaimable_bytes = 0
+        self.num_unverified = 0
+        self.directory_groups: List[DirectoryGroup] = []
+        self._columns: Dict[str, list] = {name: [] for name in RESULTS_SCHEMA.names}
+        self._writer = pq.ParquetWriter(file_path + PARTIAL_SUFFIX, RESULTS_SCHEMA)
+
+    def add_group(self, size: int, digest: str, paths: List[str], match: str = MATCH_CONTENT) -> int:
+        """
+        Append a duplicate group to the results file.
+
+        Args:
+            size: Size in bytes of each file in the group
+            digest: Hash shared by the group
+            paths: Paths of the files in the group, in preferred keep order
+            match: How the files were matched, one of MATCH_KINDS
+
+        Returns:
+            int: Id of the stored group
+        """
+        group_id = self.num_groups
+        for path in paths:
+            directory, name = os.path.split(path)
+            self._columns['group_id'].append(group_id)
+            self._columns['size'].append(size)
+            self._columns['digest'].append(digest)
+            self._columns['match'].append(match)
+            self._columns['directory'].append(directory)
+            self._columns['name'].append(name)
+
+        self.num_groups += 1
+        self.num_files += len(paths)
+        self.reclaimable_bytes += size * (len(paths) - 1)
+        self.num_unverified += match != MATCH_CONTENT
+
+        # Only flush on group boundaries so a group never spans row groups
+        if len(self._columns['name']) >= self.row_group_size:
+            self._flush()
+        return group_id
+
+    def add_directory_group(self, size: int, file_count: int, digest: str, paths: List[str]) -> int:
+        """
+        Record a group of identical directory trees.
+
+        Args:
+            size: Bytes in one copy of the tree
+            file_count: Files in one copy of the tree
+            digest: Content digest shared by the trees
+            paths: Paths of the directories, in preferred keep order
+
+        Returns:
+            int: Id of the stored directory group
+        """
+        group_id = len(self.directory_groups)
+        self.directory_groups.append(DirectoryGroup(group_id, size, file_count, digest, list(paths)))
+        return group_id
+
+    def _flush(self) -> None:
+        """Write buffered rows as a new row group"""
+        if not self._columns['name']:
+            return
+        self._writer.write_table(pa.Table.from_pydict(self._columns, schema=RESULTS_SCHEMA))
+        self._columns = {name: [] for name in RESULTS_SCHEMA.names}
+
+    def close(self) -> None:
+        """Flush remaining rows and finalize the file with its summary"""
+        self._flush()
+        if self.directory_groups:
+            temp_path = self.file_path + DIRECTORIES_SUFFIX + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump([asdict(group) for group in self.directory_groups], f)
+            os.replace(temp_path, self.file_path + DIRECTORIES_SUFFIX)
+        summary = {
+            'num_groups': self.num_groups,
+            'num_files': self.num_files,
+            'reclaimable_bytes': self.reclaimable_bytes,
+            'num_unverified': self.num_unverified,
+            'num_directory_groups': len(self.directory_groups),
+            'top_k': self.top_k,
+        }
+        self._writer.add_key_value_metadata({SUMMARY_KEY: json.dumps(summary).encode()})
+        self._writer.close()
+        os.replace(self.file_path + PARTIAL_SUFFIX, self.file_path)
+
+    def __enter__(self) -> 'ResultsWriter':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class ResultsReader:
+    """Lazily reads duplicate groups back from a results file"""
+
+    def __init__(self, file_path: str) -> None:
+        """
+        Open a results file for reading.
+
+        Args:
+            file_path: Parquet file written by ResultsWriter
+        """
+        self.file_path = file_path
+        self._file = pq.ParquetFile(file_path, read_dictionary=['directory'])
+        metadata = self._file.metadata
+        summary = json.loads((metadata.metadata or {}).get(SUMMARY_KEY, b'{}'))
+        self.num_files: int = summary.get('num_files', metadata.num_rows)
+        self.reclaimable_bytes: int = summary.get('reclaimable_bytes', 0)
+        self.num_unverified: int = summary.get('num_unverified', 0)
+        # Most groups the scan kept, 0 if it kept every group
+        self.top_k: int = summary.get('top_k', 0)
+        # Verified probable groups, mapped to the ids of files whose full content differed
+        self.verifications: Dict[int, List[int]] = self._load_verifications()
+        # Identical directory trees, most reclaimable first
+        self.directory_groups: List[DirectoryGroup] = self._load_directory_groups()
+        self._row_group_ranges = self._build_row_group_index()
+        self._row_offsets = [0]
+        for index in range(metadata.num_row_groups):
+            self._row_offsets.append(self._row_offsets[-1] + metadata.row_group(index).num_rows)
+        self.num_groups: int = summary.get(
+            'num_groups',
+            self._row_group_ranges[-1][1] + 1 if self._row_group_ranges else 0
+        )
+
+    def _build_row_group_index(self) -> List[Tuple[int, int]]:
+        """Read the first and last group id of each row group from column statistics"""
+        metadata = self._file.metadata
+        column = RESULTS_SCHEMA.get_field_index('group_id')
+        ranges = []
+        for index in range(metadata.num_row_groups):
+            stats = metadata.row_group(index).column(column).statistics
+            ranges.append((stats.min, stats.max))
+        return ranges
+
+    @staticmethod
+    def _groups_from_table(table: pa.Table, first_file_id: int) -> Iterator[DuplicateGroup]:
+        """Convert result rows into groups, relying on rows being contiguous per group"""
+        columns = table.to_pydict()
+        # Older files only flag whether a group was verified, or only hold fully hashed groups
+        match_column = columns.get('match') or [
+            MATCH_CONTENT if verified else MATCH_SAMPLED
+            for verified in columns.get('verified') or [True] * table.num_rows
+        ]
+        current: Optional[DuplicateGroup] = None
+        for file_id, (group_id, size, digest, match, directory, name) in enumerate(zip(
+            columns['group_id'], columns['size'], columns['digest'], match_column,
+            columns['directory'], columns['name']
+        ), first_file_id):
+            if current is None or current.group_id != group_id:
+                if current is not None:
+                    yield current
+                current = DuplicateGroup(group_id, size, digest, [], [], match)
+            current.file_ids.append(file_id)
+            current.paths.append(os.path.join(directory, name))
+        if current is not None:
+            yield current
+
+    def iter_groups(self) -> Iterator[DuplicateGroup]:
+        """Iterate over all groups one row group at a time."""
+        for index in range(self._file.metadata.num_row_groups):
+            yield from self._groups_from_table(self._file.read_row_group(index), self._row_offsets[index])
+
+    def files(self, file_ids: Iterable[int]) -> Dict[int, Tuple[str, int]]:
+        """
+        Materialise the path and size of specific files.
+
+        Args:
+            file_ids: Ids of files in this results file
+
+        Returns:
+            Dict mapping file id to a (path, size) tuple
+        """
+        ids_by_row_group: Dict[int, List[int]] = {}
+        for file_id in file_ids:
+            index = bisect.bisect_right(self._row_offsets, file_id) - 1
+            ids_by_row_group.setdefault(index, []).append(file_id)
+
+        files = {}
+        for index, ids in ids_by_row_group.items():
+            columns = self._file.read_row_group(index, columns=['size', 'directory', 'name']).to_pydict()
+            offset = self._row_offsets[index]
+            for file_id in ids:
+                row = file_id - offset
+                files[file_id] = (os.path.join(columns['directory'][row], columns['name'][row]),
+                                  columns['size'][row])
+        return files
+
+    def read_page(self, page: int, page_size: int = config.RESULTS_PAGE_SIZE) -> List[DuplicateGroup]:
+        """
+        Read a single page of groups.
+
+        Args:
+            page: Zero-based page number
+            page_size: Number of groups per page
+
+        Returns:
+            List[DuplicateGroup]: Groups on the requested page
+        """
+        first = page * page_size
+        last = first + page_size - 1
+        row_groups = [
+            index for index, (low, high) in enumerate(self._row_group_ranges)
+            if low <= last and high >= first
+        ]
+        if not row_groups:
+            return []
+        table = self._file.read_row_groups(row_groups)
+        return [
+            group for group in self._groups_from_table(table, self._row_offsets[row_groups[0]])
+            if first <= group.group_id <= last
+        ]
+
+    def _load_directory_groups(self) -> List[DirectoryGroup]:
+        """Read the groups of identical directory trees, if any"""
+        try:
+            with open(self.file_path + DIRECTORIES_SUFFIX, 'r', encoding='utf-8') as f:
+                return [DirectoryGroup(**group) for group in json.load(f)]
+        except (OSError, ValueError, TypeError):
+            return []
+
+    def _load_verifications(self) -> Dict[int, List[int]]:
+        """Read the recorded verification outcomes, if any"""
+        try:
+            with open(self.file_path + VERIFICATIONS_SUFFIX, 'r', encoding='utf-8') as f:
+                return {int(group_id): excluded for group_id, excluded in json.load(f).items()}
+        except (OSError, ValueError):
+            return {}
+
+    def is_verified(self, group: DuplicateGroup) -> bool:
+        """Whether a group is known to share its full content."""
+        return group.verified or group.group_id in self.verifications
+
+    @property
+    def excluded_files(self) -> Set[int]:
+        """Ids of files that verification removed from their probable group"""
+        return {file_id for excluded in self.verifications.values() for file_id in excluded}
+
+    def record_verification(self, group_id: int, excluded_file_ids: List[int]) -> None:
+        """
+        Record the outcome of fully hashing a probable group.
+
+        Args:
+            group_id: Id of the verified group
+            excluded_file_ids: Ids of files that do not share the group's full content
+        """
+        self.verifications[group_id] = list(excluded_file_ids)
+        temp_path = self.file_path + VERIFICATIONS_SUFFIX + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.verifications, f)
+        os.replace(temp_path, self.file_path + VERIFICATIONS_SUFFIX)
+
+    @property
+    def num_pages(self) -> int:
+        """Number of pages at the configured page size"""
+        return max(1, -(-self.num_groups // config.RESULTS_PAGE_SIZE))
@@ -0,0 +1,206 @@
+import os
+import time
+import random
+import statistics
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import DefaultDict, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+import config
+from file_operations import FileOperationError, FileOperations
+from path_classifier import classifier
+from scan_metrics import recent_scan_metrics
+from tree_walk import exclusion_set, list_directory
+
+
+@dataclass
+class ScanEstimate:
+    """Projected size and duration of a scan, from a sample of the tree"""
+    directory: str
+    directories: float  # Estimated directories in the tree
+    files: float  # Estimated non-empty files
+    total_bytes: float  # Estimated bytes in those files
+    candidate_files: float  # Estimated files sharing their size with another file
+    candidate_bytes: float  # Estimated bytes of those files, an upper bound on the bytes hashed
+    directories_sampled: int
+    files_sampled: int  # Files in the directories listed
+    walk_seconds: Optional[float]  # Predicted time to list and stat the tree
+    hash_seconds: Optional[float]  # Predicted time to hash the candidates
+    from_history: bool  # Whether throughput comes from recent scans rather than the sample itself
+
+    @property
+    def seconds(self) -> Optional[float]:
+        """Predicted total duration, if throughput is known"""
+        if self.walk_seconds is None or self.hash_seconds is None:
+            return None
+        return self.walk_seconds + self.hash_seconds
+
+
+class _Listing:
+    """Subdirectories and sampled file sizes of a directory, listed once per estimate"""
+
+    def __init__(self, subdirectories: List[str], num_files: int, sizes: List[int]) -> None:
+        self.subdirectories = subdirectories
+        self.num_files = num_files
+        self.sizes = sizes
+
+
+def _list(path: str, rng: random.Random, stats_per_directory: int,
+          excluded: FrozenSet[str] = frozenset()) -> Optional[_Listing]:
+    """List a directory and stat a random sample of its files, or None if it can't be listed"""
+    try:
+        directories, entries, _ = list_directory(path, excluded=excluded)
+    except OSError:
+        return None
+    sample = entries if len(entries) <= stats_per_directory else rng.sample(entries, stats_per_directory)
+    sizes, num_sized = [], 0
+    for entry in sample:
+        try:
+            file_info = FileOperations.get_file_info(entry.path)
+        except FileOperationError:
+            continue
+        num_sized += 1
+        # Empty files and cloud placeholders are never hashed, as in a scan
+        if file_info.size_bytes > 0 and file_info.resident:
+            sizes.append(file_info.size_bytes)
+    # Scale the sample up to every entry that could be stat'ed
+    num_files = round(len(entries) * len(sizes) / num_sized) if num_sized else 0
+    return _Listing([path for path, _, _ in directories], num_files, sizes)
+
+
+def _candidate_fraction(bucket: int, num_files: float, sampled_sizes: List[int]) -> float:
+    """
+    Estimate the fraction of files in a size bucket that share their exact size with another file.
+
+    Sizes that repeat within the sample are taken as real collisions, e.g.
+    copies. Files of otherwise scattered sizes collide by chance as the
+    bucket fills up, as in the birthday problem.
+    """
+    counts: DefaultDict[int, int] = defaultdict(int)
+    for size in sampled_sizes:
+        counts[size] += 1
+    observed = sum(count for count in counts.values() if count > 1) / len(sampled_sizes)
+    width = 2 ** bucket  # Distinct sizes in [2^bucket, 2^(bucket+1))
+    by_chance = 1.0 - (1.0 - 1.0 / width) ** max(num_files - 1.0, 0.0)
+    return max(observed, by_chance)
+
+
+def _throughput(directory: str) -> Tuple[Optional[float], Optional[float]]:
+    """Median files listed and bytes hashed per second over recent completed scans, preferring the same root"""
+    records = [record for record in recent_scan_metrics() if record.get('completed')]
+    same_root = [record for record in records
+                 if os.path.normcase(record.get('directory', '')) == os.path.normcase(directory)]
+    records = same_root or records
+
+    files_rates = [record['files_per_second'] for record in records if record.get('files_per_second')]
+    hash_rates = []
+    for record in records:
+        hash_seconds = record.get('seconds', 0) - record.get('walk_seconds', 0)
+        # Scans that read little say nothing about the disk's read rate
+        if record.get('bytes_read', 0) >= config.ESTIMATE_MIN_BYTES_READ and hash_seconds > 0:
+            hash_rates.append(record['bytes_read'] / hash_seconds)
+    return (statistics.median(files_rates) if files_rates else None,
+            statistics.median(hash_rates) if hash_rates else None)
+
+
+def estimate_scan(directory: str, max_directories: int = config.ESTIMATE_MAX_DIRECTORIES,
+                  max_seconds: float = config.ESTIMATE_MAX_SECONDS,
+                  stats_per_directory: int = config.ESTIMATE_STATS_PER_DIRECTORY,
+                  seed: Optional[int] = None, exclude_dirs: Iterable[str] = ()) -> ScanEstimate:
+    """
+    Estimate what a scan of a directory would find and how long it would take, without scanning it.
+
+    Random walks go from the root down to a leaf, picking a random
+    subdirectory at each level. Each walk gives an unbiased estimate of the
+    tree's totals, its directories and files weighted by the product of the
+    branching factors above them (Knuth's estimator), and the walks are
+    averaged. Only a few files per directory are stat'ed. Walks stop once
+    `max_directories` have been listed or `max_seconds` have passed, so the
+    estimate costs about the same on any tree. Duration uses the throughput
+    of recent scans, or the listing rate of the sample itself.
+
+    Args:
+        directory: Root that would be scanned
+        max_directories: Most distinct directories listed
+        max_seconds: Time after which no new walk is started
+        stats_per_directory: Most files stat'ed in each listed directory
+        seed: Seed for the random walks, for repeatable estimates
+        exclude_dirs: Names or full paths of directories the scan would leave out
+
+    Returns:
+        ScanEstimate: Projected totals and duration
+
+    Raises:
+        OSError: If the root can't be listed
+    """
+    directory = str(directory)
+    rng = random.Random(seed)
+    excluded = exclusion_set(exclude_dirs)
+    started = time.monotonic()
+    if classifier.is_sensitive(directory):
+        raise OSError(f"Not scanning sensitive directory: {directory}")
+    listings: Dict[str, Optional[_Listing]] = {directory: _list(directory, rng, stats_per_directory, excluded)}
+    if listings[directory] is None:
+        raise OSError(f"Could not list directory: {directory}")
+
+    walks = 0
+    directories = files = 0.0
+    # Log2 size bucket -> (sampled size, weight) pairs accumulated over all walks
+    samples: DefaultDict[int, List[Tuple[int, float]]] = defaultdict(list)
+    # Walks are only started within the budget, but always finish, since a cut-off walk would undercount
+    while walks == 0 or (len(listings) < max_directories and time.monotonic() - started < max_seconds
+                         and walks < config.ESTIMATE_MAX_WALKS):
+        walks += 1
+        path, weight = directory, 1.0
+        while True:
+            if path not in listings:
+                listings[path] = _list(path, rng, stats_per_directory, excluded)
+            listing = listings[path]
+            if listing is None:
+                break
+            directories += weight
+            files += weight * listing.num_files
+            for size in listing.sizes:
+                samples[size.bit_length() - 1].append((size, weight * listing.num_files / len(listing.sizes)))
+            if not listing.subdirectories:
+                break
+            weight *= len(listing.subdirectories)
+            path = rng.choice(listing.subdirectories)
+    sample_seconds = time.monotonic() - started
+
+    # Directories revisited by several walks contribute their sampled files once to collision counts
+    sampled_sizes: DefaultDict[int, List[int]] = defaultdict(list)
+    for listing in listings.values():
+        for size in listing.sizes if listing is not None else ():
+            sampled_sizes[size.bit_length() - 1].append(size)
+
+    total_bytes = candidate_files = candidate_bytes = 0.0
+    for bucket, weighted_sizes in samples.items():
+        bucket_files = sum(weight for _, weight in weighted_sizes) / walks
+        bucket_bytes = sum(size * weight for size, weight in weighted_sizes) / walks
+        fraction = _candidate_fraction(bucket, bucket_files, sampled_sizes[bucket])
+        total_bytes += bucket_bytes
+        candidate_files += bucket_files * fraction
+        candidate_bytes += bucket_bytes * fraction
+    directories /= walks
+    files /= walks
+
+    files_per_second, bytes_per_second = _throughput(directory)
+    from_history = files_per_second is not None
+    files_sampled = sum(listing.num_files for listing in listings.values() if listing is not None)
+    if files_per_second is None and sample_seconds > 0:
+        # Listing one directory at a time is slower than a scan's parallel walk, so this errs long
+        files_per_second = max(files_sampled, 1) / sample_seconds
+    return ScanEstimate(
+        directory=directory,
+        directories=directories,
+        files=files,
+        total_bytes=total_bytes,
+        candidate_files=candidate_files,
+        candidate_bytes=candidate_bytes,
+        directories_sampled=len(listings),
+        files_sampled=files_sampled,
+        walk_seconds=files / files_per_second if files_per_second else None,
+        hash_seconds=candidate_bytes / bytes_per_second if bytes_per_second else None,
+        from_history=from_history,
+    )
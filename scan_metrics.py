@@ -0,0 +1,38 @@
+import json
+import logging
+from typing import Any, Dict, List
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+def record_scan_metrics(metrics: Dict[str, Any]) -> None:
+    """
+    Log the metrics of a finished scan and keep them for later estimates.
+
+    Args:
+        metrics: JSON-serialisable scan metrics
+    """
+    logger.info("Scan metrics: " + ", ".join(f"{key}={value}" for key, value in metrics.items()))
+    records = recent_scan_metrics(config.SCAN_METRICS_MAX_RECORDS - 1) + [metrics]
+    try:
+        with open(config.SCAN_METRICS_FILE, 'w', encoding='utf-8') as f:
+            f.writelines(json.dumps(record) + '\n' for record in records)
+    except OSError as e:
+        logger.warning(f"Could not save scan metrics: {str(e)}")
+
+
+def recent_scan_metrics(limit: int = config.SCAN_METRICS_MAX_RECORDS) -> List[Dict[str, Any]]:
+    """
+    Return the metrics of the most recent scans, oldest first.
+
+    Args:
+        limit: Maximum number of scans to return
+    """
+    try:
+        with open(config.SCAN_METRICS_FILE, 'r', encoding='utf-8') as f:
+            records = [json.loads(line) for line in f if line.strip()]
+    except (OSError, ValueError):
+        return []
+    return records[-limit:] if limit > 0 else []
@@ -0,0 +1,55 @@
+import asyncio
+from typing import Any, Coroutine, Dict, List, Optional
+
+import config
+from autotuner import ConcurrencyTuner
+from file_operations import FileId
+
+
+async def run_stages(driver: Coroutine, stages: List[Coroutine]) -> None:
+    """
+    Run a coroutine that drives a pipeline alongside its endlessly looping stages.
+
+    The stages are cancelled once the driver returns. If a stage fails, the
+    driver is cancelled and the stage's error is raised.
+    """
+    tasks = [asyncio.create_task(driver)] + [asyncio.create_task(stage) for stage in stages]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            raise result
+
+
+async def autotune_stage(*tuners: ConcurrencyTuner) -> None:
+    """Step worker count tuners at a fixed interval"""
+    while True:
+        await asyncio.sleep(config.AUTOTUNE_INTERVAL)
+        for tuner in tuners:
+            tuner.step()
+
+
+def queue_pairs(first_seen: Dict[Any, Optional[FileId]], key: Any, file_id: FileId,
+                queue: asyncio.Queue, size: int, full: bool) -> None:
+    """
+    Queue a file for hashing once another file with the same key has been seen.
+
+    The first file of each key is held back until a second one arrives, since
+    a file without a match never needs hashing. Files are dropped rather than
+    waited for when the queue is full; they are hashed after the walk instead.
+    """
+    if key not in first_seen:
+        if len(first_seen) < config.EARLY_HASH_MAX_FILES:
+            first_seen[key] = file_id
+        return
+    first = first_seen[key]
+    first_seen[key] = None
+    for queued_id in ([file_id] if first is None else [first, file_id]):
+        try:
+            queue.put_nowait((size, queued_id, full))
+        except asyncio.QueueFull:
+            return
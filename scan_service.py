@@ -0,0 +1,607 @@
+import os
+import sys
+import hmac
+import json
+import time
+import uuid
+import logging
+import secrets
+import threading
+import subprocess
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import asdict
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+from urllib import error as urlerror
+from urllib import request as urlrequest
+from urllib.parse import urlsplit
+
+import config
+from io_governor import IOLimits
+from scanner import ScanJob, ScanSettings, SelectionStrategy
+from group_output import LiveGroup
+from tree_walk import exclusion_set
+from log_setup import configure_logging
+
+logger = logging.getLogger(__name__)
+
+TOKEN_HEADER = 'X-Scan-Service-Token'
+
+# Lifecycle of a shared scan
+QUEUED = 'queued'
+RUNNING = 'running'
+FINISHED = 'finished'
+
+# How a submitted scan was satisfied
+OUTCOME_NEW = 'new'
+OUTCOME_ATTACHED = 'attached'  # Joined a scan of the same root and settings that had not finished
+OUTCOME_REUSED = 'reused'  # Given the results of a recent scan of the same root and settings
+
+
+class ScanServiceError(Exception):
+    """Raised when the scan service rejects a request or cannot be reached"""
+    pass
+
+
+class ScanNotFoundError(ScanServiceError):
+    """Raised when a scan is unknown to the service, e.g. after the service restarted"""
+    pass
+
+
+def settings_to_dict(settings: ScanSettings) -> Dict[str, Any]:
+    """Convert scan settings to JSON-serialisable form."""
+    return dict(asdict(settings), selection_strategy=settings.selection_strategy.name)
+
+
+def settings_from_dict(data: Dict[str, Any]) -> ScanSettings:
+    """
+    Rebuild scan settings sent by a client.
+
+    Raises:
+        KeyError: If a setting is missing or names an unknown strategy
+        TypeError: If the I/O limits are malformed
+    """
+    return ScanSettings(
+        str(data['directory']),
+        SelectionStrategy[data['selection_strategy']],
+        checkpoint_interval=float(data['checkpoint_interval']),
+        io_limits=IOLimits(**data['io_limits']),
+        sample_large_files=bool(data['sample_large_files']),
+        update_catalog=bool(data.get('update_catalog', False)),
+        top_k=int(data.get('top_k', 0)),
+        exclude_dirs=tuple(str(entry) for entry in data.get('exclude_dirs', ()))
+    )
+
+
+def result_key(settings: ScanSettings) -> Tuple[str, str, bool, bool, int, Tuple[str, ...]]:
+    """Identify the settings that determine the results of a scan; pacing settings do not."""
+    directory = os.path.normcase(os.path.abspath(settings.directory))
+    return (directory, settings.selection_strategy.name, settings.sample_large_files, settings.update_catalog,
+            settings.top_k, tuple(sorted(exclusion_set(settings.exclude_dirs))))
+
+
+class SharedScan:
+    """A scan job shared by every session that submitted the same root and settings"""
+
+    def __init__(self, job: ScanJob) -> None:
+        self.scan_id = uuid.uuid4().hex
+        self.job = job
+        self.key = result_key(job.settings)
+        self.state = QUEUED
+        self.finished_at: Optional[float] = None
+
+    def describe(self) -> Dict[str, Any]:
+        """Return the progress and outcome of the scan for clients."""
+        job = self.job
+        finished = self.state == FINISHED
+        return {
+            'scan_id': self.scan_id,
+            'directory': job.settings.directory,
+            'state': self.state,
+            'status': job.status if self.state != QUEUED else "Waiting for another scan to finish...",
+            'progress': job.progress,
+            'num_groups': job.num_groups,
+            'reclaimable_bytes': job.reclaimable_bytes,
+            'error': job.error,
+            'cancelled': job.cancelled,
+            'done': finished,
+            # The results file is incomplete until the scan has finished
+            'results_path': job.results_path if finished else None,
+            'finished_at': datetime.fromtimestamp(self.finished_at).isoformat(timespec='seconds') if finished else None
+        }
+
+
+class ScanService:
+    """
+    Runs scans on behalf of all sessions, one at a time.
+
+    Submitting a root and settings that match a queued or running scan
+    attaches to it, and results of a matching scan that finished within the
+    TTL are handed out instead of scanning again. Running a single scan at a
+    time keeps concurrent sessions from competing for the disk and the
+    shared checkpoint.
+    """
+
+    def __init__(self, results_ttl: float = config.SCAN_SERVICE_RESULTS_TTL,
+                 idle_timeout: float = config.SCAN_SERVICE_IDLE_TIMEOUT) -> None:
+        """
+        Create an idle service.
+
+        Args:
+            results_ttl: Seconds finished results are reused for
+            idle_timeout: Seconds without requests or scans before the service may exit
+        """
+        self.results_ttl = results_ttl
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._scans: Dict[str, SharedScan] = {}
+        self._queue: Deque[SharedScan] = deque()
+        self._active: Optional[SharedScan] = None
+        self._last_request = time.monotonic()
+
+    def touch(self) -> None:
+        """Note that a client is still using the service."""
+        self._last_request = time.monotonic()
+
+    def _finish(self, scan: SharedScan) -> None:
+        """Mark a scan finished"""
+        scan.state = FINISHED
+        scan.finished_at = time.time()
+        logger.info(f"Shared scan {scan.scan_id} of {scan.job.settings.directory} finished")
+
+    def _update(self) -> None:
+        """Retire the finished scan, start the next queued one and forget expired results (lock held)"""
+        if self._active is not None and self._active.job.done:
+            self._finish(self._active)
+            self._active = None
+
+        while self._active is None and self._queue:
+            scan = self._queue.popleft()
+            if scan.job.cancelled:
+                self._finish(scan)
+                continue
+            scan.state = RUNNING
+            self._active = scan
+            scan.job.start()
+            logger.info(f"Started shared scan {scan.scan_id} of {scan.job.settings.directory}")
+
+        expired = time.time() - self.results_ttl
+        for scan_id in [scan_id for scan_id, scan in self._scans.items()
+                        if scan.state == FINISHED and scan.finished_at < expired]:
+            del self._scans[scan_id]
+
+    def _reusable(self, scan: SharedScan) -> bool:
+        """Whether a scan finished completely and recently enough to stand in for a new one"""
+        job = scan.job
+        return (scan.state == FINISHED and not job.cancelled and job.error is None
+                and time.time() - scan.finished_at <= self.results_ttl
+                and (job.results_path is None or os.path.exists(job.results_path)))
+
+    def _enqueue(self, job: ScanJob) -> SharedScan:
+        """Queue a new scan and start it if the service is idle (lock held)"""
+        scan = SharedScan(job)
+        self._scans[scan.scan_id] = scan
+        self._queue.append(scan)
+        self._update()
+        return scan
+
+    def submit(self, settings: ScanSettings, force: bool = False) -> Tuple[SharedScan, str]:
+        """
+        Submit a scan, or attach to or reuse a matching one.
+
+        Args:
+            settings: Settings to scan with
+            force: Scan again even if recent results are available
+
+        Returns:
+            Tuple of the shared scan and how the request was satisfied
+        """
+        key = result_key(settings)
+        with self._lock:
+            self._update()
+            matching = [scan for scan in self._scans.values() if scan.key == key]
+            for scan in matching:
+                if scan.state != FINISHED:
+                    return scan, OUTCOME_ATTACHED
+            reusable = [scan for scan in matching if self._reusable(scan)]
+            if reusable and not force:
+                return reusable[-1], OUTCOME_REUSED
+            return self._enqueue(ScanJob(settings)), OUTCOME_NEW
+
+    def resume(self) -> SharedScan:
+        """
+        Resume the last checkpointed scan.
+
+        Raises:
+            ScanServiceError: If another scan is queued or running
+            OSError: If there is no readable checkpoint
+        """
+        with self._lock:
+            self._update()
+            if self._active is not None or self._queue:
+                raise ScanServiceError("Another scan is running; wait for it to finish before resuming")
+            return self._enqueue(ScanJob.resume_last())
+
+    def get(self, scan_id: str) -> SharedScan:
+        """
+        Look up a scan.
+
+        Raises:
+            ScanNotFoundError: If the scan is unknown or has expired
+        """
+        with self._lock:
+            self._update()
+            try:
+                return self._scans[scan_id]
+            except KeyError:
+                raise ScanNotFoundError(f"Unknown scan {scan_id}") from None
+
+    def cancel(self, scan_id: str) -> SharedScan:
+        """Cancel a scan for every session attached to it."""
+        scan = self.get(scan_id)
+        with self._lock:
+            scan.job.cancel()
+            if scan in self._queue:
+                self._queue.remove(scan)
+                self._finish(scan)
+            self._update()
+        return scan
+
+    def checkpoint_info(self) -> Optional[Dict[str, Any]]:
+        """Describe the resumable checkpoint, or None if there is none or a scan owns it."""
+        with self._lock:
+            self._update()
+            if self._active is not None or self._queue:
+                return None
+        return ScanJob.last_checkpoint_info()
+
+    def idle(self) -> bool:
+        """Whether nothing is scanning and no client has called for the idle timeout."""
+        with self._lock:
+            self._update()
+            busy = self._active is not None or bool(self._queue)
+        return not busy and time.monotonic() - self._last_request > self.idle_timeout
+
+    def run_monitor(self, server: ThreadingHTTPServer) -> None:
+        """Advance the queue as scans finish and stop the server once idle."""
+        while not self.idle():
+            time.sleep(config.SCAN_POLL_INTERVAL)
+        logger.info("Scan service idle, shutting down")
+        server.shutdown()
+
+
+class ScanServiceHandler(BaseHTTPRequestHandler):
+    """Routes JSON requests from local clients to the scan service"""
+
+    service: ScanService
+    token: str
+
+    def do_GET(self) -> None:
+        self._handle('GET')
+
+    def do_POST(self) -> None:
+        self._handle('POST')
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug(format % args)
+
+    def _send(self, status: int, body: Dict[str, Any]) -> None:
+        """Write a JSON response"""
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self, method: str) -> None:
+        """Authenticate, route and answer a request"""
+        if not hmac.compare_digest(self.headers.get(TOKEN_HEADER, ''), self.token):
+            self._send(403, {'error': "Invalid scan service token"})
+            return
+        self.service.touch()
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length)) if length else {}
+            self._send(200, self._route(method, body))
+        except ScanNotFoundError as e:
+            self._send(404, {'error': str(e)})
+        except ScanServiceError as e:
+            self._send(409, {'error': str(e)})
+        except (KeyError, TypeError, ValueError) as e:
+            self._send(400, {'error': f"Invalid request: {str(e)}"})
+        except Exception as e:
+            logger.error(f"Error handling {method} {self.path}: {str(e)}")
+            self._send(500, {'error': str(e)})
+
+    def _route(self, method: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        """Dispatch a request to the service"""
+        parts = urlsplit(self.path).path.strip('/').split('/')
+        if method == 'GET' and parts == ['health']:
+            return {'pid': os.getpid()}
+        if method == 'GET' and parts == ['checkpoint']:
+            return {'info': self.service.checkpoint_info()}
+        if method == 'POST' and parts == ['scans']:
+            scan, outcome = self.service.submit(settings_from_dict(body['settings']), bool(body.get('force')))
+            return dict(scan.describe(), outcome=outcome)
+        if method == 'POST' and parts == ['scans', 'resume']:
+            return dict(self.service.resume().describe(), outcome=OUTCOME_NEW)
+        if len(parts) >= 2 and parts[0] == 'scans':
+            if method == 'GET' and len(parts) == 2:
+                return self.service.get(parts[1]).describe()
+            if method == 'GET' and parts[2:] == ['live']:
+                return {'groups': [asdict(group) for group in self.service.get(parts[1]).job.live_groups()]}
+            if method == 'POST' and parts[2:] == ['cancel']:
+                return self.service.cancel(parts[1]).describe()
+        raise ScanNotFoundError(f"Unknown request {method} {self.path}")
+
+
+def _read_service_file() -> Optional[Dict[str, Any]]:
+    """Read the address and token published by the running service"""
+    try:
+        with open(config.SCAN_SERVICE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_service_file(info: Dict[str, Any]) -> None:
+    """Publish the service address and token, readable by the current user only"""
+    temp_path = config.SCAN_SERVICE_FILE + '.tmp'
+    with os.fdopen(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w', encoding='utf-8') as f:
+        json.dump(info, f)
+    os.replace(temp_path, config.SCAN_SERVICE_FILE)
+
+
+@contextmanager
+def _spawn_lock() -> Iterator[None]:
+    """
+    Hold the lock that lets one client at a time start the service, across sessions and processes.
+
+    A client holds the lock for at most the start timeout, so a lock older than
+    twice that was left behind by a client that died and is broken.
+
+    Raises:
+        ScanServiceError: If the lock could not be taken in time
+    """
+    timeout = 2 * config.SCAN_SERVICE_START_TIMEOUT
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fd = os.open(config.SCAN_SERVICE_LOCK_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(config.SCAN_SERVICE_LOCK_FILE) > timeout:
+                    os.remove(config.SCAN_SERVICE_LOCK_FILE)
+                    continue
+            except OSError:
+                pass  # Released in the meantime
+        if time.monotonic() >= deadline:
+            raise ScanServiceError("Timed out waiting for another session to start the scan service")
+        time.sleep(0.1)
+    try:
+        os.write(fd, str(os.getpid()).encode('ascii'))
+        os.close(fd)
+        yield
+    finally:
+        os.remove(config.SCAN_SERVICE_LOCK_FILE)
+
+
+class RemoteScanJob:
+    """A session's view of a shared scan, exposing the ScanJob attributes the UI reads"""
+
+    def __init__(self, client: 'ScanServiceClient', description: Dict[str, Any]) -> None:
+        self._client = client
+        self.scan_id: str = description['scan_id']
+        self.outcome: str = description.get('outcome', OUTCOME_ATTACHED)
+        self._update(description)
+
+    def _update(self, description: Dict[str, Any]) -> None:
+        """Take the state reported by the service"""
+        self.directory: str = description['directory']
+        self.state: str = description['state']
+        self.status: str = description['status']
+        self.progress: float = description['progress']
+        self.num_groups: int = description['num_groups']
+        self.reclaimable_bytes: int = description['reclaimable_bytes']
+        self.error: Optional[str] = description['error']
+        self.cancelled: bool = description['cancelled']
+        self.done: bool = description['done']
+        self.results_path: Optional[str] = description['results_path']
+        self.finished_at: Optional[str] = description['finished_at']
+
+    def refresh(self) -> 'RemoteScanJob':
+        """Fetch the latest state of the scan."""
+        self._update(self._client.request('GET', f"/scans/{self.scan_id}"))
+        return self
+
+    def cancel(self) -> None:
+        """Cancel the scan, for every session attached to it."""
+        self._update(self._client.request('POST', f"/scans/{self.scan_id}/cancel"))
+
+    def live_groups(self) -> List[LiveGroup]:
+        """Return the groups confirmed so far, most reclaimable first."""
+        response = self._client.request('GET', f"/scans/{self.scan_id}/live")
+        return [LiveGroup(**group) for group in response['groups']]
+
+
+class ScanServiceClient:
+    """Client for the local scan service, starting the service when it is not running"""
+
+    def __init__(self, start_service: bool = True) -> None:
+        """
+        Create a client.
+
+        Args:
+            start_service: Start the service in a background process if it is not running
+        """
+        self.start_service = start_service
+        self._info: Optional[Dict[str, Any]] = None
+        # The client is shared by every session of the app, so one at a time connects
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _send(info: Dict[str, Any], method: str, path: str, body: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Send one request to the service.
+
+        Raises:
+            ScanServiceError: If the service rejected the request
+            OSError: If the service could not be reached
+        """
+        request = urlrequest.Request(
+            f"http://{info['host']}:{info['port']}{path}",
+            data=json.dumps(body).encode('utf-8') if body is not None else None,
+            method=method,
+            headers={TOKEN_HEADER: info['token'], 'Content-Type': 'application/json'}
+        )
+        try:
+            with urlrequest.urlopen(request, timeout=config.SCAN_SERVICE_REQUEST_TIMEOUT) as response:
+                return json.loads(response.read())
+        except urlerror.HTTPError as e:
+            try:
+                message = json.loads(e.read()).get('error', e.reason)
+            except ValueError:
+                message = e.reason
+            raise (ScanNotFoundError if e.code == 404 else ScanServiceError)(message) from None
+
+    def ping(self) -> bool:
+        """Whether the service published in the app data directory is answering."""
+        info = _read_service_file()
+        if info is None:
+            return False
+        try:
+            self._send(info, 'GET', '/health')
+        except (ScanServiceError, OSError, ValueError):
+            return False
+        with self._lock:
+            self._info = info
+        return True
+
+    @staticmethod
+    def _spawn() -> None:
+        """Start the service as a detached background process"""
+        module_path = os.path.abspath(__file__)
+        options: Dict[str, Any] = {}
+        if sys.platform == 'win32':
+            options['creationflags'] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+        else:
+            options['start_new_session'] = True
+        subprocess.Popen(
+            [sys.executable, module_path],
+            cwd=os.path.dirname(module_path),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            close_fds=True,
+            **options
+        )
+
+    def _connect(self) -> Dict[str, Any]:
+        """
+        Find the running service, starting it if allowed.
+
+        Raises:
+            ScanServiceError: If no service is running or it failed to start
+        """
+        with self._lock:
+            if self.ping():
+                return self._info
+            if not self.start_service:
+                raise ScanServiceError("Scan service is not running")
+
+            with _spawn_lock():
+                # Another session or process may have started the service while this one waited for the lock
+                if self.ping():
+                    return self._info
+                logger.info("Starting scan service")
+                self._spawn()
+                deadline = time.monotonic() + config.SCAN_SERVICE_START_TIMEOUT
+                while time.monotonic() < deadline:
+                    time.sleep(0.1)
+                    if self.ping():
+                        return self._info
+            raise ScanServiceError(f"Scan service did not start, see {config.SCAN_SERVICE_LOG_FILE}")
+
+    def request(self, method: str, path: str, body: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Send a request to the service, reconnecting once if it went away.
+
+        Args:
+            method: HTTP method
+            path: Request path
+            body: JSON body to send
+
+        Returns:
+            Dict: Decoded JSON response
+
+        Raises:
+            ScanServiceError: If the service rejected the request or cannot be reached
+        """
+        try:
+            return self._send(self._info or self._connect(), method, path, body)
+        except OSError:
+            # The service may have exited after idling or been restarted on another port
+            with self._lock:
+                self._info = None
+        try:
+            return self._send(self._connect(), method, path, body)
+        except OSError as e:
+            raise ScanServiceError(f"Scan service unavailable: {str(e)}") from e
+
+    def submit(self, settings: ScanSettings, force: bool = False) -> RemoteScanJob:
+        """
+        Start a scan, or attach to or reuse a matching one.
+
+        Args:
+            settings: Settings to scan with
+            force: Scan again even if recent results are available
+
+        Returns:
+            RemoteScanJob: The shared scan; its `outcome` says whether it is new
+        """
+        return RemoteScanJob(self, self.request('POST', '/scans', {'settings': settings_to_dict(settings), 'force': force}))
+
+    def resume_last(self) -> RemoteScanJob:
+        """Resume the last checkpointed scan."""
+        return RemoteScanJob(self, self.request('POST', '/scans/resume'))
+
+    def last_checkpoint_info(self) -> Optional[Dict[str, Any]]:
+        """Describe the last checkpointed scan, or None if there is nothing to resume."""
+        return self.request('GET', '/checkpoint')['info']
+
+
+def serve() -> None:
+    """Run the scan service in this process until it has been idle for the configured timeout."""
+    if ScanServiceClient(start_service=False).ping():
+        logger.info("Scan service is already running")
+        return
+
+    service = ScanService()
+    token = secrets.token_urlsafe(32)
+    handler = type('Handler', (ScanServiceHandler,), {'service': service, 'token': token})
+    # Port 0 lets the OS pick a free port, published with the token in the service file
+    server = ThreadingHTTPServer((config.SCAN_SERVICE_HOST, 0), handler)
+    _write_service_file({
+        'host': config.SCAN_SERVICE_HOST,
+        'port': server.server_address[1],
+        'token': token,
+        'pid': os.getpid()
+    })
+    threading.Thread(target=service.run_monitor, args=(server,), name="scan-service-monitor", daemon=True).start()
+    logger.info(f"Scan service listening on {config.SCAN_SERVICE_HOST}:{server.server_address[1]}")
+
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if (_read_service_file() or {}).get('pid') == os.getpid():
+            os.remove(config.SCAN_SERVICE_FILE)
+
+
+if __name__ == '__main__':
+    configure_logging(config.SCAN_SERVICE_LOG_FILE)
+    serve()
@@ -0,0 +1,394 @@
+import os
+import asyncio
+import logging
+import time
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from enum import Enum
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import config
+from file_operations import FilePath, FileHash, FileId, FileOperations, FileOperationError
+from content_catalog import ContentCatalog
+from directory_digests import find_duplicate_directories
+from results_store import MATCH_CONTENT, ResultsWriter, new_results_path, remove_results
+from checkpoint import ScanCheckpoint
+from io_governor import IOGovernor, IOLimits, lower_io_priority
+from autotuner import ConcurrencyTuner
+from scan_metrics import record_scan_metrics
+from scan_pipeline import autotune_stage
+from tree_walk import TreeWalk
+from file_hasher import FileHasher
+from group_hashing import GroupHasher
+from group_output import GroupOutput, LiveGroup
+from log_setup import SkipSummary
+from progress_reporter import ProgressReporter
+
+logger = logging.getLogger(__name__)
+
+# Define SelectionStrategy enum
+class SelectionStrategy(Enum):
+    """Strategy for selecting which duplicate to keep."""
+    NEWEST = "Keep newest file"
+    OLDEST = "Keep oldest file"
+    SHORTEST_PATH = "Keep file with shortest path"
+    LONGEST_PATH = "Keep file with longest path"
+
+def sort_group_by_strategy(group: List[FilePath], strategy: SelectionStrategy) -> List[FilePath]:
+    """
+    Sort a duplicate group so the file to keep comes first.
+
+    Strategies that compare modification times put files that can no longer
+    be read last, so a file deleted since the scan is never the one kept.
+    """
+    if strategy in (SelectionStrategy.NEWEST, SelectionStrategy.OLDEST):
+        modified = {}
+        for f in group:
+            try:
+                modified[f] = FileOperations.get_file_info(f).modified
+            except FileOperationError:
+                pass
+        readable = sorted(modified, key=modified.get, reverse=strategy == SelectionStrategy.NEWEST)
+        return readable + [f for f in group if f not in modified]
+    # SHORTEST_PATH or LONGEST_PATH
+    return sorted(group, key=lambda f: len(str(f)), reverse=strategy == SelectionStrategy.LONGEST_PATH)
+
+@dataclass
+class ScanSettings:
+    """Settings a scan is started with"""
+    directory: str
+    selection_strategy: SelectionStrategy = SelectionStrategy.NEWEST
+    checkpoint_interval: float = config.CHECKPOINT_INTERVAL  # Seconds, 0 disables checkpoints
+    io_limits: IOLimits = field(default_factory=IOLimits)
+    sample_large_files: bool = False  # Hash files above MAX_FILE_SIZE from samples only
+    update_catalog: bool = False  # Record every scanned file in the content catalog
+    top_k: int = 0  # Keep only this many groups, those reclaiming the most space; 0 keeps every group
+    exclude_dirs: Tuple[str, ...] = ()  # Names or full paths of directories left out of the scan, with their subtrees
+
+
+class ScanJob:
+    """Runs a duplicate scan on a background thread and publishes its progress"""
+
+    def __init__(self, settings: ScanSettings, resume: bool = False) -> None:
+        """
+        Prepare a scan job.
+
+        Args:
+            settings: Settings to scan with
+            resume: Continue the scan saved in the checkpoint instead of starting over
+        """
+        self.settings = settings
+        self.resume = resume
+        self.results_path: Optional[str] = new_results_path()
+        self.status = "Starting scan..."
+        self.progress = 0.0
+        self.error: Optional[str] = None
+        self._cancel_event = threading.Event()
+        self._output = GroupOutput(settings.top_k)
+        self._thread = threading.Thread(target=self._run, name="scan-job", daemon=True)
+
+        # Scan state, kept on the job so it can be checkpointed
+        self._checkpoint = ScanCheckpoint()
+        self._checkpointing = settings.checkpoint_interval > 0
+        self._last_checkpoint = time.monotonic()
+        self._walk_complete = False
+        self._governor = IOGovernor(settings.io_limits, self._cancel_event)
+        self._skipped = SkipSummary(logger, "scanning")
+        self._walk = TreeWalk(self._skipped, self._cancel_event, self._set_status, settings.exclude_dirs)
+        self._progress = ProgressReporter(self._set_progress, lambda file_id: self._walk.path_store.path(file_id),
+                                          lambda: self._governor.bytes_read)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._hasher: Optional[FileHasher] = None
+        self._group_hasher: Optional[GroupHasher] = None
+
+        # Hashing workers are tuned to the measured read throughput
+        self._walk_seconds = 0.0
+        self._hash_tuner = ConcurrencyTuner("hash", config.SCAN_HASH_WORKERS, config.SCAN_MAX_HASH_WORKERS,
+                                            lambda: self._governor.bytes_read)
+
+    @classmethod
+    def resume_last(cls) -> 'ScanJob':
+        """
+        Create a job that resumes the last checkpointed scan.
+
+        Raises:
+            OSError: If there is no readable checkpoint
+        """
+        return cls(ScanCheckpoint().load_settings(), resume=True)
+
+    @staticmethod
+    def last_checkpoint_info() -> Optional[Dict[str, Any]]:
+        """Describe the last checkpointed scan, or None if there is nothing to resume."""
+        checkpoint = ScanCheckpoint()
+        return checkpoint.info() if checkpoint.exists() else None
+
+    def start(self) -> 'ScanJob':
+        """Start scanning in the background."""
+        self._thread.start()
+        return self
+
+    def cancel(self) -> None:
+        """Ask the scan to stop after the current file."""
+        self._cancel_event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        """Whether cancellation was requested"""
+        return self._cancel_event.is_set()
+
+    @property
+    def done(self) -> bool:
+        """Whether the scan thread has finished"""
+        return self._thread.ident is not None and not self._thread.is_alive()
+
+    @property
+    def num_groups(self) -> int:
+        """Number of duplicate groups confirmed so far"""
+        return self._output.num_groups
+
+    @property
+    def reclaimable_bytes(self) -> int:
+        """Bytes freed by keeping one copy of each group confirmed so far"""
+        return self._output.reclaimable_bytes
+
+    def live_groups(self) -> List[LiveGroup]:
+        """Return the groups confirmed so far, most reclaimable first."""
+        return self._output.live_groups()
+
+    def _run(self) -> None:
+        """Thread entry point"""
+        if self.settings.io_limits.low_priority:
+            lower_io_priority()
+        started = time.monotonic()
+        try:
+            self._scan()
+        except Exception as e:
+            logger.error(f"An error occurred while scanning: {str(e)}")
+            self.error = str(e)
+        self._skipped.flush()
+        self._record_metrics(time.monotonic() - started)
+
+        # A failed scan may not have created its results file, or left it unfinished
+        if self.results_path and (self.error or not self.num_groups):
+            remove_results(self.results_path)
+            self.results_path = None
+
+    def _set_status(self, status: str) -> None:
+        """Publish the current activity to readers"""
+        self.status = status
+
+    def _set_progress(self, progress: float, status: str) -> None:
+        """Publish hashing progress to readers"""
+        self.progress = progress
+        self.status = status
+
+    def _record_metrics(self, seconds: float) -> None:
+        """Log throughput and the tuned worker counts of this run"""
+        files_listed = self._walk.files_listed
+        record_scan_metrics({
+            'finished_at': datetime.now().isoformat(timespec='seconds'),
+            'directory': self.settings.directory,
+            'completed': not self.cancelled and not self.error,
+            'seconds': round(seconds, 3),
+            'walk_seconds': round(self._walk_seconds, 3),
+            'files_listed': files_listed,
+            'files_skipped': self._skipped.total,
+            'files_per_second': round(files_listed / self._walk_seconds, 1) if self._walk_seconds else None,
+            'files_opened': self._governor.files_opened,
+            'bytes_read': self._governor.bytes_read,
+            'bytes_per_second': round(self._governor.bytes_read / seconds) if seconds else None,
+            'walk_workers': self._walk.walk_tuner.level,
+            'stat_workers': self._walk.stat_tuner.level,
+            'hash_workers': self._hash_tuner.level,
+            'groups': self.num_groups,
+            'reclaimable_bytes': self.reclaimable_bytes,
+        })
+
+    def _checkpoint_info(self, phase: str) -> Dict[str, Any]:
+        """Short description of the scan stored with each checkpoint"""
+        return {
+            'directory': self.settings.directory,
+            'phase': phase,
+            'files': self._walk.total_files,
+            'groups': self.num_groups,
+        }
+
+    def _save_walk(self, walk_complete: bool) -> None:
+        """Checkpoint the walk frontier, path store and size groups"""
+        state = dict(self._walk.state(), walk_complete=walk_complete)
+        self._checkpoint.save_walk(state, self._checkpoint_info('hashing' if walk_complete else 'walking'))
+        self._last_checkpoint = time.monotonic()
+
+    def _save_hashing(self) -> None:
+        """Checkpoint completed size groups and hashes of the group in progress"""
+        self._checkpoint.save_hashing(self._group_hasher.state(), self._checkpoint_info('hashing'))
+        self._last_checkpoint = time.monotonic()
+
+    def _checkpoint_due(self) -> bool:
+        """Whether the configured checkpoint interval has elapsed"""
+        return (self._checkpointing and
+                time.monotonic() - self._last_checkpoint >= self.settings.checkpoint_interval)
+
+    def _save_hashing_if_due(self) -> None:
+        """Checkpoint hashing progress once the checkpoint interval has elapsed"""
+        if self._checkpoint_due():
+            self._save_hashing()
+
+    def _scan(self) -> None:
+        """Find duplicate files, streaming each confirmed group to the results file"""
+        walk_state, hash_state = None, None
+        if self.resume:
+            walk_state, hash_state = self._checkpoint.load()
+        elif self._checkpointing:
+            self._checkpoint.start(self.settings)
+        else:
+            self._checkpoint.remove()
+
+        spill_dir = self._checkpoint.runs_dir if self._checkpointing else config.SPILL_DIR
+        if walk_state:
+            self._walk.restore(walk_state, spill_dir)
+        else:
+            self._walk.start(str(self.settings.directory), spill_dir)
+
+        # Blocking directory listing, stat and hashing calls run on these threads
+        self._executor = ThreadPoolExecutor(
+            max_workers=config.SCAN_MAX_WALK_WORKERS + config.SCAN_MAX_STAT_WORKERS + config.SCAN_MAX_HASH_WORKERS,
+            thread_name_prefix="scan-io",
+            initializer=lower_io_priority if self.settings.io_limits.low_priority else None
+        )
+        self._hasher = FileHasher(self._walk.path_store, self._executor, self._governor, self._skipped,
+                                  self._cancel_event, self.settings.sample_large_files, self.settings.update_catalog)
+        self._group_hasher = GroupHasher(self._hasher, self._output, self._progress, self._cancel_event,
+                                         self._save_hashing_if_due)
+        if hash_state:
+            self._group_hasher.restore(hash_state)
+        completed = False
+        try:
+            with ResultsWriter(self.results_path, top_k=self.settings.top_k) as results_writer:
+                # Groups confirmed before the checkpoint are replayed, not recomputed
+                for size, file_hash, group, match in self._checkpoint.iter_groups() if self.resume else ():
+                    self._emit_group(results_writer, size, file_hash, group, match, log=False)
+
+                self._walk_complete = bool(walk_state and walk_state['walk_complete'])
+                if not self._walk_complete:
+                    walk_started = time.monotonic()
+                    asyncio.run(self._walk_pipeline())
+                    self._skipped.flush()
+                    self._walk_seconds = time.monotonic() - walk_started
+                    # The walk only stops between directories, so an empty frontier means it finished
+                    self._walk_complete = not self._walk.frontier
+                    if self._checkpointing:
+                        self._save_walk(self._walk_complete)
+                    if self.cancelled:
+                        return
+
+                self._hash(results_writer)
+                self._group_hasher.group_placeholders(
+                    self._walk.placeholders, lambda *group: self._emit_group(results_writer, *group))
+                if self.settings.top_k:
+                    self._output.write_top_groups(results_writer, self._walk.path_store)
+                if not self.cancelled and self.settings.update_catalog:
+                    self._update_catalog()
+                # Only some duplicate files have a known digest in top-K mode, so trees can't be compared
+                if not self.cancelled and not self.settings.top_k:
+                    self._group_directories(results_writer)
+            completed = not self.cancelled
+            if completed:
+                self._set_progress(1.0, "Scan complete")
+        finally:
+            if self._checkpointing and self.cancelled and self._walk_complete:
+                # Save where hashing stopped so the cancelled scan can be resumed
+                self._save_hashing()
+            self._walk.close(keep_runs=self._checkpointing and not completed)
+            if completed:
+                self._checkpoint.remove()
+            self._checkpoint.close()
+            self._executor.shutdown(cancel_futures=True)
+
+    async def _walk_pipeline(self) -> None:
+        """First pass: Group files by size, walking directories from the frontier and hashing candidates early"""
+        self._hasher.limit = self._hash_tuner.limiter()
+        # Early hashes may be spent on groups that don't make the top K
+        early_hashing = not self.settings.top_k
+        stages = self._group_hasher.early_hash_stages() if early_hashing else []
+        stages.append(autotune_stage(self._walk.walk_tuner, self._walk.stat_tuner, self._hash_tuner))
+        try:
+            await self._walk.run(
+                self._executor, stages,
+                on_resident=self._group_hasher.queue_early_hash if early_hashing else None,
+                checkpoint_due=self._checkpoint_due,
+                save_checkpoint=(lambda: self._save_walk(walk_complete=False)) if self._checkpointing else None
+            )
+        finally:
+            self._group_hasher.end_early_hashing()
+
+    def _hash(self, results_writer: ResultsWriter) -> None:
+        """Second pass: Hash size groups, skipping work completed before a checkpoint"""
+        asyncio.run(self._hash_pipeline(results_writer))
+        if not self.cancelled:
+            self._set_progress(1.0, "Hashing complete")
+
+    async def _hash_pipeline(self, results_writer: ResultsWriter) -> None:
+        """Resolve size groups concurrently, most potentially reclaimable bytes first"""
+        if self._walk.files_by_size.spilled:
+            self.status = "Merging size groups spilled to disk..."
+        self._hasher.limit = self._hash_tuner.limiter()
+        await self._group_hasher.run(self._walk.files_by_size, lambda *group: self._emit_group(results_writer, *group),
+                                     [autotune_stage(self._hash_tuner)])
+
+    def _emit_group(self, results_writer: ResultsWriter, size: int, file_hash: FileHash,
+                    group: List[FileId], match: str = MATCH_CONTENT, log: bool = True) -> None:
+        """Stream a confirmed group to the results file, sorted by selection strategy"""
+        paths = self._walk.path_store.paths(group)
+        if log:
+            ids_by_path = dict(zip(paths, group))
+            # Files deleted since they were hashed are dropped, along with groups they leave without a duplicate
+            paths = [path for path in paths if os.path.exists(path)]
+            if len(paths) < 2:
+                return
+            paths = sort_group_by_strategy(paths, self.settings.selection_strategy)
+            group = [ids_by_path[path] for path in paths]
+            if self._checkpointing:
+                self._checkpoint.append_group(size, file_hash, group, match)
+        self._output.add(results_writer, size, file_hash, group, paths, match)
+
+    def _update_catalog(self) -> None:
+        """Replace the catalogued files under the scanned directory with those found by this scan"""
+        if not self._walk_complete:
+            return
+        self.status = "Updating content catalog..."
+        path_store, catalog_hashes = self._walk.path_store, self._hasher.catalog_hashes
+
+        def iter_files() -> Iterator[Tuple[str, int, Optional[int], Optional[FileHash], Optional[FileHash]]]:
+            for size, file_ids in self._walk.files_by_size.iter_all():
+                for file_id in file_ids:
+                    mtime_ns, partial, digest = catalog_hashes.get(file_id, (None, None, None))
+                    yield path_store.path(file_id), size, mtime_ns, partial, digest
+
+        try:
+            with ContentCatalog() as catalog:
+                catalog.replace_tree(self.settings.directory, iter_files())
+        except sqlite3.Error as e:
+            logger.error(f"Could not update the content catalog: {str(e)}")
+        self._hasher.catalog_hashes = {}
+
+    def _group_directories(self, results_writer: ResultsWriter) -> None:
+        """Report directory trees whose files are all duplicates of each other, once the walk is complete"""
+        if not self._walk_complete or self._walk.incomplete_dirs is None:
+            return
+        self.status = "Finding duplicate directories..."
+        path_store = self._walk.path_store
+        groups = find_duplicate_directories(path_store, self._output.content_digests, self._walk.incomplete_dirs)
+        for digest, size, file_count, dir_ids in groups:
+            paths = [path_store.directory_path(dir_id) for dir_id in dir_ids]
+            try:
+                paths = sort_group_by_strategy(paths, self.settings.selection_strategy)
+            except FileOperationError as e:
+                logger.warning(f"Could not sort duplicate directories: {str(e)}")
+            results_writer.add_directory_group(size, file_count, digest, paths)
+        self._output.content_digests = {}
+        if groups:
+            logger.info(f"Found {len(groups)} groups of duplicate directories")
@@ -0,0 +1,242 @@
+import os
+import heapq
+import struct
+import tempfile
+import itertools
+from array import array
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+import config
+
+# Run file record: file size followed by the file id in the PathStore
+RECORD = struct.Struct('<QQ')
+# Records read from a run file at a time
+RUN_READ_RECORDS = 4096
+# Approximate memory cost of a new size key (dict slot, int and array objects)
+SIZE_KEY_OVERHEAD = 180
+
+
+def _read_run(run_file: BinaryIO) -> Iterator[Tuple[int, int]]:
+    """Yield (size, file id) records from a sorted run file"""
+    run_file.seek(0)
+    while chunk := run_file.read(RECORD.size * RUN_READ_RECORDS):
+        yield from RECORD.iter_unpack(chunk)
+
+
+class SizeGrouper:
+    """
+    Groups file ids by size under a memory budget.
+
+    Records are kept in memory until the budget is exceeded, then spilled to
+    sorted run files which are merged when the candidate groups are read back.
+    """
+
+    def __init__(self, memory_budget: Optional[int] = config.SIZE_GROUPING_MEMORY_BUDGET,
+                 spill_dir: Optional[str] = config.SPILL_DIR) -> None:
+        """
+        Create an empty grouper.
+
+        Args:
+            memory_budget: Approximate bytes of records held in memory before
+                spilling to disk, or None to never spill
+            spill_dir: Directory for temporary run files, defaults to the system temp dir
+        """
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        self.total_files = 0
+        # Files and bytes in groups of two or more, known once reclaimable-order iteration has started
+        self.candidate_files: Optional[int] = None
+        self.candidate_bytes: Optional[int] = None
+        self._files_by_size: Dict[int, array] = {}
+        self._buffered_bytes = 0
+        self._runs: List[BinaryIO] = []
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any], memory_budget: Optional[int] = config.SIZE_GROUPING_MEMORY_BUDGET,
+                   spill_dir: Optional[str] = config.SPILL_DIR) -> 'SizeGrouper':
+        """
+        Recreate a grouper from a saved state.
+
+        Args:
+            state: State returned by state()
+            memory_budget: Approximate bytes of records held in memory before spilling
+            spill_dir: Directory for new run files
+
+        Raises:
+            OSError: If a saved run file can no longer be opened
+        """
+        grouper = cls(memory_budget, spill_dir)
+        grouper.total_files = state['total_files']
+        grouper._files_by_size = state['files_by_size']
+        grouper._buffered_bytes = state['buffered_bytes']
+        grouper._runs = [open(run_path, 'r+b') for run_path in state['runs']]
+        return grouper
+
+    def state(self) -> Dict[str, Any]:
+        """Return a picklable snapshot of the grouper, referencing its run files by path."""
+        for run in self._runs:
+            run.flush()
+        return {
+            'total_files': self.total_files,
+            'files_by_size': self._files_by_size,
+            'buffered_bytes': self._buffered_bytes,
+            'runs': [run.name for run in self._runs],
+        }
+
+    @property
+    def run_count(self) -> int:
+        """Number of run files currently on disk"""
+        return len(self._runs)
+
+    @property
+    def spilled(self) -> bool:
+        """Whether any records have been written to disk"""
+        return bool(self._runs)
+
+    def add(self, size: int, file_id: int) -> None:
+        """Add a file to its size group, spilling to disk if over budget."""
+        group = self._files_by_size.get(size)
+        if group is None:
+            group = self._files_by_size[size] = array('Q')
+            self._buffered_bytes += SIZE_KEY_OVERHEAD
+        group.append(file_id)
+        self._buffered_bytes += group.itemsize
+        self.total_files += 1
+
+        if self.memory_budget is not None and self._buffered_bytes > self.memory_budget:
+            self._spill()
+
+    def _spill(self) -> None:
+        """Write the in-memory records to a new sorted run file"""
+        run_file = self._new_run_file()
+        self._write_run(run_file, self._sorted_buffer())
+        self._runs.append(run_file)
+        self._files_by_size = {}
+        self._buffered_bytes = 0
+
+        # Keep the merge fan-in bounded by folding existing runs into one
+        if len(self._runs) >= config.SPILL_MAX_MERGE_RUNS:
+            merged = self._new_run_file()
+            self._write_run(merged, heapq.merge(*(_read_run(run) for run in self._runs),
+                                                key=lambda record: record[0]))
+            self._remove_runs()
+            self._runs = [merged]
+
+    def _new_run_file(self) -> BinaryIO:
+        """Create a named run file so it can be referenced from a checkpoint"""
+        return tempfile.NamedTemporaryFile(dir=self.spill_dir, prefix='size_run_', delete=False)
+
+    def _remove_runs(self) -> None:
+        """Close and delete all run files"""
+        for run in self._runs:
+            run.close()
+            try:
+                os.remove(run.name)
+            except OSError:
+                continue
+        self._runs = []
+
+    @staticmethod
+    def _write_run(run_file: BinaryIO, records: Iterator[Tuple[int, int]]) -> None:
+        """Write (size, file id) records to a run file"""
+        for size, file_id in records:
+            run_file.write(RECORD.pack(size, file_id))
+        run_file.flush()
+
+    def _sorted_buffer(self) -> Iterator[Tuple[int, int]]:
+        """Yield in-memory records ordered by size"""
+        for size in sorted(self._files_by_size):
+            for file_id in self._files_by_size[size]:
+                yield size, file_id
+
+    def iter_candidates(self, most_reclaimable_first: bool = False) -> Iterator[Tuple[int, List[int]]]:
+        """
+        Yield size groups that have at least two members.
+
+        Args:
+            most_reclaimable_first: Order groups by the most bytes they could
+                reclaim, (count - 1) * size, instead of by size. All groups are
+                then indexed up front, which also sets candidate_files and
+                candidate_bytes before the first group is yielded
+
+        Returns:
+            Iterator of (size, file ids) tuples
+        """
+        if most_reclaimable_first:
+            yield from self._iter_by_reclaimable()
+        else:
+            yield from self._iter_by_size()
+
+    def iter_all(self) -> Iterator[Tuple[int, List[int]]]:
+        """Yield every size group, single files included, in ascending size order."""
+        yield from self._iter_by_size(min_count=1)
+
+    def _iter_by_size(self, min_count: int = 2) -> Iterator[Tuple[int, List[int]]]:
+        """Yield groups of at least `min_count` files in ascending size order"""
+        if not self._runs:
+            for size in sorted(self._files_by_size):
+                group = self._files_by_size[size]
+                if len(group) >= min_count:
+                    yield size, group.tolist()
+            return
+
+        records = heapq.merge(*(_read_run(run) for run in self._runs), self._sorted_buffer(),
+                              key=lambda record: record[0])
+        for size, group in itertools.groupby(records, key=lambda record: record[0]):
+            file_ids = [file_id for _, file_id in group]
+            if len(file_ids) >= min_count:
+                yield size, file_ids
+
+    def _iter_by_reclaimable(self) -> Iterator[Tuple[int, List[int]]]:
+        """Yield candidate groups with the most potentially reclaimable bytes first"""
+        if not self._runs:
+            sizes = [size for size, group in self._files_by_size.items() if len(group) > 1]
+            sizes.sort(key=lambda size: (len(self._files_by_size[size]) - 1) * size, reverse=True)
+            self._set_candidate_totals((size, len(self._files_by_size[size])) for size in sizes)
+            for size in sizes:
+                yield size, self._files_by_size[size].tolist()
+            return
+
+        # Stage merged candidates contiguously so they can be read back in any order
+        with tempfile.TemporaryFile(dir=self.spill_dir, prefix='size_candidates_') as staged:
+            index = []
+            for size, file_ids in self._iter_by_size():
+                index.append(((len(file_ids) - 1) * size, size, staged.tell(), len(file_ids)))
+                staged.write(array('Q', file_ids).tobytes())
+            index.sort(reverse=True)
+            self._set_candidate_totals((size, count) for _, size, _, count in index)
+
+            for _, size, offset, count in index:
+                staged.seek(offset)
+                file_ids = array('Q')
+                file_ids.frombytes(staged.read(count * file_ids.itemsize))
+                yield size, file_ids.tolist()
+
+    def _set_candidate_totals(self, groups: Iterator[Tuple[int, int]]) -> None:
+        """Record the number of files and bytes in candidate groups given as (size, count)"""
+        self.candidate_files = self.candidate_bytes = 0
+        for size, count in groups:
+            self.candidate_files += count
+            self.candidate_bytes += size * count
+
+    def close(self, keep_runs: bool = False) -> None:
+        """
+        Release buffered records and remove temporary run files.
+
+        Args:
+            keep_runs: Leave run files on disk, e.g. because a checkpoint references them
+        """
+        if keep_runs:
+            for run in self._runs:
+                run.close()
+            self._runs = []
+        else:
+            self._remove_runs()
+        self._files_by_size = {}
+        self._buffered_bytes = 0
+
+    def __enter__(self) -> 'SizeGrouper':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+# config reads these Windows locations at import time
+os.environ.setdefault('APPDATA', tempfile.mkdtemp(prefix='duplicate-cleaner-tests-'))
+for name in ('WINDIR', 'PROGRAMFILES', 'SYSTEMROOT'):
+    os.environ.setdefault(name, os.path.join(os.sep, 'nonexistent', name.lower()))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,53 @@
+from checkpoint import ScanCheckpoint
+
+
+def _append_groups(checkpoint, first, last):
+    for size in range(first, last):
+        checkpoint.append_group(size, f"{size:064x}", [size, size + 1])
+
+
+def _interrupt(checkpoint, completed_sizes):
+    """Checkpoint hashing progress as a cancelled scan does"""
+    checkpoint.save_hashing({'completed_sizes': completed_sizes, 'bucket_hashes': {}}, {'phase': 'hashing'})
+    checkpoint.close()
+
+
+def test_resume_cancel_resume_keeps_committed_groups(tmp_path):
+    checkpoint = ScanCheckpoint(str(tmp_path / 'checkpoint'))
+    checkpoint.start({'directory': 'root'})
+    checkpoint.save_walk({'walk_complete': True}, {'phase': 'hashing'})
+    _append_groups(checkpoint, 0, 10)
+    _interrupt(checkpoint, set(range(10)))
+
+    # Resumed and cancelled again before any new group was confirmed
+    resumed = ScanCheckpoint(checkpoint.directory)
+    _, hash_state = resumed.load()
+    _interrupt(resumed, hash_state['completed_sizes'])
+
+    resumed = ScanCheckpoint(checkpoint.directory)
+    _, hash_state = resumed.load()
+    assert [size for size, _, _, _ in resumed.iter_groups()] == list(range(10))
+    assert hash_state['completed_sizes'] == set(range(10))
+
+    # Groups confirmed after resuming are committed after the earlier ones
+    _append_groups(resumed, 10, 15)
+    _interrupt(resumed, set(range(15)))
+    resumed = ScanCheckpoint(checkpoint.directory)
+    resumed.load()
+    assert [size for size, _, _, _ in resumed.iter_groups()] == list(range(15))
+
+
+def test_load_drops_uncommitted_groups(tmp_path):
+    checkpoint = ScanCheckpoint(str(tmp_path / 'checkpoint'))
+    checkpoint.start({'directory': 'root'})
+    checkpoint.save_walk({'walk_complete': True}, {'phase': 'hashing'})
+    _append_groups(checkpoint, 0, 3)
+    _interrupt(checkpoint, {0, 1, 2})
+    checkpoint = ScanCheckpoint(checkpoint.directory)
+    checkpoint.load()
+    _append_groups(checkpoint, 3, 5)
+    checkpoint.close()
+
+    checkpoint = ScanCheckpoint(checkpoint.directory)
+    checkpoint.load()
+    assert [size for size, _, _, _ in checkpoint.iter_groups()] == [0, 1, 2]
@@ -0,0 +1,84 @@
+import os
+import shutil
+
+import pytest
+
+import config
+from content_catalog import ContentCatalog
+from file_operations import FileOperations
+from scanner import ScanJob, ScanSettings
+
+SIZE = 100000  # Above SMALL_FILE_SIZE, so files are hashed in two passes
+
+
+@pytest.fixture
+def scanned(tmp_path):
+    if os.path.exists(config.CATALOG_FILE):
+        os.remove(config.CATALOG_FILE)
+    tree = tmp_path / 'tree'
+    tree.mkdir()
+    content = bytes(range(256)) * (SIZE // 256) + b'x' * (SIZE % 256)
+    (tree / 'a1.bin').write_bytes(content)
+    (tree / 'a2.bin').write_bytes(content)
+    (tree / 'b1.bin').write_bytes(b'b' + content[1:])  # Differs in its first bytes
+    (tree / 'c1.bin').write_bytes(content[:-1] + b'c')  # Differs only at the end
+    (tree / 'unique.bin').write_bytes(b'u' * 123)
+    shutil.copyfile(tree / 'a1.bin', tmp_path / 'new.bin')
+
+    job = ScanJob(ScanSettings(str(tree), checkpoint_interval=0, update_catalog=True)).start()
+    job._thread.join()
+    assert job.error is None
+    return tmp_path
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    """Record the paths hashed by catalog lookups"""
+    paths = []
+    for name in ('compute_partial_hash', 'compute_file_hash'):
+        original = getattr(FileOperations, name)
+
+        def record(file_path, *args, _original=original, **kwargs):
+            paths.append(os.path.basename(file_path))
+            return _original(file_path, *args, **kwargs)
+        monkeypatch.setattr(FileOperations, name, staticmethod(record))
+    return paths
+
+
+def _rows(tree):
+    with ContentCatalog() as catalog:
+        return {
+            os.path.basename(path): (mtime_ns, partial, digest)
+            for path, mtime_ns, partial, digest in catalog._db.execute(
+                "SELECT path, mtime_ns, partial, digest FROM files WHERE path LIKE ?", (str(tree) + os.sep + '%',)
+            )
+        }
+
+
+def test_scan_stores_partial_and_full_digests(scanned):
+    rows = _rows(scanned / 'tree')
+    assert sorted(rows) == ['a1.bin', 'a2.bin', 'b1.bin', 'c1.bin', 'unique.bin']
+    assert all(rows[name][1] is not None for name in ('a1.bin', 'a2.bin', 'b1.bin', 'c1.bin'))
+    assert all(rows[name][2] is not None for name in ('a1.bin', 'a2.bin', 'c1.bin'))
+    assert rows['b1.bin'][2] is None
+    assert rows['unique.bin'] == (None, None, None)
+    for name in ('a1.bin', 'a2.bin'):
+        assert rows[name][0] == os.stat(scanned / 'tree' / name).st_mtime_ns
+
+
+def test_find_uses_stored_digests_without_reading_candidates(scanned, reads):
+    with ContentCatalog() as catalog:
+        matches = catalog.find(scanned / 'new.bin')
+    assert sorted(os.path.basename(path) for path in matches) == ['a1.bin', 'a2.bin']
+    assert set(reads) == {'new.bin'}
+
+
+def test_find_rehashes_files_changed_since_the_scan(scanned, reads):
+    changed = scanned / 'tree' / 'a2.bin'
+    changed.write_bytes(b'z' * SIZE)
+    stats = os.stat(changed)
+    os.utime(changed, ns=(stats.st_atime_ns, stats.st_mtime_ns + 10**9))
+    with ContentCatalog() as catalog:
+        matches = catalog.find(scanned / 'new.bin')
+    assert [os.path.basename(path) for path in matches] == ['a1.bin']
+    assert set(reads) == {'new.bin', 'a2.bin'}
@@ -0,0 +1,70 @@
+import os
+
+import pytest
+
+from file_operations import FileOperationError, FileOperations
+from results_store import ResultsReader
+from scanner import ScanJob, ScanSettings
+
+
+def _make_tree(root, files):
+    root.mkdir()
+    for name, content in files.items():
+        (root / name).write_bytes(content)
+
+
+@pytest.fixture
+def trees(tmp_path):
+    files = {'a.bin': b'a' * 5000, 'b.bin': b'b' * 7000, 'c.bin': b'c' * 9000}
+    _make_tree(tmp_path / 'real', files)
+    (tmp_path / 'links').mkdir()
+    for name in files:
+        os.symlink(tmp_path / 'real' / name, tmp_path / 'links' / name)
+    return tmp_path
+
+
+def _scan(directory):
+    job = ScanJob(ScanSettings(str(directory), checkpoint_interval=0)).start()
+    job._thread.join()
+    assert job.error is None
+    return job
+
+
+def test_folder_of_symlinks_is_not_a_duplicate_directory(trees):
+    _make_tree(trees / 'copy', {'a.bin': b'a' * 5000, 'b.bin': b'b' * 7000, 'c.bin': b'c' * 9000})
+    job = _scan(trees)
+    reader = ResultsReader(job.results_path)
+    assert [sorted(os.path.basename(path) for path in group.paths) for group in reader.directory_groups] == [
+        ['copy', 'real']
+    ]
+
+
+def test_delete_skips_counterparts_that_are_symlinks(trees):
+    count, errors = FileOperations.dedupe_directory(trees / 'real', trees / 'links')
+    assert (count, errors) == (0, [])
+    assert sorted(os.listdir(trees / 'real')) == ['a.bin', 'b.bin', 'c.bin']
+
+
+def test_delete_refuses_trees_overlapping_through_symlinks(trees):
+    os.symlink(trees / 'real', trees / 'alias')
+    with pytest.raises(FileOperationError):
+        FileOperations.dedupe_directory(trees / 'alias', trees / 'real')
+    assert sorted(os.listdir(trees / 'real')) == ['a.bin', 'b.bin', 'c.bin']
+
+
+def test_delete_keeps_files_edited_without_changing_size(tmp_path):
+    _make_tree(tmp_path / 'original', {'a.bin': b'a' * 5000, 'b.bin': b'b' * 7000})
+    _make_tree(tmp_path / 'copy', {'a.bin': b'a' * 5000, 'b.bin': b'B' * 7000})
+    count, errors = FileOperations.dedupe_directory(tmp_path / 'copy', tmp_path / 'original')
+    assert (count, errors) == (1, [])
+    assert os.listdir(tmp_path / 'copy') == ['b.bin']
+
+
+def test_delete_keeps_empty_files_without_counterpart_quietly(tmp_path):
+    _make_tree(tmp_path / 'original', {'a.bin': b'a' * 5000})
+    _make_tree(tmp_path / 'copy', {'a.bin': b'a' * 5000, 'empty.txt': b''})
+    (tmp_path / 'copy' / 'sub').mkdir()
+    (tmp_path / 'copy' / 'sub' / 'empty.txt').write_bytes(b'')
+    count, errors = FileOperations.dedupe_directory(tmp_path / 'copy', tmp_path / 'original')
+    assert (count, errors) == (1, [])
+    assert sorted(os.listdir(tmp_path / 'copy')) == ['empty.txt', 'sub']
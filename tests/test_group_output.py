@@ -0,0 +1,48 @@
+from group_output import GroupOutput
+from results_store import ResultsReader, ResultsWriter, new_results_path, remove_results
+
+
+class _Paths:
+    """Stands in for the path store, naming file ids by number"""
+
+    @staticmethod
+    def paths(file_ids):
+        return [f"/files/{file_id}" for file_id in file_ids]
+
+
+def _add(output, writer, size, count, first_id):
+    group = list(range(first_id, first_id + count))
+    output.add(writer, size, f"digest{first_id}", group, _Paths.paths(group), 'content')
+
+
+def test_top_k_keeps_the_most_reclaimable_groups_in_order():
+    file_path = new_results_path()
+    output = GroupOutput(top_k=2)
+    with ResultsWriter(file_path, top_k=2) as writer:
+        _add(output, writer, 100, 2, 0)     # 100 reclaimable
+        _add(output, writer, 10, 3, 10)     # 20
+        _add(output, writer, 50, 5, 20)     # 200
+        _add(output, writer, 100, 2, 30)    # 100, a tie lost to the group found first
+        assert [group.reclaimable_bytes for group in output.live_groups()] == [200, 100]
+        assert (output.num_groups, output.reclaimable_bytes) == (2, 300)
+        assert output.outranked(100, 2)
+        assert not output.outranked(101, 2)
+        output.write_top_groups(writer, _Paths)
+
+    groups = list(ResultsReader(file_path).iter_groups())
+    assert [(group.size, group.paths[0]) for group in groups] == [(50, '/files/20'), (100, '/files/0')]
+    assert (output.num_groups, output.reclaimable_bytes) == (2, 300)
+    remove_results(file_path)
+
+
+def test_without_top_k_every_group_is_written_as_found():
+    file_path = new_results_path()
+    output = GroupOutput()
+    with ResultsWriter(file_path) as writer:
+        _add(output, writer, 10, 2, 0)
+        _add(output, writer, 100, 2, 10)
+        assert not output.outranked(1, 2)
+    assert [group.size for group in ResultsReader(file_path).iter_groups()] == [10, 100]
+    assert [group.size for group in output.live_groups()] == [100, 10]
+    assert set(output.content_digests) == {0, 1, 10, 11}
+    remove_results(file_path)
@@ -0,0 +1,55 @@
+import time
+
+import pytest
+
+import config
+from io_governor import IOGovernor, IOLimits
+
+CHUNK = 8192
+
+
+class SlowFile:
+    """Endless file whose every `slow_every`-th read blocks, like a read-ahead cache missing now and then"""
+
+    def __init__(self, slow_every: int, delay: float) -> None:
+        self.slow_every = slow_every
+        self.delay = delay
+        self.reads = 0
+
+    def read(self, size: int) -> bytes:
+        self.reads += 1
+        if self.reads % self.slow_every == 0:
+            time.sleep(self.delay)
+        return b'\0' * size
+
+
+@pytest.fixture
+def small_samples(monkeypatch):
+    monkeypatch.setattr(config, 'IO_LATENCY_SAMPLE_BYTES', 16 * CHUNK)
+    monkeypatch.setattr(config, 'IO_LATENCY_WINDOW', 16)
+
+
+def _read(governor, f, samples):
+    for _ in range(samples * 16):
+        governor.read(f, CHUNK)
+
+
+def test_backoff_ignores_steady_mix_of_cached_and_disk_reads(small_samples):
+    governor = IOGovernor(IOLimits(adaptive_backoff=True))
+    _read(governor, SlowFile(slow_every=16, delay=0.002), samples=40)
+    assert governor.slowdown == 1.0
+    assert governor.bytes_read == 40 * 16 * CHUNK
+
+
+def test_backoff_slows_down_when_latency_rises(small_samples):
+    governor = IOGovernor(IOLimits(adaptive_backoff=True))
+    _read(governor, SlowFile(slow_every=16, delay=0.001), samples=16)
+    _read(governor, SlowFile(slow_every=2, delay=0.001), samples=3)
+    assert governor.slowdown > 1.0
+
+
+def test_unlimited_reads_are_counted():
+    governor = IOGovernor(IOLimits(adaptive_backoff=False))
+    governor.before_file()
+    _read(governor, SlowFile(slow_every=1, delay=0), samples=2)
+    assert (governor.files_opened, governor.bytes_read) == (1, 32 * CHUNK)
@@ -0,0 +1,48 @@
+import os
+
+import tree_walk
+from path_classifier import PathClassifier
+from tree_walk import exclusion_set, list_directory
+
+
+def test_subdirectories_inherit_their_parent_classification(tmp_path):
+    sensitive = tmp_path / 'system' / 'protected'
+    classifier = PathClassifier([str(sensitive)], {'dropbox': ['dropbox']})
+
+    root = classifier.classify_directory(str(tmp_path))
+    assert root.contains_sensitive and not root.sensitive
+    system = classifier.classify_directory(str(tmp_path / 'system'), root)
+    assert system.contains_sensitive and not system.sensitive
+    protected = classifier.classify_directory(str(sensitive), system)
+    assert protected.sensitive
+    assert classifier.classify_directory(str(sensitive / 'child'), protected).sensitive
+
+    cloud = classifier.classify_directory(str(tmp_path / 'Dropbox'), root)
+    assert cloud.cloud_provider == 'dropbox' and not cloud.contains_sensitive
+    nested = classifier.classify_directory(str(tmp_path / 'Dropbox' / 'photos'), cloud)
+    assert nested.cloud_provider == 'dropbox' and not nested.sensitive
+
+
+def test_sibling_of_a_sensitive_directory_is_not_sensitive(tmp_path):
+    classifier = PathClassifier([str(tmp_path / 'Windows')], {})
+    root = classifier.classify_directory(str(tmp_path))
+    assert classifier.classify_directory(str(tmp_path / 'Windows'), root).sensitive
+    assert not classifier.classify_directory(str(tmp_path / 'Windows.old'), root).sensitive
+
+
+def test_listing_prunes_sensitive_subdirectories(tmp_path, monkeypatch):
+    (tmp_path / 'keep').mkdir()
+    (tmp_path / 'protected').mkdir()
+    monkeypatch.setattr(tree_walk, 'classifier', PathClassifier([str(tmp_path / 'protected')], {}))
+    directories, _, pruned = list_directory(str(tmp_path))
+    assert [os.path.basename(path) for path, _, _ in directories] == ['keep']
+    assert pruned
+
+
+def test_listing_prunes_excluded_subdirectories(tmp_path):
+    for name in ('keep', 'node_modules', 'build'):
+        (tmp_path / name).mkdir()
+    excluded = exclusion_set([' node_modules ', str(tmp_path / 'build') + os.sep, ''])
+    directories, _, pruned = list_directory(str(tmp_path), excluded=excluded)
+    assert [os.path.basename(path) for path, _, _ in directories] == ['keep']
+    assert pruned
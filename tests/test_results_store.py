@@ -0,0 +1,56 @@
+import os
+
+import config
+from results_store import ResultsReader, ResultsWriter, list_results, new_results_path, remove_results
+from scanner import SelectionStrategy, sort_group_by_strategy
+
+
+def test_results_are_listed_only_once_complete():
+    file_path = new_results_path()
+    writer = ResultsWriter(file_path)
+    writer.add_group(10, 'digest', ['/a/x', '/b/x'])
+    assert file_path not in list_results()
+
+    writer.close()
+    assert list_results()[0] == file_path
+    assert ResultsReader(file_path).num_groups == 1
+    remove_results(file_path)
+    assert not os.path.exists(file_path)
+
+
+def test_reopened_results_sort_around_deleted_files(tmp_path):
+    paths = [str(tmp_path / name) for name in ('a', 'b', 'c')]
+    for path in paths:
+        with open(path, 'w') as f:
+            f.write('same')
+    file_path = new_results_path()
+    with ResultsWriter(file_path) as writer:
+        writer.add_group(4, 'digest', paths)
+    os.remove(paths[0])
+
+    group = next(ResultsReader(file_path).iter_groups())
+    for strategy in (SelectionStrategy.NEWEST, SelectionStrategy.OLDEST):
+        ordered = sort_group_by_strategy(group.paths, strategy)
+        assert sorted(ordered) == sorted(paths)
+        assert ordered[-1] == paths[0]
+    remove_results(file_path)
+
+
+def test_pages_span_row_groups(monkeypatch):
+    file_path = new_results_path()
+    with ResultsWriter(file_path, row_group_size=3) as writer:
+        for index in range(10):
+            writer.add_group(100 + index, f"digest{index}", [f"/a/{index}", f"/b/{index}", f"/c/{index}"])
+    reader = ResultsReader(file_path)
+    monkeypatch.setattr(config, 'RESULTS_PAGE_SIZE', 4)
+    assert reader.num_pages == 3
+
+    pages = [reader.read_page(page, page_size=4) for page in range(reader.num_pages)]
+    assert [[group.group_id for group in page] for page in pages] == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+    assert reader.read_page(3, page_size=4) == []
+    group = pages[1][1]
+    assert (group.size, group.paths) == (105, ['/a/5', '/b/5', '/c/5'])
+    assert reader.files([group.file_ids[2], pages[2][1].file_ids[0]]) == {
+        group.file_ids[2]: ('/c/5', 105), pages[2][1].file_ids[0]: ('/a/9', 109)
+    }
+    remove_results(file_path)
@@ -0,0 +1,31 @@
+import pytest
+
+import scan_estimator
+from scan_estimator import estimate_scan
+
+
+def test_uniform_tree_is_estimated_exactly(tmp_path):
+    # 1 + 3 + 6 folders of 4 files each; every file has the same size
+    folders = [tmp_path] + [tmp_path / f"d{i}" for i in range(3)]
+    folders += [tmp_path / f"d{i}" / f"e{j}" for i in range(3) for j in range(2)]
+    for folder in folders:
+        folder.mkdir(exist_ok=True)
+        for index in range(4):
+            (folder / f"f{index}.bin").write_bytes(b'x' * 100)
+        (folder / 'empty.txt').write_bytes(b'')
+    (tmp_path / 'skipped').mkdir()
+    (tmp_path / 'skipped' / 'big.bin').write_bytes(b'y' * 1000)
+
+    estimate = estimate_scan(str(tmp_path), stats_per_directory=10, seed=0, exclude_dirs=['skipped'])
+    assert estimate.directories == pytest.approx(10)
+    assert estimate.directories_sampled == 10
+    assert estimate.files == pytest.approx(40)
+    assert estimate.total_bytes == pytest.approx(4000)
+    assert estimate.candidate_files == pytest.approx(40)
+    assert estimate.candidate_bytes == pytest.approx(4000)
+
+
+def test_sensitive_root_is_refused(tmp_path, monkeypatch):
+    monkeypatch.setattr(scan_estimator.classifier, 'is_sensitive', lambda path: True)
+    with pytest.raises(OSError):
+        estimate_scan(str(tmp_path))
@@ -0,0 +1,50 @@
+import os
+import threading
+
+import pytest
+
+import config
+import scan_service
+from scan_service import ScanServiceClient
+
+
+@pytest.fixture
+def no_service():
+    for path in (config.SCAN_SERVICE_FILE, config.SCAN_SERVICE_LOCK_FILE):
+        if os.path.exists(path):
+            os.remove(path)
+    yield
+    if os.path.exists(config.SCAN_SERVICE_FILE):
+        os.remove(config.SCAN_SERVICE_FILE)
+
+
+def test_clients_starting_at_once_spawn_one_service(no_service, monkeypatch):
+    spawned = []
+
+    def spawn():
+        spawned.append(True)
+        threading.Thread(target=scan_service.serve, daemon=True).start()
+
+    monkeypatch.setattr(ScanServiceClient, '_spawn', staticmethod(spawn))
+    # Separate clients stand in for separate app processes
+    clients = [ScanServiceClient() for _ in range(4)]
+    infos = []
+    threads = [threading.Thread(target=lambda client=client: infos.append(client._connect())) for client in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(spawned) == 1
+    assert len(infos) == 4 and all(info == infos[0] for info in infos)
+    assert not os.path.exists(config.SCAN_SERVICE_LOCK_FILE)
+
+
+def test_stale_spawn_lock_is_broken(no_service, monkeypatch):
+    with open(config.SCAN_SERVICE_LOCK_FILE, 'w') as f:
+        f.write('0')
+    stale = os.path.getmtime(config.SCAN_SERVICE_LOCK_FILE) - 3 * config.SCAN_SERVICE_START_TIMEOUT
+    os.utime(config.SCAN_SERVICE_LOCK_FILE, (stale, stale))
+    with scan_service._spawn_lock():
+        assert os.path.exists(config.SCAN_SERVICE_LOCK_FILE)
+    assert not os.path.exists(config.SCAN_SERVICE_LOCK_FILE)
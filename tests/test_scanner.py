@@ -0,0 +1,56 @@
+import os
+
+from checkpoint import ScanCheckpoint
+from scanner import ScanJob, ScanSettings
+
+
+def _run(job):
+    job.start()
+    job._thread.join()
+    return job
+
+
+def test_failed_resume_leaves_no_results_file(tmp_path):
+    ScanCheckpoint().remove()
+    job = _run(ScanJob(ScanSettings(str(tmp_path)), resume=True))
+    assert job.done
+    assert job.error
+    assert job.results_path is None
+
+
+def test_scan_without_duplicates_leaves_no_results_file(tmp_path):
+    (tmp_path / 'a.txt').write_text('a')
+    (tmp_path / 'b.txt').write_text('b')
+    job = ScanJob(ScanSettings(str(tmp_path), checkpoint_interval=0))
+    results_path = job.results_path
+    _run(job)
+    assert job.error is None
+    assert job.results_path is None
+    assert not os.path.exists(results_path)
+
+
+def test_files_deleted_before_their_group_is_emitted_are_dropped(tmp_path):
+    for name in ('a1', 'a2', 'a3'):
+        (tmp_path / name).write_text('triple')
+    for name in ('b1', 'b2'):
+        (tmp_path / name).write_text('pair')
+    job = ScanJob(ScanSettings(str(tmp_path), checkpoint_interval=0))
+    emit = job._emit_group
+
+    def delete_one_then_emit(results_writer, size, file_hash, group, *args, **kwargs):
+        os.remove(job._walk.path_store.path(group[0]))
+        emit(results_writer, size, file_hash, group, *args, **kwargs)
+
+    job._emit_group = delete_one_then_emit
+    _run(job)
+    assert job.error is None
+    assert [(group.size, group.count) for group in job.live_groups()] == [(6, 2)]
+
+
+def test_excluded_directories_are_not_scanned(tmp_path):
+    for directory in ('a', 'b', 'cache'):
+        (tmp_path / directory).mkdir()
+        (tmp_path / directory / 'same.txt').write_text('same content')
+    job = _run(ScanJob(ScanSettings(str(tmp_path), checkpoint_interval=0, exclude_dirs=('cache',))))
+    assert [group.count for group in job.live_groups()] == [2]
+    assert 'cache' not in job.live_groups()[0].first_path
@@ -0,0 +1,72 @@
+import os
+import random
+from collections import defaultdict
+
+import config
+from size_grouping import SizeGrouper
+
+
+def _records(count=500, seed=1):
+    rng = random.Random(seed)
+    return [(rng.choice([10, 20, 30, 4000, 50000]) + rng.randrange(3), file_id) for file_id in range(count)]
+
+
+def _expected(records, min_count):
+    groups = defaultdict(list)
+    for size, file_id in records:
+        groups[size].append(file_id)
+    return {size: sorted(ids) for size, ids in groups.items() if len(ids) >= min_count}
+
+
+def test_spilled_groups_merge_to_the_in_memory_result(tmp_path):
+    records = _records()
+    with SizeGrouper(memory_budget=1000, spill_dir=str(tmp_path)) as grouper:
+        for size, file_id in records:
+            grouper.add(size, file_id)
+        assert grouper.spilled
+        assert grouper.total_files == len(records)
+
+        candidates = list(grouper.iter_candidates())
+        assert [size for size, _ in candidates] == sorted(size for size, _ in candidates)
+        assert {size: sorted(ids) for size, ids in candidates} == _expected(records, 2)
+        assert {size: sorted(ids) for size, ids in grouper.iter_all()} == _expected(records, 1)
+    assert os.listdir(tmp_path) == []
+
+
+def test_reclaimable_order_and_totals_survive_spilling(tmp_path):
+    records = _records()
+    expected = _expected(records, 2)
+    with SizeGrouper(memory_budget=1000, spill_dir=str(tmp_path)) as grouper:
+        for size, file_id in records:
+            grouper.add(size, file_id)
+        candidates = list(grouper.iter_candidates(most_reclaimable_first=True))
+        reclaimable = [(len(ids) - 1) * size for size, ids in candidates]
+        assert reclaimable == sorted(reclaimable, reverse=True)
+        assert {size: sorted(ids) for size, ids in candidates} == expected
+        assert grouper.candidate_files == sum(len(ids) for ids in expected.values())
+        assert grouper.candidate_bytes == sum(size * len(ids) for size, ids in expected.items())
+
+
+def test_runs_are_folded_to_bound_the_merge(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'SPILL_MAX_MERGE_RUNS', 3)
+    records = _records()
+    with SizeGrouper(memory_budget=200, spill_dir=str(tmp_path)) as grouper:
+        for size, file_id in records:
+            grouper.add(size, file_id)
+            assert grouper.run_count < 3
+        assert {size: sorted(ids) for size, ids in grouper.iter_candidates()} == _expected(records, 2)
+
+
+def test_state_restores_spilled_groups(tmp_path):
+    records = _records()
+    grouper = SizeGrouper(memory_budget=1000, spill_dir=str(tmp_path))
+    for size, file_id in records[:300]:
+        grouper.add(size, file_id)
+    state = grouper.state()
+    grouper.close(keep_runs=True)
+
+    with SizeGrouper.from_state(state, memory_budget=1000, spill_dir=str(tmp_path)) as restored:
+        for size, file_id in records[300:]:
+            restored.add(size, file_id)
+        assert restored.total_files == len(records)
+        assert {size: sorted(ids) for size, ids in restored.iter_candidates()} == _expected(records, 2)
@@ -0,0 +1,308 @@
+import os
+import asyncio
+import logging
+import threading
+from concurrent.futures import Executor
+from typing import Any, Callable, Coroutine, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+import config
+from file_operations import FileId, FileOperations, FileOperationError
+from path_store import PathStore
+from size_grouping import SizeGrouper
+from path_classifier import PathClass, classifier
+from autotuner import ConcurrencyLimiter, ConcurrencyTuner
+from scan_pipeline import run_stages
+from log_setup import SkipSummary
+
+logger = logging.getLogger(__name__)
+
+
+def exclusion_set(exclude_dirs: Iterable[str]) -> FrozenSet[str]:
+    """Normalise directory names and full paths to exclude from a walk for list_directory()"""
+    excluded = set()
+    for entry in exclude_dirs:
+        entry = entry.strip()
+        if entry:
+            # Names never contain a separator and full paths always do, so both fit in one set
+            excluded.add(os.path.normcase(os.path.abspath(entry) if os.path.isabs(entry) else entry.strip('/\\')))
+    return frozenset(excluded)
+
+
+def list_directory(root: str, root_class: Optional[PathClass] = None, excluded: FrozenSet[str] = frozenset()
+                   ) -> Tuple[List[Tuple[str, str, PathClass]], List[os.DirEntry], bool]:
+    """
+    List a directory, returning the (path, name, classification) of subdirectories to
+    walk, the other entries, and whether any subdirectory was left out of the walk.
+    Subdirectories are classified from `root_class`, the directory's own classification,
+    which is worked out from its full path if not given. Subdirectories whose name or
+    full path is in `excluded`, built by exclusion_set(), are left out.
+    """
+    if root_class is None:
+        root_class = classifier.classify_directory(root)
+    directories, files, pruned = [], [], False
+    with os.scandir(root) as entries:
+        for entry in entries:
+            try:
+                # Like os.walk, symlinked directories are listed but not descended into.
+                # Sensitive subtrees are pruned, so every file walked is in a safe directory.
+                if entry.is_dir():
+                    if excluded and (os.path.normcase(entry.name) in excluded or
+                                     os.path.normcase(os.path.abspath(entry.path)) in excluded):
+                        pruned = True
+                        continue
+                    path_class = None if entry.is_symlink() else classifier.classify_directory(entry.path, root_class)
+                    if path_class is not None and not path_class.sensitive:
+                        directories.append((entry.path, entry.name, path_class))
+                    else:
+                        pruned = True
+                    continue
+            except OSError:
+                pass
+            files.append(entry)
+    return directories, files, pruned
+
+
+def _stat_files(files: List[os.DirEntry], skipped: SkipSummary) -> Tuple[List[Tuple[str, int, bool]], bool]:
+    """
+    Return the (name, size, resident) of each non-empty file among directory entries,
+    and whether the directory can be compared as a whole tree, noting those skipped
+    """
+    file_infos = []
+    complete = True
+    for entry in files:
+        # Symlinked files are hashed through their targets, so a folder of links
+        # would otherwise match the folder they point to
+        if entry.is_symlink():
+            complete = False
+        try:
+            file_info = FileOperations.get_file_info(entry.path)
+        except FileOperationError as e:
+            skipped.record(entry.path, e)
+            complete = False
+            continue
+        if file_info and file_info.size_bytes > 0:  # Skip empty files
+            file_infos.append((entry.name, file_info.size_bytes, file_info.resident))
+    return file_infos, complete
+
+
+class TreeWalk:
+    """
+    Walks a directory tree, registering every file in a path store and grouping it by size.
+
+    Directories are listed from a frontier in concurrent stages, so the walk can
+    stop between directories and be checkpointed and resumed from its state.
+    Cloud placeholders are grouped apart from resident files, so their content
+    is never downloaded.
+    """
+
+    def __init__(self, skipped: SkipSummary, cancel_event: threading.Event,
+                 set_status: Callable[[str], None], exclude_dirs: Iterable[str] = ()) -> None:
+        """
+        Create a walk; start() or restore() gives it a tree to walk.
+
+        Args:
+            skipped: Notes the files that could not be stat'ed
+            cancel_event: Set when the scan is cancelled
+            set_status: Publishes the directory being listed
+            exclude_dirs: Names or full paths of directories to leave out, with their subtrees
+        """
+        self._excluded = exclusion_set(exclude_dirs)
+        self._skipped = skipped
+        self._cancel_event = cancel_event
+        self._set_status = set_status
+        self.path_store: Optional[PathStore] = None
+        # (path, directory id, classification) of each directory left to list
+        self.frontier: List[Tuple[str, int, Optional[PathClass]]] = []
+        # Directories with entries the walk left out, which can't be compared as whole trees.
+        # None when resuming a checkpoint that didn't track them.
+        self.incomplete_dirs: Optional[Set[int]] = set()
+        self.files_by_size: Optional[SizeGrouper] = None
+        self.placeholders: Optional[SizeGrouper] = None
+
+        # Worker counts are tuned to the measured listing and stat throughput
+        self.files_listed = 0
+        self.dirs_listed = 0
+        self.walk_tuner = ConcurrencyTuner("walk", config.SCAN_WALK_WORKERS, config.SCAN_MAX_WALK_WORKERS,
+                                           lambda: self.dirs_listed)
+        self.stat_tuner = ConcurrencyTuner("stat", config.SCAN_STAT_WORKERS, config.SCAN_MAX_STAT_WORKERS,
+                                           lambda: self.files_listed)
+        self._walk_limit: Optional[ConcurrencyLimiter] = None
+        self._stat_limit: Optional[ConcurrencyLimiter] = None
+        self._executor: Optional[Executor] = None
+
+    def start(self, directory: str, spill_dir: str) -> None:
+        """Begin a walk of a directory, unless it is sensitive"""
+        self.path_store = PathStore()
+        root_class = classifier.classify_directory(directory)
+        self.frontier = [(directory, self.path_store.add_directory(directory), root_class)]
+        if root_class.sensitive:
+            logger.warning(f"Not scanning sensitive directory: {directory}")
+            self.frontier = []
+        self.files_by_size = SizeGrouper(spill_dir=spill_dir)
+        self.placeholders = SizeGrouper(spill_dir=spill_dir)
+
+    def restore(self, state: Dict[str, Any], spill_dir: str) -> None:
+        """Continue a walk from a checkpointed state"""
+        self.path_store = state['path_store']
+        # Checkpoints without classifications have their directories classified from the full path
+        self.frontier = [entry if len(entry) == 3 else (*entry, None) for entry in state['frontier']]
+        self.incomplete_dirs = state.get('incomplete_dirs')
+        self.files_by_size = SizeGrouper.from_state(state['size_groups'], spill_dir=spill_dir)
+        self.placeholders = (SizeGrouper.from_state(state['placeholder_groups'], spill_dir=spill_dir)
+                             if 'placeholder_groups' in state else SizeGrouper(spill_dir=spill_dir))
+
+    def state(self) -> Dict[str, Any]:
+        """Return the walk state to checkpoint"""
+        return {
+            'path_store': self.path_store,
+            'frontier': self.frontier,
+            'incomplete_dirs': self.incomplete_dirs,
+            'size_groups': self.files_by_size.state(),
+            'placeholder_groups': self.placeholders.state(),
+        }
+
+    @property
+    def total_files(self) -> int:
+        """Number of files grouped so far"""
+        return self.files_by_size.total_files + self.placeholders.total_files
+
+    @property
+    def _run_count(self) -> int:
+        """Number of size group runs spilled to disk"""
+        return self.files_by_size.run_count + self.placeholders.run_count
+
+    def close(self, keep_runs: bool = False) -> None:
+        """Release the size groups, keeping their spilled runs for a checkpoint if asked"""
+        self.files_by_size.close(keep_runs=keep_runs)
+        self.placeholders.close(keep_runs=keep_runs)
+
+    def _mark_incomplete(self, dir_id: int) -> None:
+        """Note that a directory has entries the walk left out"""
+        if self.incomplete_dirs is not None:
+            self.incomplete_dirs.add(dir_id)
+
+    async def run(self, executor: Executor, stages: List[Coroutine],
+                  on_resident: Optional[Callable[[int, FileId], None]] = None,
+                  checkpoint_due: Callable[[], bool] = lambda: False,
+                  save_checkpoint: Optional[Callable[[], None]] = None) -> None:
+        """
+        Walk, stat and bucket files in concurrent stages until the frontier is empty,
+        or the scan is cancelled.
+
+        Args:
+            executor: Runs the blocking listing and stat calls
+            stages: Further stages to run alongside the walk, such as early hashing
+            on_resident: Receives the size and id of each resident file grouped
+            checkpoint_due: Whether a checkpoint should be saved
+            save_checkpoint: Saves a checkpoint once every listed file is grouped; None if not checkpointing
+        """
+        self._executor = executor
+        entries: asyncio.Queue = asyncio.Queue(config.SCAN_QUEUE_SIZE)
+        stats: asyncio.Queue = asyncio.Queue(config.SCAN_QUEUE_SIZE)
+        self._walk_limit = self.walk_tuner.limiter()
+        self._stat_limit = self.stat_tuner.limiter()
+        # Workers are started up to the maximum and admitted by the tuned limits
+        walk_stages = [self._stat_stage(entries, stats) for _ in range(config.SCAN_MAX_STAT_WORKERS)]
+        walk_stages.append(self._bucket_stage(stats, on_resident))
+        await run_stages(self._walk_stage(entries, stats, checkpoint_due, save_checkpoint), walk_stages + stages)
+
+    async def _list_directory(self, root: str, root_class: Optional[PathClass]
+                              ) -> Tuple[List[Tuple[str, str, PathClass]], List[os.DirEntry], bool]:
+        """List a directory on a worker thread, admitted by the tuned walk limit"""
+        loop = asyncio.get_running_loop()
+        async with self._walk_limit:
+            listing = await loop.run_in_executor(self._executor, list_directory, root, root_class, self._excluded)
+        self.dirs_listed += 1
+        return listing
+
+    async def _walk_stage(self, entries: asyncio.Queue, stats: asyncio.Queue, checkpoint_due: Callable[[], bool],
+                          save_checkpoint: Optional[Callable[[], None]]) -> None:
+        """
+        List directories from the frontier concurrently, passing their files on to be stat'ed.
+
+        Listings of different subtrees overlap, so high-latency file systems
+        such as network shares are kept busy. Subdirectories are registered
+        and added to the frontier as each listing completes, always after
+        their parent. Cancellation and checkpoints stop new listings and wait
+        for those in flight, so the frontier always holds every unlisted
+        directory.
+        """
+        run_count = self._run_count
+        listings: Dict[asyncio.Task, Tuple[str, int]] = {}
+
+        try:
+            while self.frontier or listings:
+                # A spill may have replaced run files referenced by the last checkpoint
+                due = save_checkpoint is not None and (checkpoint_due() or self._run_count != run_count)
+                if due and not listings:
+                    # Only checkpoint once every listed file has reached its size group
+                    await entries.join()
+                    await stats.join()
+                    save_checkpoint()
+                    run_count = self._run_count
+                    due = False
+                if self._cancel_event.is_set() or due:
+                    if not listings:
+                        break
+                else:
+                    while self.frontier and len(listings) < config.SCAN_MAX_WALK_WORKERS:
+                        root, dir_id, root_class = self.frontier.pop()
+                        listings[asyncio.create_task(self._list_directory(root, root_class))] = (root, dir_id)
+
+                done, _ = await asyncio.wait(set(listings), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    root, dir_id = listings.pop(task)
+                    self._set_status(f"Scanning directory: {root}")
+                    try:
+                        directories, files, pruned = task.result()
+                    except OSError as e:
+                        logger.warning(f"Skipping directory due to error: {str(e)}")
+                        self._mark_incomplete(dir_id)
+                        continue
+
+                    if pruned:
+                        self._mark_incomplete(dir_id)
+                    for path, name, path_class in directories:
+                        self.frontier.append((path, self.path_store.add_directory(name, dir_id), path_class))
+                    if files:
+                        await entries.put((dir_id, files))
+        finally:
+            for task in listings:
+                task.cancel()
+
+        await entries.join()
+        await stats.join()
+
+    async def _stat_stage(self, entries: asyncio.Queue, stats: asyncio.Queue) -> None:
+        """Stat batches of directory entries"""
+        loop = asyncio.get_running_loop()
+        while True:
+            dir_id, files = await entries.get()
+            try:
+                async with self._stat_limit:
+                    file_infos, complete = await loop.run_in_executor(self._executor, _stat_files,
+                                                                      files, self._skipped)
+                self.files_listed += len(files)
+                if not complete:
+                    self._mark_incomplete(dir_id)
+                if file_infos:
+                    await stats.put((dir_id, file_infos))
+            finally:
+                entries.task_done()
+
+    async def _bucket_stage(self, stats: asyncio.Queue, on_resident: Optional[Callable[[int, FileId], None]]) -> None:
+        """Register stat'ed files and add them to their size group"""
+        while True:
+            dir_id, file_infos = await stats.get()
+            try:
+                for name, size, resident in file_infos:
+                    file_id = self.path_store.add_file(dir_id, name)
+                    if resident:
+                        self.files_by_size.add(size, file_id)
+                        if on_resident is not None:
+                            on_resident(size, file_id)
+                    else:
+                        # Placeholders are kept apart so their content is never downloaded
+                        self.placeholders.add(size, file_id)
+            finally:
+                stats.task_done()